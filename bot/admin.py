@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TelegramUser, DepositRequest, WithdrawalRequest
+from .models import TelegramUser, DepositRequest, WithdrawalRequest, DailyVolume
 
 # Register your models here.
 class TelegramUserAdmin(admin.ModelAdmin):
@@ -28,6 +28,25 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
 
 
+class DailyVolumeAdmin(admin.ModelAdmin):
+    # Read-only reporting dashboard over the incrementally maintained rollup
+    list_display = ('day', 'kind', 'currency', 'status', 'count',
+                   'amount', 'converted_amount', 'fee')
+    list_filter = ('kind', 'currency', 'status')
+    date_hierarchy = 'day'
+    ordering = ('-day', 'kind', 'currency', 'status')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(TelegramUser, TelegramUserAdmin)
 admin.site.register(DepositRequest, DepositRequestAdmin)
-admin.site.register(WithdrawalRequest)
\ No newline at end of file
+admin.site.register(WithdrawalRequest)
+admin.site.register(DailyVolume, DailyVolumeAdmin)
\ No newline at end of file
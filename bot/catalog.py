@@ -0,0 +1,126 @@
+from collections import namedtuple
+from threading import Lock, Thread
+from django.conf import settings
+from .validators import VALIDATORS
+import logging
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# A fiat currency users can deposit, and the bank its virtual accounts are opened at
+DepositOption = namedtuple('DepositOption', ['currency', 'min_amount', 'bank_code'])
+
+# A crypto currency users can withdraw, on the network used for it
+WithdrawalOption = namedtuple('WithdrawalOption', ['currency', 'min_amount', 'network_id', 'network', 'fee'])
+
+# User balances are held in this currency. The catalog has no exchange rates, so only
+# withdrawals in it can be checked against and taken off a balance
+BALANCE_CURRENCY = 'USDT'
+
+Snapshot = namedtuple('Snapshot', ['deposits', 'withdrawals', 'loaded_at'])
+
+# Served until the first successful refresh, and whenever Mobee never answered
+DEFAULT_SNAPSHOT = Snapshot(
+    deposits={'IDR': DepositOption('IDR', 50000, 'BNI')},
+    withdrawals={'USDT': WithdrawalOption('USDT', 2.5, 12, 'BEP20', 1.5)},
+    loaded_at=0.0,
+)
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def parse_currencies(payload):
+    """Build a Snapshot from Mobee's currency list. Raises on an unexpected payload."""
+    deposits = {}
+    withdrawals = {}
+    for currency in payload['data']:
+        code = currency['code'].upper()
+        if currency.get('type') == 'fiat':
+            banks = currency.get('banks') or []
+            if currency.get('deposit_enabled', True) and banks:
+                deposits[code] = DepositOption(code, _number(currency.get('min_deposit')) or 0, banks[0])
+            continue
+        if code != BALANCE_CURRENCY:
+            continue
+
+        # Pick the first enabled network we can validate addresses for
+        for network in currency.get('networks') or []:
+            name = network['name'].upper().replace('-', '')
+            if network.get('withdrawal_enabled', True) and name in VALIDATORS:
+                withdrawals[code] = WithdrawalOption(
+                    code,
+                    _number(network.get('min_withdrawal')) or 0,
+                    int(network['id']),
+                    name,
+                    _number(network.get('withdrawal_fee')) or 0,
+                )
+                break
+
+    if not deposits and not withdrawals:
+        raise ValueError("Mobee returned an empty currency catalog")
+    return Snapshot(deposits, withdrawals, time.time())
+
+
+class Catalog:
+    """In-memory currency, network and fee index refreshed from Mobee in the background.
+
+    Reads never wait on the network: a stale snapshot keeps being served while a
+    background thread refreshes it, and also when the refresh fails.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._snapshot = DEFAULT_SNAPSHOT
+        self._lock = Lock()
+        self._refreshing = False
+        self._next_attempt = 0.0
+
+    def snapshot(self):
+        now = time.time()
+        if now - self._snapshot.loaded_at > self.ttl and now >= self._next_attempt:
+            self.refresh_in_background()
+        return self._snapshot
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        Thread(target=self.refresh, name="mobee-catalog-refresh", daemon=True).start()
+
+    def refresh(self):
+        """Reload the catalog from Mobee, keeping the current snapshot on any error."""
+        from .mobee_utils import getCurrencies
+
+        try:
+            self._snapshot = parse_currencies(getCurrencies())
+            logger.info(
+                "Catalog refreshed: %s deposit and %s withdrawal currencies",
+                len(self._snapshot.deposits), len(self._snapshot.withdrawals),
+            )
+        except Exception as e:
+            # Stale on error, back off so a Mobee outage is not hammered
+            self._next_attempt = time.time() + min(self.ttl, 60)
+            logger.error("Error refreshing catalog, serving stale data: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def deposit_option(self, currency):
+        return self.snapshot().deposits.get(currency)
+
+    def withdrawal_option(self, currency):
+        return self.snapshot().withdrawals.get(currency)
+
+    def network_for_id(self, network_id):
+        """Address validator network name of a Mobee network id."""
+        for option in self.snapshot().withdrawals.values():
+            if option.network_id == network_id:
+                return option.network
+        return None
+
+
+catalog = Catalog(settings.MOBEE_CATALOG_TTL)
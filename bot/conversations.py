@@ -0,0 +1,166 @@
+from collections import OrderedDict, namedtuple, Counter
+from pathlib import Path
+from threading import Lock, Thread
+from django.conf import settings
+from . import metrics
+import logging
+import json
+import time
+import sys
+import os
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Steps of the multi-step flows: what the user's next text message answers
+DEPOSIT_AMOUNT = 'deposit_amount'
+WITHDRAWAL_AMOUNT = 'withdrawal_amount'
+WITHDRAWAL_ADDRESS = 'withdrawal_address'
+
+DEFAULT_TIMEOUT = 600  # seconds, for steps missing from CONVERSATION_TIMEOUTS
+
+Conversation = namedtuple('Conversation', ['state', 'data', 'expires_at', 'size'])
+
+# The namedtuple, its float and int, the key and the ordered dict's link to the entry
+ENTRY_OVERHEAD = sys.getsizeof(Conversation(None, None, 0.0, 0)) + sys.getsizeof(0.0) + 2 * sys.getsizeof(2 ** 40) + 56
+
+
+def estimate_size(data):
+    """Rough bytes one conversation holds; states are shared constants and not counted."""
+    size = ENTRY_OVERHEAD + sys.getsizeof(data)
+    for key, value in data.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+def stats_path(pid=None):
+    return Path(settings.BOT_RUNTIME_DIR) / f"conversations-{pid or os.getpid()}.json"
+
+
+class ConversationStore:
+    """The step each user is at in a multi-step flow, bounded in time and memory.
+
+    A conversation expires when its user leaves it idle for its step's timeout. When
+    the estimated size of all conversations passes the budget, the least recently
+    used ones are dropped; their users are asked to start over.
+    """
+
+    def __init__(self, timeouts, budget, sweep_interval):
+        self.timeouts = {state: float(seconds) for state, seconds in timeouts.items()}
+        self.budget = budget
+        self.sweep_interval = sweep_interval
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._sweeper = None
+
+    def timeout(self, state):
+        return self.timeouts.get(state, DEFAULT_TIMEOUT)
+
+    def enter(self, chat_id, state, **data):
+        """Move the chat to state with data, replacing the step it was at."""
+        conversation = Conversation(state, data, time.monotonic() + self.timeout(state), estimate_size(data))
+        with self._lock:
+            self._discard(chat_id)
+            self._entries[chat_id] = conversation
+            self.bytes += conversation.size
+            while self.bytes > self.budget and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                metrics.increment('conversations.evicted')
+        self._start_sweeper()
+        return conversation
+
+    def get(self, chat_id):
+        """The chat's conversation, or None if it has none or let it expire; resets its idle timer."""
+        with self._lock:
+            conversation = self._entries.get(chat_id)
+            if conversation is None:
+                return None
+            now = time.monotonic()
+            if conversation.expires_at <= now:
+                self._discard(chat_id)
+                metrics.increment('conversations.expired')
+                return None
+            conversation = conversation._replace(expires_at=now + self.timeout(conversation.state))
+            self._entries[chat_id] = conversation
+            self._entries.move_to_end(chat_id)
+            return conversation
+
+    def end(self, chat_id):
+        with self._lock:
+            self._discard(chat_id)
+
+    def _discard(self, chat_id):
+        conversation = self._entries.pop(chat_id, None)
+        if conversation is not None:
+            self.bytes -= conversation.size
+
+    def sweep(self):
+        """Drop every expired conversation; returns how many."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [chat_id for chat_id, conversation in self._entries.items() if conversation.expires_at <= now]
+            for chat_id in expired:
+                self._discard(chat_id)
+        if expired:
+            metrics.increment('conversations.expired', len(expired))
+        return len(expired)
+
+    def stats(self):
+        counters = metrics.snapshot('conversations.')
+        with self._lock:
+            by_state = Counter(conversation.state for conversation in self._entries.values())
+            return {
+                'conversations': len(self._entries),
+                'bytes': self.bytes,
+                'budget': self.budget,
+                'by_state': dict(sorted(by_state.items())),
+                'expired': counters.get('conversations.expired', 0),
+                'evicted': counters.get('conversations.evicted', 0),
+            }
+
+    def write_stats(self):
+        """Publish this worker's stats for `manage.py conversation_stats`."""
+        path = stats_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({**self.stats(), 'pid': os.getpid(), 'updated_at': time.time()}))
+        os.replace(temporary, path)
+
+    def _start_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = Thread(target=self._sweep_forever, name="conversation-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            try:
+                self.sweep()
+                self.write_stats()
+            except Exception as e:
+                logger.error("Error sweeping conversations: %s", e)
+            time.sleep(self.sweep_interval)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+conversations = ConversationStore(
+    settings.CONVERSATION_TIMEOUTS,
+    settings.CONVERSATION_MEMORY_BUDGET,
+    settings.CONVERSATION_SWEEP_INTERVAL,
+)
+
+
+def format_conversations():
+    stats = conversations.stats()
+    steps = ", ".join(f"{state.replace('_', ' ')}: {count}" for state, count in stats['by_state'].items())
+    return (
+        f"• {stats['conversations']} open{f' ({steps})' if steps else ''}\n"
+        f"• {stats['bytes'] / 1024:.1f} KiB of {stats['budget'] / 1024:.0f} KiB budget\n"
+        f"• {stats['expired']} expired, {stats['evicted']} evicted"
+    )
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial, wraps
+from threading import Lock
+from django.conf import settings
+from django.db import connections
+import asyncio
+
+# ORM work of the bot's handlers runs on these threads, each keeping its own connection.
+# sync_to_async's default thread_sensitive=True runs every call of the bot loop on one
+# shared thread, and Django's async ORM methods (aget, acreate, ...) are built on it
+executor = None
+
+executor_lock = Lock()
+
+
+def get_executor():
+    """Return the bot's DB thread pool, sized by BOT_DB_THREADS, starting it on first use."""
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=settings.BOT_DB_THREADS, thread_name_prefix="bot-db")
+    return executor
+
+
+def discard_broken_connections():
+    """Drop this thread's connections that failed and no longer answer, like Django does per request."""
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is not None and connection.errors_occurred:
+            if connection.is_usable():
+                connection.errors_occurred = False
+            else:
+                connection.close()
+
+
+def _run(func, args, kwargs):
+    discard_broken_connections()
+    return func(*args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    """Await blocking ORM code on the DB pool.
+
+    The caller's context variables go along, so read_replica() routing and the
+    current trace span apply inside func.
+    """
+    context = copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), partial(context.run, _run, func, args, kwargs)
+    )
+
+
+def db_sync_to_async(func):
+    """sync_to_async() for ORM code called from the bot's handlers, run on the DB pool."""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Alias reads go to inside read_replica(); None means the default database
+read_alias = ContextVar('read_alias', default=None)
+
+
+def _written_key(telegram_id):
+    return f"user:{telegram_id}:wrote"
+
+
+def remember_write(telegram_id):
+    """Keep the user's reads on the primary until the replica has caught up with this write."""
+    if not telegram_id or REPLICA_DB_ALIAS not in settings.DATABASES:
+        return
+    key = _written_key(telegram_id)
+    cache.set(key, 1, timeout=settings.REPLICA_STICKY_SECONDS)
+    # The window has to start when the write is visible, not when it was made
+    transaction.on_commit(lambda: cache.set(key, 1, timeout=settings.REPLICA_STICKY_SECONDS))
+
+
+def remember_writes(telegram_ids):
+    """remember_write() for bulk updates, which bypass model signals."""
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        return
+    keys = {_written_key(telegram_id): 1 for telegram_id in set(telegram_ids) if telegram_id}
+    if keys:
+        cache.set_many(keys, timeout=settings.REPLICA_STICKY_SECONDS)
+        transaction.on_commit(lambda: cache.set_many(keys, timeout=settings.REPLICA_STICKY_SECONDS))
+
+
+def reporting_database():
+    """Alias for reads that may lag a little, like reports and exports."""
+    return REPLICA_DB_ALIAS if REPLICA_DB_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def replica_for(telegram_id=None):
+    """The replica alias, or None when there is no replica or the user wrote within REPLICA_STICKY_SECONDS."""
+    if REPLICA_DB_ALIAS not in settings.DATABASES:
+        return None
+    if telegram_id and cache.get(_written_key(telegram_id)):
+        return None
+    return REPLICA_DB_ALIAS
+
+
+@contextmanager
+def reading_from(alias):
+    """Route the bot's reads in this block, and in sync_to_async or DB pool calls made from it, to alias."""
+    token = read_alias.set(alias)
+    try:
+        yield alias or DEFAULT_DB_ALIAS
+    finally:
+        read_alias.reset(token)
+
+
+def read_replica(telegram_id=None):
+    """Send the bot's reads in this block to the replica, unless the user just wrote.
+
+    Users always see their own new deposits, withdrawals and balance this way.
+    """
+    return reading_from(replica_for(telegram_id))
+
+
+class ReplicaRouter:
+    """Routes the bot's reads inside read_replica() to the replica; everything else uses default.
+
+    Writes, row locks and reads inside a transaction always stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or model._meta.app_label != 'bot':
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db and instance._state.db != alias:
+            # Follow relations of a row on the database it came from
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema together with its rows
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,106 @@
+try:
+    import orjson
+except ImportError:  # optional, the stdlib parser is used without it
+    orjson = None
+from telegram import Update
+import json
+import re
+
+# Telegram always serializes update_id as the first field of an update
+UPDATE_ID_PATTERN = re.compile(rb'\A\s*\{\s*"update_id"\s*:\s*(\d+)')
+
+# Update types whose chat lives under update[<type>]['chat']
+CHAT_UPDATE_TYPES = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'business_message', 'edited_business_message', 'my_chat_member',
+    'chat_member', 'chat_join_request', 'message_reaction',
+)
+
+# Update types that only carry the sending user under update[<type>]['from']
+USER_UPDATE_TYPES = (
+    'inline_query', 'chosen_inline_result', 'shipping_query',
+    'pre_checkout_query', 'poll_answer',
+)
+
+
+def chat_key(update_data):
+    """Return the routing key of a raw update: its chat id, else the user id, else the update id."""
+    for kind in CHAT_UPDATE_TYPES:
+        payload = update_data.get(kind)
+        if payload and 'chat' in payload:
+            return payload['chat']['id']
+
+    callback_query = update_data.get('callback_query')
+    if callback_query:
+        message = callback_query.get('message')
+        if message and 'chat' in message:
+            return message['chat']['id']
+        return callback_query['from']['id']
+
+    for kind in USER_UPDATE_TYPES:
+        payload = update_data.get(kind)
+        if payload:
+            sender = payload.get('from') or payload.get('user')
+            if sender:
+                return sender['id']
+
+    return update_data.get('update_id')
+
+
+def loads(raw):
+    """Decode JSON bytes with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def peek_update_id(raw):
+    """Read update_id straight from the raw bytes without decoding the body."""
+    match = UPDATE_ID_PATTERN.match(raw)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+class RawUpdate:
+    """A webhook body whose routing keys are read before the Update object graph is built."""
+
+    __slots__ = ('body', '_data', '_update_id')
+
+    def __init__(self, body):
+        self.body = body
+        self._data = None
+        self._update_id = peek_update_id(body)
+
+    @property
+    def data(self):
+        """The decoded JSON dict, parsed at most once. Raises json.JSONDecodeError."""
+        if self._data is None:
+            self._data = loads(self.body)
+            if not isinstance(self._data, dict):
+                raise json.JSONDecodeError("Update must be a JSON object", self.body.decode('utf-8', 'replace'), 0)
+        return self._data
+
+    @property
+    def update_id(self):
+        if self._update_id is None and self._data is None:
+            self._update_id = self.data.get('update_id')
+        return self._update_id
+
+    @property
+    def kind(self):
+        """The update type, e.g. 'message' or 'callback_query'."""
+        return next((key for key in self.data if key != 'update_id'), None)
+
+    @property
+    def chat_id(self):
+        return chat_key(self.data)
+
+    @property
+    def callback_data(self):
+        callback_query = self.data.get('callback_query')
+        return callback_query.get('data') if callback_query else None
+
+    def to_update(self, bot):
+        """Build the full telegram.Update, only for updates that are actually processed."""
+        return Update.de_json(self.data, bot)
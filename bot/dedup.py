@@ -0,0 +1,97 @@
+from collections import deque
+from threading import Lock
+from django.conf import settings
+from django.core.cache import cache
+import hashlib
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class RecentIds:
+    """Fixed-size ring buffer of recently seen ids with O(1) membership checks."""
+
+    def __init__(self, size):
+        self.size = size
+        self._ring = deque(maxlen=size)
+        self._seen = set()
+        self._lock = Lock()
+
+    def add(self, value):
+        """Record a value. Returns False if it was already in the buffer."""
+        with self._lock:
+            if value in self._seen:
+                return False
+            if len(self._ring) == self.size:
+                # The oldest id falls out of the ring, drop it from the set too
+                self._seen.discard(self._ring[0])
+            self._ring.append(value)
+            self._seen.add(value)
+            return True
+
+    def discard(self, value):
+        """Forget a value so that a later redelivery is processed again."""
+        with self._lock:
+            if value in self._seen:
+                self._seen.discard(value)
+                self._ring.remove(value)
+
+    def __contains__(self, value):
+        return value in self._seen
+
+    def __len__(self):
+        return len(self._ring)
+
+
+# Per-process fast path, the shared cache catches redeliveries hitting other workers
+recent_updates = RecentIds(settings.TELEGRAM_UPDATE_DEDUP_SIZE)
+recent_actions = RecentIds(settings.TELEGRAM_UPDATE_DEDUP_SIZE)
+
+
+def _update_key(update_id):
+    return f"tg:update:{update_id}"
+
+
+def _action_key(token):
+    return f"tg:action:{token}"
+
+
+def is_duplicate_update(update_id):
+    """Return True if this update_id was already accepted by any worker."""
+    if update_id is None:
+        return False
+    if not recent_updates.add(update_id):
+        return True
+    # cache.add is atomic and only succeeds for the first worker to claim the key
+    if not cache.add(_update_key(update_id), 1, timeout=settings.TELEGRAM_UPDATE_DEDUP_TTL):
+        return True
+    return False
+
+
+def forget_update(update_id):
+    """Release an update_id after a failed attempt so Telegram's retry goes through."""
+    if update_id is None:
+        return
+    recent_updates.discard(update_id)
+    cache.delete(_update_key(update_id))
+
+
+def claim_action_token(token):
+    """Claim a one-time action token. Returns False if another request already holds it."""
+    if not recent_actions.add(token):
+        return False
+    if not cache.add(_action_key(token), 1, timeout=settings.TELEGRAM_UPDATE_DEDUP_TTL):
+        return False
+    return True
+
+
+def release_action_token(token):
+    """Release a claimed action token so the user can retry after a failure."""
+    recent_actions.discard(token)
+    cache.delete(_action_key(token))
+
+
+def mobee_idempotency_key(action, token):
+    """Derive a stable Mobee idempotency key from a one-time action token."""
+    return hashlib.sha256(f"{action}:{token}".encode('utf-8')).hexdigest()
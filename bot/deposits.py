@@ -0,0 +1,67 @@
+from django.conf import settings
+from .models import TelegramUser, ActionToken, DepositRequest
+from .mobee_utils import acreateFiatDeposit
+from .dedup import mobee_idempotency_key
+from .user_cache import get_or_load, store
+from .db_router import read_replica
+from asgiref.sync import sync_to_async
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def deposit_link(telegram_id, amount, bank_code, token):
+    """Link that creates the deposit from the browser, the fallback when the background attempt fails."""
+    return f"{settings.YOUR_DOMAIN}/create-deposit/{telegram_id}/{amount}/{bank_code}/{token}/"
+
+
+def payment_details_text(deposit):
+    return (
+        f"✅ *Payment Details:*\n\n"
+        f"• Amount: {float(deposit.amount)}\n"
+        f"• Bank: {deposit.bank_code}\n"
+        f"• Account Name: `{deposit.account_name}`\n"  # Make account name copiable
+        f"• Account Number: `{deposit.account_number}`\n"  # Make account number copiable
+        f"• Expiry: {deposit.expired_at}\n\n"
+        "Please make the payment before the expiry time."
+    )
+
+
+def record_deposit(user, order, token):
+    """Record a created Mobee deposit, use up its token and cache its payment details."""
+    deposit = DepositRequest.objects.create(user=user, status="pending", **order.model_kwargs())
+
+    # mark token as used; the deposit's signals already kept the user's reads on the primary
+    ActionToken.objects.filter(token=token).update(is_used=True)
+
+    # Stored after the create above invalidated the user's cached details
+    text = payment_details_text(deposit)
+    store('payment', user.pk, text)
+    return deposit, text
+
+
+async def acreate_deposit(telegram_id, amount, bank_code, token, to_async=sync_to_async):
+    """Create the Mobee deposit for a deposit action token, record it and cache its payment details.
+
+    No thread or row lock is held while Mobee answers. The idempotency key derived
+    from the token makes a retry return the same Mobee order. to_async runs the ORM
+    work: the bot's handlers pass db_sync_to_async, so it goes to the DB pool rather
+    than the one thread sync_to_async shares outside a request.
+    """
+    user = await to_async(TelegramUser.objects.get)(telegram_id=telegram_id)
+    order = await acreateFiatDeposit(
+        amount=amount,
+        bank_code=bank_code,
+        idempotency_key=mobee_idempotency_key('deposit', token)
+    )
+    return await to_async(record_deposit)(user, order, token)
+
+
+def get_payment_details(user_id, telegram_id=None):
+    """Payment details of the user's latest deposit; raises DepositRequest.DoesNotExist without one."""
+    def load():
+        return payment_details_text(DepositRequest.objects.filter(user_id=user_id).latest('created_at'))
+
+    with read_replica(telegram_id):
+        return get_or_load('payment', user_id, load)
@@ -0,0 +1,181 @@
+from collections import namedtuple
+from datetime import timedelta
+from threading import Thread
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, Forbidden, BadRequest
+from .models import DepositRequest
+from .rollups import record_bulk_status_change
+from .user_cache import invalidate_users
+from .db_router import remember_writes
+from .tracing import TracedHTTPXRequest
+import asyncio
+import logging
+import queue
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Fields record_bulk_status_change needs to move a deposit between rollup buckets
+ROLLUP_FIELDS = ('created_at', 'status', 'amount', 'converted_amount')
+
+# One swept chunk: rows marked failed, and {telegram_id: [amount, ...]} of the users to tell
+ExpiredChunk = namedtuple('ExpiredChunk', ['expired', 'notices'])
+
+
+def expired_deposits(cutoff):
+    """Pending deposits whose virtual account expired before cutoff, oldest first.
+
+    Served by the (status, expired_at) index: an equality on status, then a range scan
+    that is already in expired_at order.
+    """
+    return DepositRequest.objects.filter(status='pending', expired_at__lt=cutoff).order_by('expired_at')
+
+
+def expire_chunk(cutoff, chunk_size, notify_since=None):
+    """Mark up to chunk_size expired deposits failed with one UPDATE, in one transaction.
+
+    Returns None once no expired deposits are left.
+    """
+    with transaction.atomic():
+        rows = list(
+            expired_deposits(cutoff)
+            # Lets two sweepers on a database with row locks work on different rows
+            .select_for_update(skip_locked=True, of=('self',))
+            .values('id', 'user_id', 'user__telegram_id', 'expired_at', *ROLLUP_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            return None
+
+        stamp = timezone.now()
+        DepositRequest.objects.filter(
+            pk__in=[row['id'] for row in rows], status='pending',
+        ).update(status='failed', updated_at=stamp)
+        # SQLite has no row locks, so a deposit can complete between the SELECT and the
+        # UPDATE. Only the rows this UPDATE stamped expired; the rest are left alone.
+        changed = set(
+            DepositRequest.objects.filter(
+                pk__in=[row['id'] for row in rows], status='failed', updated_at=stamp,
+            ).values_list('id', flat=True)
+        )
+        rows = [row for row in rows if row['id'] in changed]
+
+        # The UPDATE skips model signals, so do what they would have done
+        record_bulk_status_change(
+            DepositRequest, [{field: row[field] for field in ROLLUP_FIELDS} for row in rows], 'failed'
+        )
+        invalidate_users([row['user_id'] for row in rows], kinds=('history', 'payment'))
+        remember_writes([row['user__telegram_id'] for row in rows])
+
+    notices = {}
+    for row in rows:
+        # Deposits that expired long ago are cleaned up without messaging anyone
+        if row['user__telegram_id'] and (notify_since is None or row['expired_at'] >= notify_since):
+            notices.setdefault(row['user__telegram_id'], []).append(row['amount'])
+    return ExpiredChunk(len(rows), notices)
+
+
+def sweep_expired_deposits(chunk_size=1000, time_budget=None, notify_within=None, now=None):
+    """Expire pending deposits chunk by chunk until none are left or time_budget seconds pass.
+
+    Yields an ExpiredChunk per chunk that expired anything, so callers can notify users
+    while the sweep goes on. Rows left when the budget runs out are picked up by the next run.
+    """
+    cutoff = now or timezone.now()
+    notify_since = cutoff - notify_within if notify_within is not None else None
+    deadline = time.monotonic() + time_budget if time_budget else None
+    while deadline is None or time.monotonic() < deadline:
+        chunk = expire_chunk(cutoff, chunk_size, notify_since)
+        if chunk is None:
+            return
+        # A chunk lost entirely to deposits completing meanwhile still leaves others to sweep
+        if chunk.expired:
+            yield chunk
+
+
+def expiry_text(amounts):
+    if len(amounts) == 1:
+        return (
+            f"⌛ Your deposit account for {amounts[0]:,.0f} IDR has expired before the payment arrived.\n\n"
+            "Start a new deposit whenever you're ready."
+        )
+    return (
+        f"⌛ {len(amounts)} of your deposit accounts have expired before the payment arrived.\n\n"
+        "Start a new deposit whenever you're ready."
+    )
+
+
+class ExpiryNotifier:
+    """Sends expiry notices from a background thread in paced batches.
+
+    Telegram allows about 30 messages per second to different chats, so notices go out
+    batch_size at a time, at most one batch per batch_interval seconds.
+    """
+
+    def __init__(self, batch_size=25, batch_interval=1.0):
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = Thread(target=lambda: asyncio.run(self._run()), name="expiry-notifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, notices):
+        for telegram_id, amounts in notices.items():
+            self._queue.put((telegram_id, amounts))
+
+    def close(self):
+        """Wait until every submitted notice was sent or given up on."""
+        self._queue.put(None)
+        self._thread.join()
+
+    async def _run(self):
+        bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, base_url=settings.TELEGRAM_API_BASE_URL, request=TracedHTTPXRequest())
+        async with bot:
+            finished = False
+            while not finished:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = await asyncio.to_thread(self._queue.get)
+                    if item is None:
+                        finished = True
+                        break
+                    batch.append(item)
+                    if self._queue.empty():
+                        break
+
+                started = time.monotonic()
+                results = await asyncio.gather(*(self._send(bot, *item) for item in batch))
+                self.sent += sum(results)
+                self.failed += len(results) - sum(results)
+                if not finished:
+                    await asyncio.sleep(max(0.0, self.batch_interval - (time.monotonic() - started)))
+
+    async def _send(self, bot, telegram_id, amounts):
+        for attempt in range(2):
+            try:
+                await bot.send_message(
+                    chat_id=telegram_id,
+                    text=expiry_text(amounts),
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton("Deposit", callback_data="deposit"),
+                        InlineKeyboardButton("Main menu", callback_data="main_menu")],
+                    ])
+                )
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                logger.warning("Telegram asked to slow down, waiting %ss", retry_after)
+                await asyncio.sleep(retry_after)
+            except (Forbidden, BadRequest) as e:
+                # Blocked the bot or deleted the chat, nothing to retry
+                logger.info("Could not notify %s of expired deposits: %s", telegram_id, e)
+                return False
+            except Exception as e:
+                logger.error("Error notifying %s of expired deposits: %s", telegram_id, e)
+                return False
+        return False
@@ -0,0 +1,141 @@
+from datetime import datetime, date
+from decimal import Decimal
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from .models import DepositRequest, WithdrawalRequest
+import zlib
+import json
+import csv
+
+# Exported columns of each kind; user is exported as the Telegram id
+EXPORT_FIELDS = {
+    'deposits': (
+        DepositRequest,
+        ['id', 'user__telegram_id', 'deposit_id', 'transaction_id', 'amount', 'conversion_rate',
+         'converted_amount', 'status', 'bank_code', 'account_number', 'expired_at', 'created_at'],
+    ),
+    'withdrawals': (
+        WithdrawalRequest,
+        ['id', 'user__telegram_id', 'transaction_id', 'currency', 'amount', 'fee', 'address',
+         'network_name', 'status', 'explorer_url', 'created_at'],
+    ),
+}
+
+EXPORT_CHUNK_SIZE = 5000
+
+
+def _parse_bound(value, end=False):
+    """Accept a date (whole day) or an ISO datetime as a filter bound."""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        value = value.isoformat()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, datetime.max.time() if end else datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(kind, since=None, until=None, status=None, telegram_id=None, chunk_size=EXPORT_CHUNK_SIZE, using=None):
+    """Yield the header and then one tuple per row, streamed from the DB (or the `using` alias) in chunks."""
+    try:
+        model, fields = EXPORT_FIELDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown export kind: {kind}")
+
+    queryset = model.objects.using(using) if using else model.objects.all()
+    since, until = _parse_bound(since), _parse_bound(until, end=True)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    if until:
+        queryset = queryset.filter(created_at__lte=until)
+    if status:
+        queryset = queryset.filter(status__iexact=status)
+    if telegram_id:
+        queryset = queryset.filter(user__telegram_id=telegram_id)
+
+    yield tuple(field.replace('user__', '') for field in fields)
+    # values_list + iterator: no model instances and no result cache, memory stays flat
+    yield from queryset.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+
+def encode_rows(rows, fmt):
+    """Encode rows from export_rows() as CSV or JSON Lines text chunks."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        for row in rows:
+            yield writer.writerow(row)
+    elif fmt == 'jsonl':
+        header = next(rows)
+        for row in rows:
+            yield json.dumps(dict(zip(header, row)), default=_json_default, separators=(',', ':')) + '\n'
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def gzip_chunks(chunks, buffer_size=256 * 1024):
+    """Gzip a stream of text chunks, emitting compressed bytes about every buffer_size bytes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= buffer_size:
+            compressed = compressor.compress(b''.join(pending))
+            pending, pending_size = [], 0
+            if compressed:
+                yield compressed
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
+
+
+def batch_chunks(chunks, buffer_size=256 * 1024):
+    """Group many small text chunks into fewer, larger byte chunks."""
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= buffer_size:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+async def aiter_chunks(chunks):
+    """Stream a sync chunk iterator to an ASGI server one chunk at a time.
+
+    Given a sync iterator, Django's ASGI handler reads it whole into a list before
+    sending anything. Every next() runs on the request's thread, which holds the
+    export query's cursor.
+    """
+    iterator = iter(chunks)
+    while True:
+        chunk = await sync_to_async(next, thread_sensitive=True)(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
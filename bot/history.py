@@ -0,0 +1,161 @@
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from telegram import InputFile
+from telegram.error import BadRequest
+from .models import DepositRequest, WithdrawalRequest
+from .user_cache import get_or_load
+from .db_router import read_replica, replica_for, reading_from
+from .db import db_sync_to_async
+import tempfile
+import logging
+import csv
+import io
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RECENT_HISTORY_LIMIT = 5
+
+HISTORY_FIELDS = ['type', 'date', 'amount', 'currency', 'status', 'converted_amount', 'fee', 'reference', 'destination']
+
+HISTORY_CHUNK_SIZE = 2000
+
+# Telegram keeps uploaded files, the cached file_id is only replaced when the ledger changes
+HISTORY_DOCUMENT_TTL = 30 * 24 * 3600
+
+HISTORY_BUILD_TIMEOUT = 300
+
+
+def render_recent_history(user_id):
+    """Markdown text of the history screen: the last few deposits and withdrawals."""
+    last_deposits = DepositRequest.objects.filter(user_id=user_id).order_by('-created_at')[:RECENT_HISTORY_LIMIT]
+    last_withdrawals = WithdrawalRequest.objects.filter(user_id=user_id).order_by('-created_at')[:RECENT_HISTORY_LIMIT]
+
+    # Format the deposit history
+    deposit_history = "\n".join([
+        f"• Amount: {deposit.amount}, Status: {deposit.status}, Date: {deposit.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+        for deposit in last_deposits
+    ]) or "No deposit history available."
+
+    # Format the withdrawal history
+    withdrawal_history = "\n".join([
+        f"• Amount: {withdrawal.amount}, Status: {withdrawal.status}, Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+        for withdrawal in last_withdrawals
+    ]) or "No withdrawal history available."
+
+    return (
+        f"📜 *Transaction History*\n\n"
+        f"📥 *Last {RECENT_HISTORY_LIMIT} Deposits:*\n{deposit_history}\n\n"
+        f"📤 *Last {RECENT_HISTORY_LIMIT} Withdrawals:*\n{withdrawal_history}"
+    )
+
+
+def get_recent_history(user_id, telegram_id=None):
+    """render_recent_history(), cached until one of the user's requests changes."""
+    with read_replica(telegram_id):
+        return get_or_load('history', user_id, lambda: render_recent_history(user_id))
+
+
+def _document_key(user_id):
+    return f"history:document:{user_id}"
+
+
+def ledger_fingerprint(user_id):
+    """Cheap summary of a user's requests that changes with every new or updated request."""
+    deposits = DepositRequest.objects.filter(user_id=user_id).aggregate(
+        count=Count('id'), last_id=Max('id'), last_update=Max('updated_at'),
+    )
+    # Withdrawals have no updated_at, their status only moves away from Pending
+    withdrawals = WithdrawalRequest.objects.filter(user_id=user_id).aggregate(
+        count=Count('id'), last_id=Max('id'), pending=Count('id', filter=Q(status='Pending')),
+    )
+    last_update = deposits['last_update'].isoformat() if deposits['last_update'] else ''
+    return (
+        f"d{deposits['count']}:{deposits['last_id']}:{last_update}"
+        f"|w{withdrawals['count']}:{withdrawals['last_id']}:{withdrawals['pending']}"
+    )
+
+
+def history_rows(user_id, chunk_size=HISTORY_CHUNK_SIZE):
+    """Yield the header and then every deposit and withdrawal of one user, oldest first."""
+    yield HISTORY_FIELDS
+    deposits = DepositRequest.objects.filter(user_id=user_id).order_by('created_at', 'pk').values_list(
+        'created_at', 'amount', 'status', 'converted_amount', 'transaction_id', 'bank_code',
+    )
+    for created_at, amount, status, converted_amount, reference, bank_code in deposits.iterator(chunk_size=chunk_size):
+        yield ['deposit', created_at, amount, 'IDR', status, converted_amount, '', reference, bank_code]
+
+    withdrawals = WithdrawalRequest.objects.filter(user_id=user_id).order_by('created_at', 'pk').values_list(
+        'created_at', 'amount', 'currency', 'status', 'fee', 'transaction_id', 'address',
+    )
+    for created_at, amount, currency, status, fee, reference, address in withdrawals.iterator(chunk_size=chunk_size):
+        yield ['withdrawal', created_at, amount, currency, status, '', fee, reference, address]
+
+
+def write_history_csv(user_id):
+    """Write the full history to an unnamed temporary file and return it rewound.
+
+    Rows go straight from the DB cursor to disk, so memory does not depend on
+    how many transactions the user has.
+    """
+    destination = tempfile.TemporaryFile()
+    try:
+        text = io.TextIOWrapper(destination, encoding='utf-8', newline='')
+        csv.writer(text).writerows(history_rows(user_id))
+        text.flush()
+        text.detach()
+        destination.seek(0)
+        return destination
+    except Exception:
+        destination.close()
+        raise
+    finally:
+        # Runs outside the thread-sensitive executor, don't leave its connections behind
+        connections.close_all()
+
+
+async def send_history_document(bot, chat_id, telegram_user):
+    """Send the user's full history as a CSV document, reusing the last upload when nothing changed."""
+    key = _document_key(telegram_user.pk)
+    building_key = f"history:building:{telegram_user.pk}"
+    if not await db_sync_to_async(cache.add)(building_key, 1, timeout=HISTORY_BUILD_TIMEOUT):
+        await bot.send_message(chat_id, "⏳ Your history file is already being prepared.")
+        return
+
+    try:
+        # Both the fingerprint and the file are read from the same database
+        alias = await db_sync_to_async(replica_for)(telegram_user.telegram_id)
+        with reading_from(alias):
+            fingerprint = await db_sync_to_async(ledger_fingerprint)(telegram_user.pk)
+        caption = f"📜 Full transaction history ({timezone.localdate()})"
+
+        cached = await db_sync_to_async(cache.get)(key)
+        if cached and cached['fingerprint'] == fingerprint:
+            try:
+                await bot.send_document(chat_id, document=cached['file_id'], caption=caption)
+                return
+            except BadRequest as e:
+                logger.warning("Cached history document for user %s was rejected: %s", telegram_user.pk, e)
+
+        # Large histories take a while, keep this off the thread the handlers share for the ORM
+        with reading_from(alias):
+            document = await sync_to_async(write_history_csv, thread_sensitive=False)(telegram_user.pk)
+        with document:
+            filename = f"history-{telegram_user.telegram_id}-{timezone.localdate():%Y%m%d}.csv"
+            # read_file_handle=False lets httpx stream the file instead of loading it into memory
+            message = await bot.send_document(
+                chat_id,
+                document=InputFile(document, filename=filename, read_file_handle=False),
+                caption=caption,
+            )
+        await db_sync_to_async(cache.set)(
+            key, {'fingerprint': fingerprint, 'file_id': message.document.file_id}, timeout=HISTORY_DOCUMENT_TTL,
+        )
+    except Exception as e:
+        logger.error("Error sending history document to user %s: %s", telegram_user.pk, e, exc_info=True)
+        await bot.send_message(chat_id, "⚠️ We couldn't prepare your history file. Please try again later.")
+    finally:
+        await db_sync_to_async(cache.delete)(building_key)
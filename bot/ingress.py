@@ -0,0 +1,41 @@
+from collections import namedtuple
+from django.conf import settings
+from . import metrics
+import hmac
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+Rejection = namedtuple('Rejection', ['status', 'reason'])
+
+
+def reject(kind, status, reason):
+    metrics.increment(f"webhook.rejected.{kind}")
+    logger.debug("Rejected webhook request: %s", reason)
+    return Rejection(status, reason)
+
+
+def check_webhook(method, secret_token, content_length):
+    """Why a webhook request cannot come from Telegram, judged from its method and headers; None to accept.
+
+    secret_token and content_length are the raw header values, or None when missing.
+    Nothing here needs the body, so junk is turned away before it is read.
+    """
+    if method != 'POST':
+        return reject('method', 405, 'Only POST requests are allowed')
+
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    # Constant time, so response timing does not reveal how much of a guess was right
+    if secret and not hmac.compare_digest((secret_token or '').encode('utf-8'), secret.encode('utf-8')):
+        return reject('secret', 403, 'Forbidden')
+
+    # Telegram always sends a Content-Length; a chunked body could not be capped up front
+    if not content_length or not content_length.isdigit():
+        return reject('length', 411, 'Length Required')
+    if int(content_length) > settings.TELEGRAM_WEBHOOK_MAX_BYTES:
+        return reject('size', 413, 'Request body too large')
+    return None
+
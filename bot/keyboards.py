@@ -1,4 +1,5 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from .catalog import catalog
 
 
 def get_main_menu():
@@ -17,20 +18,29 @@ def get_main_menu():
 
 
 def get_deposit_menu():
+    # One button per fiat currency currently offered by Mobee
     keyboard = [
-        [
-            InlineKeyboardButton("📥 deposit IDR 💰", callback_data="deposit_IDR"),
-        ],
-        [InlineKeyboardButton("↩️ Back to Menu", callback_data="main_menu")]
+        [InlineKeyboardButton(f"📥 deposit {currency} 💰", callback_data=f"deposit_{currency}")]
+        for currency in catalog.snapshot().deposits
     ]
+    keyboard.append([InlineKeyboardButton("↩️ Back to Menu", callback_data="main_menu")])
     return InlineKeyboardMarkup(keyboard)
 
 
 def get_withdrawal_menu():
+    # One button per crypto currency currently offered by Mobee
     keyboard = [
-        [
-            InlineKeyboardButton("📥 withdraw USDT 💰", callback_data="withdraw_USDT"),
-        ],
-        [InlineKeyboardButton("↩️ Back to Menu", callback_data="main_menu")]
+        [InlineKeyboardButton(f"📥 withdraw {currency} 💰", callback_data=f"withdraw_{currency}")]
+        for currency in catalog.snapshot().withdrawals
     ]
-    return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
+    keyboard.append([InlineKeyboardButton("↩️ Back to Menu", callback_data="main_menu")])
+    return InlineKeyboardMarkup(keyboard)
+
+def get_payment_details_menu():
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Main Menu", callback_data="main_menu")]])
+
+
+def get_history_menu():
+    keyboard = [[InlineKeyboardButton("📄 Download full history", callback_data="history_export")]]
+    keyboard.extend(get_main_menu().inline_keyboard)
+    return InlineKeyboardMarkup(keyboard)
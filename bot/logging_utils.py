@@ -0,0 +1,183 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from datetime import datetime, timezone
+from django.conf import settings
+from . import metrics
+import logging
+import atexit
+import random
+import queue
+import copy
+import json
+import os
+import re
+
+SENSITIVE_NAME = r'[\w-]*(?:api[_-]?key|secret|signature|token|password|authorization)[\w-]*'
+
+# key=value, key: value, "key": "value" and header-style pairs with a sensitive key;
+# the credential after an auth scheme such as "Authorization: Bearer <token>" is the value
+SENSITIVE_PAIR_PATTERN = re.compile(
+    rf'''(?P<key>["']?{SENSITIVE_NAME}["']?\s*[:=]\s*)(?P<quote>["']?)(?P<scheme>(?:Bearer|Basic|Token)\s+)?(?P<value>[^"',\s}}&]+)''',
+    re.IGNORECASE,
+)
+
+# The one-time action token that ends deposit and withdrawal links (see bot/urls.py)
+ACTION_LINK_PATTERN = re.compile(r'''(?P<path>/create-(?:deposit/(?:[^/\s]+/){3}|withdraw/(?:[^/\s]+/){5}))[^/\s"'?#]+''')
+
+SENSITIVE_KEY_PATTERN = re.compile(rf'^{SENSITIVE_NAME}$', re.IGNORECASE)
+
+# Telegram bot tokens, e.g. in https://api.telegram.org/bot<token>/sendMessage
+BOT_TOKEN_PATTERN = re.compile(r'\d{5,}:[A-Za-z0-9_-]{30,}')
+
+REDACTED = '[REDACTED]'
+
+SECRET_SETTINGS = ('MOBEE_API_KEY', 'MOBEE_API_SECRET', 'TELEGRAM_BOT_TOKEN', 'SECRET_KEY')
+
+# Attributes every LogRecord has; anything else was passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def redact(text):
+    """Mask configured secrets, bot tokens and values of sensitive-looking keys in a string."""
+    for name in SECRET_SETTINGS:
+        secret = getattr(settings, name, None)
+        if secret and len(secret) >= 8:
+            text = text.replace(secret, REDACTED)
+    text = BOT_TOKEN_PATTERN.sub(REDACTED, text)
+    text = ACTION_LINK_PATTERN.sub(rf'\g<path>{REDACTED}', text)
+    return SENSITIVE_PAIR_PATTERN.sub(rf'\g<key>\g<quote>\g<scheme>{REDACTED}', text)
+
+
+def _redact_value(key, value):
+    if isinstance(key, str) and SENSITIVE_KEY_PATTERN.match(key):
+        return REDACTED
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {k: _redact_value(k, v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_value(None, v) for v in value]
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """Merges the message with its args and masks secrets in it, in the traceback and in extras."""
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text)
+        for key in set(vars(record)) - RECORD_ATTRIBUTES:
+            setattr(record, key, _redact_value(key, getattr(record, key)))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO and lower records from chatty loggers; warnings always pass.
+
+    rates maps a logger name to the fraction kept, e.g. {'httpx': 0.1}; it also
+    applies to that logger's children.
+    """
+
+    def __init__(self, rates=None, level=logging.INFO):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+        self.level = level
+
+    def rate_for(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return float(rate)
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1 or random.random() < rate:
+            return True
+        metrics.increment('logging.sampled_out')
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, source, extras and traceback."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key in set(vars(record)) - RECORD_ATTRIBUTES:
+            entry[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class QueueLogHandler(QueueHandler):
+    """Hands records to a background thread that writes JSON lines to a size-rotated file.
+
+    The calling thread only formats the message and puts it on a bounded queue;
+    when the queue is full the record is dropped and counted instead of blocking.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True,
+        )
+        self.target.setFormatter(JsonFormatter())
+        self.listener = None
+        self._pid = None
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        # Threads don't survive fork(), a pre-forked worker starts its own listener
+        self._pid = os.getpid()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Unlike the default, keep the traceback separate so the JSON formatter can structure it
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment('logging.dropped')
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def close(self):
+        if self.listener is not None and self._pid == os.getpid():
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+        self.listener = None
+        self.target.close()
+        super().close()
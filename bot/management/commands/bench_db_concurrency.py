@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.signals import connection_created
+from bot.telegram_stub import TelegramStub
+from bot.management.commands.bench_mobee_resilience import command_update
+import asyncio
+import logging
+import tempfile
+import time
+import os
+
+
+def int_list(value):
+    try:
+        numbers = [int(part) for part in value.split(',') if part]
+    except ValueError:
+        raise CommandError(f"Expected comma-separated integers, got {value!r}")
+    if not numbers or min(numbers) < 1:
+        raise CommandError(f"Expected positive integers, got {value!r}")
+    return numbers
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs /balance updates through the bot at increasing numbers of updates in flight and '
+        'reports throughput per BOT_DB_THREADS size; 1 thread is the old shared sync_to_async thread'
+    )
+    # System checks import the URLconf, and with it the bot, before the stub URL is set
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=400, help='Updates per run, each from its own user')
+        parser.add_argument('--in-flight', default='1,4,16,64', help='Concurrent updates to run, e.g. 1,4,16,64')
+        parser.add_argument('--threads', default=None, help='DB pool sizes to compare (default: 1,BOT_DB_THREADS)')
+        parser.add_argument(
+            '--query-latency', type=float, default=5.0,
+            help='Milliseconds added to every query, the round trip of a database on another host'
+        )
+
+    def handle(self, *args, **options):
+        in_flight_levels = int_list(options['in_flight'])
+        thread_counts = int_list(options['threads'] or f"1,{settings.BOT_DB_THREADS}")
+
+        telegram = TelegramStub().start()
+        # The bot module builds its Bot from these settings on import, so set them first
+        settings.TELEGRAM_API_BASE_URL = telegram.base_url
+        settings.TRACE_SAMPLE_RATE = 0.0
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+
+        # A throwaway file database: every pool thread opens its own connection to it.
+        database_dir = tempfile.mkdtemp(prefix='bench-db-')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(database_dir, 'bench.sqlite3')
+        settings.DATABASES['default'].setdefault('OPTIONS', {}).update(timeout=30)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        query_latency = options['query_latency'] / 1000
+
+        def delayed(execute, sql, params, many, context):
+            time.sleep(query_latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delayed)
+
+        connection_created.connect(add_latency, weak=False)
+        try:
+            from bot.models import TelegramUser
+            from bot.decoding import RawUpdate
+            from bot.views import run_on_bot_loop, initialize_application, process_raw_update
+            from bot import db
+
+            base_id = 10 ** 9
+            TelegramUser.objects.bulk_create([
+                TelegramUser(telegram_id=base_id + index, username=f'load{base_id + index}', first_name='Load')
+                for index in range(options['updates'])
+            ])
+            run_on_bot_loop(initialize_application(), timeout=30)
+
+            async def run(bodies, in_flight):
+                slots = asyncio.Semaphore(in_flight)
+
+                async def process(body):
+                    async with slots:
+                        await process_raw_update(RawUpdate(body))
+
+                started = time.perf_counter()
+                await asyncio.gather(*(process(body) for body in bodies))
+                return time.perf_counter() - started
+
+            self.stdout.write(
+                f"{options['updates']} /balance updates per run, {options['query_latency']:g} ms per query"
+            )
+            self.stdout.write(f"{'threads':<9}{'in flight':>10}{'updates/s':>11}{'ms/update':>11}{'speedup':>9}")
+            update_id = 1
+            for threads in thread_counts:
+                # A fresh pool of the size under test, its threads connect on first use
+                if db.executor is not None:
+                    db.executor.shutdown()
+                    db.executor = None
+                settings.BOT_DB_THREADS = threads
+
+                baseline = None
+                for in_flight in in_flight_levels:
+                    # Cold balance caches, so every update reads the database
+                    cache.clear()
+                    bodies = []
+                    for index in range(options['updates']):
+                        bodies.append(command_update(update_id, base_id + index).encode('utf-8'))
+                        update_id += 1
+                    elapsed = run_on_bot_loop(run(bodies, in_flight))
+                    throughput = len(bodies) / elapsed
+                    baseline = baseline or throughput
+                    self.stdout.write(
+                        f"{threads:<9}{in_flight:>10}{throughput:>11.1f}"
+                        f"{elapsed * 1000 / len(bodies):>11.2f}{throughput / baseline:>8.1f}x"
+                    )
+        finally:
+            connection_created.disconnect(add_latency)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            telegram.stop()
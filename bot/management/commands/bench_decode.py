@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from telegram import Update
+from bot.decoding import RawUpdate, orjson
+import json
+import time
+
+USER = {'id': 123456789, 'is_bot': False, 'first_name': 'Bench', 'username': 'bench_user', 'language_code': 'en'}
+CHAT = {'id': 123456789, 'type': 'private', 'first_name': 'Bench', 'username': 'bench_user'}
+MENU = {'inline_keyboard': [
+    [{'text': '💰 Check Balance', 'callback_data': 'balance'}, {'text': '📥 Make Deposit', 'callback_data': 'deposit'}],
+    [{'text': '📤  Withdrawal', 'callback_data': 'withdrawal'}, {'text': '📊 History', 'callback_data': 'history'}],
+    [{'text': '📞 Customer Support', 'callback_data': 'support'}],
+]}
+
+# Representative bodies of the update types the bot receives
+SAMPLES = {
+    'command': {
+        'update_id': 900000001,
+        'message': {
+            'message_id': 10, 'date': 1700000000, 'from': USER, 'chat': CHAT, 'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    },
+    'text_message': {
+        'update_id': 900000002,
+        'message': {'message_id': 11, 'date': 1700000000, 'from': USER, 'chat': CHAT, 'text': '150000'},
+    },
+    'callback_query': {
+        'update_id': 900000003,
+        'callback_query': {
+            'id': '4382bfdwdsb323b2d9', 'from': USER, 'chat_instance': '-8934834983', 'data': 'balance',
+            'message': {
+                'message_id': 12, 'date': 1700000000, 'chat': CHAT,
+                'from': {'id': 7000000000, 'is_bot': True, 'first_name': 'Mobee', 'username': 'mobee_bot'},
+                'text': 'Main Menu', 'reply_markup': MENU,
+            },
+        },
+    },
+    'edited_message': {
+        'update_id': 900000004,
+        'edited_message': {
+            'message_id': 13, 'date': 1700000000, 'edit_date': 1700000100, 'from': USER, 'chat': CHAT,
+            'text': '0x52908400098527886E0F7030069857D2E4169EE7',
+        },
+    },
+    'my_chat_member': {
+        'update_id': 900000005,
+        'my_chat_member': {
+            'chat': CHAT, 'from': USER, 'date': 1700000000,
+            'old_chat_member': {'user': USER, 'status': 'member'},
+            'new_chat_member': {'user': USER, 'status': 'kicked', 'until_date': 0},
+        },
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks webhook decoding cost per update type (fast routing keys vs full Update)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(f"JSON parser: {'orjson' if orjson is not None else 'json (stdlib)'}")
+        self.stdout.write(
+            f"{'update type':<16}{'update_id peek':>16}{'routing keys':>16}{'full Update':>16}{'legacy path':>16}"
+        )
+
+        for name, sample in SAMPLES.items():
+            body = json.dumps(sample).encode('utf-8')
+
+            def peek():
+                RawUpdate(body).update_id
+
+            def routing_keys():
+                raw = RawUpdate(body)
+                raw.update_id, raw.chat_id, raw.callback_data
+
+            def full():
+                RawUpdate(body).to_update(None)
+
+            def legacy():
+                Update.de_json(json.loads(body.decode('utf-8')), None)
+
+            timings = [self.measure(func, iterations) for func in (peek, routing_keys, full, legacy)]
+            self.stdout.write(f"{name:<16}" + "".join(f"{timing:>13.2f} µs" for timing in timings))
+
+    def measure(self, func, iterations):
+        """Mean cost of one call in microseconds."""
+        func()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - started) / iterations * 1e6
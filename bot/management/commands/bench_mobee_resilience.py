@@ -0,0 +1,176 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from uuid import uuid4
+from bot.mobee_stub import MobeeStub, Faults, NO_FAULTS
+from bot.telegram_stub import TelegramStub
+import statistics
+import logging
+import tempfile
+import random
+import json
+import time
+import os
+
+MOBEE_ORDER_PATHS = ('/v1/wallets/fiat-deposits', '/v1/wallets/crypto-withdrawals')
+
+# EIP-55 test vector, passes the BEP20 address check
+WITHDRAWAL_ADDRESS = '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed'
+
+
+def scenarios(hang_seconds):
+    """Degradation steps applied to the deposit and withdrawal endpoints of the stub."""
+    only_orders = dict(paths=MOBEE_ORDER_PATHS)
+    return {
+        'healthy': NO_FAULTS,
+        'slow-tail': Faults(latency='lognormal:150,0.8', **only_orders),
+        '5xx-bursts': Faults(burst_every=20, burst_length=8, **only_orders),
+        'errors-20%': Faults(error_rate=0.2, **only_orders),
+        'timeouts-10%': Faults(timeout_rate=0.1, hang_seconds=hang_seconds, **only_orders),
+        'malformed-10%': Faults(malformed_rate=0.1, **only_orders),
+        'slow-drip-10%': Faults(drip_rate=0.1, drip_seconds=hang_seconds, **only_orders),
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def command_update(update_id, telegram_id):
+    """A /balance command from one user, as Telegram would post it to the webhook."""
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'Load', 'username': f'load{telegram_id}'}
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'from': user,
+            'chat': {'id': telegram_id, 'type': 'private', 'first_name': 'Load'},
+            'text': '/balance', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 8}],
+        },
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the deposit and withdrawal views and webhook updates against a fault-injecting '
+        'Mobee stub and reports throughput and tail latency per degradation scenario'
+    )
+    # System checks import the URLconf, and with it the bot, before the stub URLs are set
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Request threads, like a sync worker pool')
+        parser.add_argument('--deposits', type=int, default=100, help='Deposit link clicks per scenario')
+        parser.add_argument('--withdrawals', type=int, default=50, help='Withdrawal link clicks per scenario')
+        parser.add_argument('--updates', type=int, default=200, help='Webhook updates per scenario')
+        parser.add_argument(
+            '--mobee-timeout', type=float, default=2.0,
+            help='MOBEE_READ_TIMEOUT and MOBEE_TOTAL_TIMEOUT during the run'
+        )
+        parser.add_argument('--hang-seconds', type=float, default=5.0, help='How long injected timeouts hang')
+        parser.add_argument('--scenario', action='append', help='Run only these scenarios (repeatable)')
+
+    def handle(self, *args, **options):
+        available = scenarios(options['hang_seconds'])
+        selected = options['scenario'] or list(available)
+        unknown = set(selected) - set(available)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}; choose from {', '.join(available)}")
+
+        mobee = MobeeStub().start()
+        telegram = TelegramStub().start()
+        # The bot module builds its Bot from these settings on import, so set them first
+        settings.MOBEE_API_BASE_URL = mobee.url
+        settings.TELEGRAM_API_BASE_URL = telegram.base_url
+        settings.MOBEE_READ_TIMEOUT = settings.MOBEE_TOTAL_TIMEOUT = options['mobee_timeout']
+        settings.TRACE_SAMPLE_RATE = 0.0
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+        # Failed requests are counted in the report, not logged one by one
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        # A throwaway file database: threads need their own connections to it.
+        database_dir = tempfile.mkdtemp(prefix='bench-mobee-')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(database_dir, 'bench.sqlite3')
+        # Writers queue for the lock instead of failing with "database is locked" on upgrade
+        settings.DATABASES['default'].setdefault('OPTIONS', {}).update(timeout=30, transaction_mode='IMMEDIATE')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            from bot.catalog import catalog
+            from bot.views import run_on_bot_loop, initialize_application
+            catalog.refresh()
+            run_on_bot_loop(initialize_application(), timeout=30)
+
+            self.stdout.write(
+                f"{options['workers']} workers, {options['deposits']} deposits + {options['withdrawals']} "
+                f"withdrawals + {options['updates']} webhook updates per scenario, "
+                f"Mobee timeout {options['mobee_timeout']}s"
+            )
+            self.stdout.write(
+                f"{'scenario':<15}{'requests':<13}{'ok':>6}{'failed':>8}{'req/s':>9}"
+                f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+            )
+            for name in selected:
+                mobee.faults = available[name]
+                results, elapsed = self.run_scenario(options)
+                for kind in ('deposit', 'withdrawal', 'webhook'):
+                    self.report(name, kind, results[kind], elapsed)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            mobee.stop()
+            telegram.stop()
+
+    def run_scenario(self, options):
+        from bot.models import TelegramUser, ActionToken
+
+        operations = []
+        for kind, count in (('deposit', options['deposits']), ('withdrawal', options['withdrawals'])):
+            for index in range(count):
+                telegram_id = random.randint(10 ** 8, 10 ** 9)
+                user = TelegramUser.objects.create(telegram_id=telegram_id, username=f'load{telegram_id}', balance=1000)
+                token = str(uuid4())
+                ActionToken.objects.create(user=user, token=token, action=kind)
+                if kind == 'deposit':
+                    operations.append((kind, 'get', f'/create-deposit/{telegram_id}/100000/BNI/{token}/', None))
+                else:
+                    operations.append((
+                        kind, 'get', f'/create-withdraw/{telegram_id}/USDT/5/{WITHDRAWAL_ADDRESS}/12/{token}/', None,
+                    ))
+        for index in range(options['updates']):
+            update_id = random.randint(10 ** 9, 2 * 10 ** 9)
+            operations.append((
+                'webhook', 'post', f'/{settings.TELEGRAM_WEBHOOK_PATH}', command_update(update_id, 42000 + index % 50),
+            ))
+        random.shuffle(operations)
+
+        def perform(operation):
+            kind, method, path, body = operation
+            # Clients keep cookies, one per request keeps threads apart
+            client = Client(raise_request_exception=False)
+            started = time.perf_counter()
+            if method == 'post':
+                response = client.post(path, data=body, content_type='application/json')
+            else:
+                response = client.get(path)
+            return kind, response.status_code in (200, 302), time.perf_counter() - started
+
+        results = defaultdict(list)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for kind, ok, duration in pool.map(perform, operations):
+                results[kind].append((ok, duration))
+        return results, time.perf_counter() - started
+
+    def report(self, scenario, kind, results, elapsed):
+        if not results:
+            return
+        durations = [duration * 1000 for ok, duration in results]
+        ok = sum(1 for success, duration in results if success)
+        self.stdout.write(
+            f"{scenario:<15}{kind:<13}{ok:>6}{len(results) - ok:>8}{len(results) / elapsed:>9.1f}"
+            f"{statistics.median(durations):>9.0f}{percentile(durations, 0.95):>9.0f}"
+            f"{percentile(durations, 0.99):>9.0f}{max(durations):>9.0f}"
+        )
@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import multiprocessing
+import tempfile
+import json
+import time
+import os
+
+
+def synthetic_worker(index, work_ms):
+    """Shard worker that decodes each update and burns work_ms of CPU instead of calling Telegram."""
+    import django
+    django.setup()
+
+    from telegram import Update
+    from bot.sharding import serve_shard
+
+    def handler(body):
+        Update.de_json(json.loads(body), None)
+        deadline = time.perf_counter() + work_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+
+    serve_shard(index, handler)
+
+
+def synthetic_update(update_id, chat_id):
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': '100000',
+        },
+    }).encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = 'Load-tests the chat-sharded worker mode and reports throughput per shard count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--updates', type=int, default=2000, help='Updates sent per run')
+        parser.add_argument('--chats', type=int, default=500, help='Distinct chats the updates come from')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent ingress threads')
+        parser.add_argument('--work-ms', type=float, default=2.0, help='Simulated handler CPU time per update')
+
+    def handle(self, *args, **options):
+        from bot.sharding import ShardRouter, shard_address
+
+        # Keep benchmark sockets away from any live shard workers
+        runtime_dir = tempfile.mkdtemp(prefix='bench-shards-')
+        os.environ['BOT_RUNTIME_DIR'] = runtime_dir
+        settings.BOT_RUNTIME_DIR = runtime_dir
+
+        context = multiprocessing.get_context('spawn')
+        bodies = [
+            (chat_id, synthetic_update(update_id, chat_id))
+            for update_id in range(options['updates'])
+            for chat_id in [1000 + update_id % options['chats']]
+        ]
+
+        baseline = None
+        for workers in range(1, options['max_workers'] + 1):
+            processes = [
+                context.Process(target=synthetic_worker, args=(index, options['work_ms']), daemon=True)
+                for index in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            try:
+                self._wait_for_sockets(shard_address, workers)
+                router = ShardRouter(workers)
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                    results = list(pool.map(lambda item: router.forward(*item), bodies))
+                elapsed = time.perf_counter() - started
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.join()
+                for index in range(workers):
+                    address = shard_address(index)
+                    if isinstance(address, str):
+                        Path(address).unlink(missing_ok=True)
+
+            throughput = len(bodies) / elapsed
+            baseline = baseline or throughput
+            failed = results.count(False)
+            self.stdout.write(
+                f"workers={workers:<3} {throughput:10.1f} updates/s   "
+                f"speedup x{throughput / baseline:5.2f}   failed={failed}"
+            )
+
+    def _wait_for_sockets(self, shard_address, workers, timeout=30):
+        deadline = time.monotonic() + timeout
+        for index in range(workers):
+            address = shard_address(index)
+            if not isinstance(address, str):
+                time.sleep(2)
+                continue
+            while not Path(address).exists():
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Shard {index} did not start")
+                time.sleep(0.05)
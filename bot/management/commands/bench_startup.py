@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import statistics
+import subprocess
+import json
+import sys
+
+# Runs in a fresh interpreter so module import cost is measured cold every time
+PROBE = """
+import json, os, time
+t0 = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mobeeXchange.settings')
+django.setup()
+t1 = time.perf_counter()
+import bot.views as views
+t2 = time.perf_counter()
+views.build_application()
+t3 = time.perf_counter()
+if {network}:
+    views.warm_up()
+t4 = time.perf_counter()
+print(json.dumps({{
+    'django_setup': t1 - t0,
+    'import_bot_views': t2 - t1,
+    'build_application': t3 - t2,
+    'warm_up': t4 - t3,
+    'total': t4 - t0,
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks worker start-up, including import time for bot.views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to measure')
+        parser.add_argument(
+            '--network', action='store_true',
+            help='Also run warm_up(), which initializes the Application against the Bot API'
+        )
+
+    def handle(self, *args, **options):
+        probe = PROBE.format(network=options['network'])
+        samples = []
+        for _ in range(options['runs']):
+            result = subprocess.run(
+                [sys.executable, '-c', probe], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            )
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(f"Cold starts: {len(samples)}")
+        for phase in ('django_setup', 'import_bot_views', 'build_application', 'warm_up', 'total'):
+            values = [sample[phase] * 1000 for sample in samples]
+            self.stdout.write(
+                f"{phase:<20} min {min(values):8.1f} ms   median {statistics.median(values):8.1f} ms"
+                f"   max {max(values):8.1f} ms"
+            )
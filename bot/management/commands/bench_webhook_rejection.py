@@ -0,0 +1,135 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from bot.management.commands.bench_mobee_resilience import percentile
+import secrets
+import asyncio
+import logging
+import statistics
+import time
+
+
+def scope(path, headers):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'https', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'host', b'localhost')] + headers,
+        'client': ('127.0.0.1', 40000), 'server': ('localhost', 443),
+    }
+
+
+def body_chunks(body):
+    """The body as a server would hand it over, in 64 KiB messages."""
+    return [body[start:start + 64 * 1024] for start in range(0, len(body), 64 * 1024)] or [b'']
+
+
+async def call(app, request_scope, chunks):
+    """Run one request through an ASGI app; returns (status, body bytes the app read)."""
+    chunks = list(chunks)
+    read = 0
+    status = None
+
+    async def receive():
+        nonlocal read
+        if chunks:
+            chunk = chunks.pop(0)
+            read += len(chunk)
+            return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+        # The client stays connected until the response is sent
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(request_scope, receive, send)
+    return status, read
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures what turning away junk webhook requests costs, at the ASGI front door and '
+        'through the full Django stack as before the secret-token and size checks'
+    )
+    # System checks import the URLconf, and with it the bot; nothing here needs them
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per case')
+        parser.add_argument('--large-kib', type=int, default=1024, help='Size of the large junk body')
+
+    def handle(self, *args, **options):
+        settings.TRACE_SAMPLE_RATE = 0.0
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['localhost']
+        from mobeeXchange.asgi import application, django_application, WEBHOOK_PATH
+
+        # Rejections are counted in the report, not logged one by one (set after the
+        # import above, which configures logging again)
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        logging.getLogger('bot.views').setLevel(logging.CRITICAL)
+
+        secret = secrets.token_urlsafe(32)
+        # Differ in the first and in the last character, to show the comparison takes as long either way
+        wrong_first = ('A' if secret[0] != 'A' else 'B') + secret[1:]
+        wrong_last = secret[:-1] + ('A' if secret[-1] != 'A' else 'B')
+        small = b'{"junk": "' + b'x' * 1000 + b'"}'
+        large = b'{"junk": "' + b'x' * (options['large_kib'] * 1024) + b'"}'
+
+        def headers(body, token=None):
+            values = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+            if token is not None:
+                values.append((b'x-telegram-bot-api-secret-token', token.encode()))
+            return values
+
+        chunked = [
+            (b'content-type', b'application/json'), (b'transfer-encoding', b'chunked'),
+            (b'x-telegram-bot-api-secret-token', secret.encode()),
+        ]
+        cases = [
+            # name, app, headers, body, checks enabled. "no checks" is the ingress as it was:
+            # any POST is read whole and decoded
+            ('no secret, 1 KiB', application, headers(small), small, True),
+            (f"no secret, {options['large_kib']} KiB", application, headers(large), large, True),
+            ('wrong secret, 1st char', application, headers(small, wrong_first), small, True),
+            ('wrong secret, last char', application, headers(small, wrong_last), small, True),
+            (f"secret, {options['large_kib']} KiB", application, headers(large, secret), large, True),
+            ('secret, chunked', application, chunked, small, True),
+            ('secret, junk 1 KiB', application, headers(small, secret), small, True),
+            ('no checks, junk 1 KiB', django_application, headers(small), small, False),
+            (f"no checks, junk {options['large_kib']} KiB", django_application, headers(large), large, False),
+        ]
+
+        async def run():
+            results = []
+            for name, app, request_headers, body, front_door in cases:
+                if front_door:
+                    settings.TELEGRAM_WEBHOOK_SECRET = secret
+                    settings.TELEGRAM_WEBHOOK_MAX_BYTES = 256 * 1024
+                else:
+                    # No secret, bodies up to DATA_UPLOAD_MAX_MEMORY_SIZE
+                    settings.TELEGRAM_WEBHOOK_SECRET = None
+                    settings.TELEGRAM_WEBHOOK_MAX_BYTES = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+                # Fewer of the slow ones, they would take minutes otherwise
+                count = options['requests'] if front_door else max(1, options['requests'] // 10)
+                request_scope = scope(WEBHOOK_PATH, request_headers)
+                chunks = body_chunks(body)
+                durations = []
+                statuses = set()
+                read = 0
+                for _ in range(count):
+                    started = time.perf_counter()
+                    status, read_bytes = await call(app, dict(request_scope), chunks)
+                    durations.append((time.perf_counter() - started) * 1e6)
+                    statuses.add(status)
+                    read += read_bytes
+                results.append((name, statuses, durations, read / count))
+            return results
+
+        self.stdout.write(f"{options['requests']} requests per case (a tenth for the 'no checks' cases)")
+        self.stdout.write(f"{'case':<26}{'status':>8}{'mean µs':>10}{'p99 µs':>10}{'req/s':>10}{'KiB read':>10}")
+        for name, statuses, durations, read in asyncio.run(run()):
+            self.stdout.write(
+                f"{name:<26}{'/'.join(str(status) for status in sorted(statuses)):>8}"
+                f"{statistics.mean(durations):>10.1f}{percentile(durations, 0.99):>10.1f}"
+                f"{1e6 / statistics.mean(durations):>10.0f}{read / 1024:>10.1f}"
+            )
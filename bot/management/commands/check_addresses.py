@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from bot.validators import check_addresses, VALIDATORS
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Validates a list of wallet addresses (one per line) for a network'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='File with one address per line (reads stdin if omitted)')
+        parser.add_argument('--network', default='BEP20', help=f"One of: {', '.join(sorted(VALIDATORS))}")
+        parser.add_argument('--invalid-only', action='store_true', help='Only print invalid addresses')
+
+    def handle(self, *args, **options):
+        try:
+            if options['file']:
+                with open(options['file'], encoding='utf-8') as source:
+                    addresses = [line for line in source.read().splitlines() if line.strip()]
+            else:
+                addresses = [line for line in sys.stdin.read().splitlines() if line.strip()]
+            results = check_addresses(options['network'], addresses)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        invalid = 0
+        for result in results:
+            if result.valid:
+                if not options['invalid_only']:
+                    self.stdout.write(f"OK       {result.address}")
+            else:
+                invalid += 1
+                self.stdout.write(self.style.ERROR(f"INVALID  {result.address}  ({result.reason})"))
+
+        self.stdout.write(f"{len(results)} checked, {invalid} invalid")
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from pathlib import Path
+import json
+import time
+import os
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        'Reports the open conversations and their estimated memory in every bot worker, '
+        'from the stats each worker writes to BOT_RUNTIME_DIR'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=float, default=0, help='Repeat every this many seconds')
+        parser.add_argument('--json', action='store_true', help='Print the raw per-worker stats')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.report(options['json'])
+                if not options['watch']:
+                    return
+                time.sleep(options['watch'])
+                self.stdout.write('')
+        except KeyboardInterrupt:
+            pass
+
+    def load(self):
+        workers = []
+        for path in sorted(Path(settings.BOT_RUNTIME_DIR).glob('conversations-*.json')):
+            try:
+                stats = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Being replaced right now
+                continue
+            # Files of exited workers stay behind until the pid is reused
+            if is_running(stats['pid']):
+                workers.append(stats)
+        return workers
+
+    def report(self, as_json):
+        workers = self.load()
+        if as_json:
+            self.stdout.write(json.dumps(workers, indent=2))
+            return
+        if not workers:
+            self.stdout.write(
+                f"No worker has reported yet; workers write their stats to {settings.BOT_RUNTIME_DIR} "
+                f"every {settings.CONVERSATION_SWEEP_INTERVAL}s once a conversation was started"
+            )
+            return
+
+        self.stdout.write(
+            f"{'pid':<9}{'open':>7}{'KiB':>10}{'budget %':>10}{'expired':>9}{'evicted':>9}{'age s':>7}  steps"
+        )
+        now = time.time()
+        for stats in workers:
+            steps = ", ".join(f"{state}={count}" for state, count in stats['by_state'].items())
+            self.stdout.write(
+                f"{stats['pid']:<9}{stats['conversations']:>7}{stats['bytes'] / 1024:>10.1f}"
+                f"{stats['bytes'] / stats['budget']:>10.1%}{stats['expired']:>9}{stats['evicted']:>9}"
+                f"{now - stats['updated_at']:>7.0f}  {steps}"
+            )
+        self.stdout.write(
+            f"{'total':<9}{sum(stats['conversations'] for stats in workers):>7}"
+            f"{sum(stats['bytes'] for stats in workers) / 1024:>10.1f}"
+        )
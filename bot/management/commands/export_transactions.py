@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from bot.exports import export_rows, encode_rows, gzip_chunks, batch_chunks, EXPORT_CHUNK_SIZE
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Streams deposits or withdrawals to a CSV/JSONL file (gzip if the name ends in .gz)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['deposits', 'withdrawals'])
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', default='-', help="Output path, '-' for stdout")
+        parser.add_argument('--since', help='Created on or after (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--until', help='Created on or before (YYYY-MM-DD or ISO datetime)')
+        parser.add_argument('--status', help='Only rows with this status')
+        parser.add_argument('--user', type=int, help='Only rows of this Telegram id')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            options['kind'],
+            since=options['since'],
+            until=options['until'],
+            status=options['status'],
+            telegram_id=options['user'],
+            chunk_size=options['chunk_size'],
+        )
+        chunks = encode_rows(rows, options['format'])
+        output = options['output']
+        chunks = gzip_chunks(chunks) if output.endswith('.gz') else batch_chunks(chunks)
+
+        try:
+            if output == '-':
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+            else:
+                with open(output, 'wb') as destination:
+                    for chunk in chunks:
+                        destination.write(chunk)
+                self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {output}"))
+        except ValueError as e:
+            raise CommandError(str(e))
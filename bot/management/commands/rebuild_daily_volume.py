@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from bot.rollups import rebuild_daily_volume
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily volume rollup from the deposit and withdrawal history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD) onwards')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+
+        buckets = rebuild_daily_volume(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} daily volume buckets'))
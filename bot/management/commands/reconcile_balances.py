@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from bot.reconciliation import load_ledger, reconcile, wallet_balance_from_response, np, RECONCILE_CHUNK_SIZE
+from bot.mobee_utils import getWalletBalances
+import csv
+import time
+
+
+class Command(BaseCommand):
+    help = 'Reconciles user balances with deposits, withdrawals and the Mobee wallet balance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--currency', default='USDT')
+        parser.add_argument('--tolerance', type=float, default=0.01, help='Ignore differences up to this amount')
+        parser.add_argument('--report', help='Write per-user discrepancies to this CSV file')
+        parser.add_argument('--top', type=int, default=10, help='Discrepancies to print')
+        parser.add_argument(
+            '--wallet-balance', type=float,
+            help='Compare against this amount instead of calling the Mobee balance endpoint'
+        )
+        parser.add_argument('--skip-wallet', action='store_true', help='Only check per-user balances')
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        currency = options['currency'].upper()
+        started = time.perf_counter()
+        ledger = load_ledger(currency, chunk_size=options['chunk_size'])
+        loaded = time.perf_counter()
+
+        wallet_balance = options['wallet_balance']
+        if wallet_balance is None and not options['skip_wallet']:
+            try:
+                wallet_balance = wallet_balance_from_response(getWalletBalances(), currency)
+            except Exception as e:
+                raise CommandError(f"Could not fetch the Mobee wallet balance: {str(e)}")
+
+        report = reconcile(ledger, wallet_balance=wallet_balance, tolerance=options['tolerance'])
+        finished = time.perf_counter()
+
+        self.stdout.write(
+            f"Users: {report.users}  (load {loaded - started:.2f}s, compute {finished - loaded:.2f}s, "
+            f"{'numpy' if np is not None else 'pure Python'})"
+        )
+        self.stdout.write(f"Sum of balances:      {report.total_balance:,.8f} {currency}")
+        self.stdout.write(f"Completed deposits:   {report.total_credits:,.8f} {currency}")
+        self.stdout.write(f"Withdrawals + fees:   {report.total_debits:,.8f} {currency}")
+        self.stdout.write(f"Pending withdrawals:  {report.pending_withdrawals:,.8f} {currency}")
+        self.stdout.write(f"Expected wallet:      {report.expected_wallet:,.8f} {currency}")
+
+        if report.wallet_balance is not None:
+            line = f"Mobee wallet:         {report.wallet_balance:,.8f} {currency} (difference {report.wallet_difference:+,.8f})"
+            if abs(report.wallet_difference) > options['tolerance']:
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if report.discrepancies:
+            self.stdout.write(self.style.ERROR(f"{len(report.discrepancies)} users with discrepancies"))
+            for item in report.discrepancies[:options['top']]:
+                self.stdout.write(
+                    f"  {item.telegram_id}: balance {item.balance:,.8f}, expected {item.expected:,.8f}, "
+                    f"difference {item.difference:+,.8f}"
+                )
+        else:
+            self.stdout.write(self.style.SUCCESS("All user balances match their ledger"))
+
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as destination:
+                writer = csv.writer(destination)
+                writer.writerow(['telegram_id', 'balance', 'expected', 'difference'])
+                writer.writerows(report.discrepancies)
+            self.stdout.write(f"Report written to {options['report']}")
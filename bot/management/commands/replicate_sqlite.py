@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from bot.db_router import REPLICA_DB_ALIAS
+import sqlite3
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Keeps the SQLite replica in step with the default SQLite database by copying it with '
+        'the online backup API; a local stand-in for real replication'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between copies, i.e. the replica lag')
+        parser.add_argument('--once', action='store_true', help='Copy once and exit')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES.get(REPLICA_DB_ALIAS)
+        if replica is None:
+            raise CommandError('No replica configured, set REPLICA_DATABASE_URL (e.g. sqlite:////path/to/replica.sqlite3)')
+        if 'sqlite3' not in primary['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError('replicate_sqlite only copies between SQLite databases')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Replicating {primary['NAME']} -> {replica['NAME']} every {options['interval']}s"
+        ))
+        try:
+            while True:
+                started = time.perf_counter()
+                self.copy(str(primary['NAME']), str(replica['NAME']))
+                if options['once']:
+                    self.stdout.write(f"Copied in {time.perf_counter() - started:.2f}s")
+                    return
+                time.sleep(max(0.0, options['interval'] - (time.perf_counter() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping replication')
+
+    def copy(self, source_path, target_path):
+        # The backup API gives readers of either file a consistent snapshot while it runs
+        source = sqlite3.connect(source_path, timeout=30)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
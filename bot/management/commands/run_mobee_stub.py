@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from bot.mobee_stub import MobeeStub, Faults, sample_latency
+import time
+
+
+class Command(BaseCommand):
+    help = 'Runs a local Mobee API stub; set MOBEE_API_BASE_URL to its URL to use it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument(
+            '--balance', action='append', default=[], metavar='CURRENCY=AMOUNT',
+            help='Wallet balance served by /v1/wallets/balances, repeatable'
+        )
+        parser.add_argument(
+            '--latency', metavar='SPEC',
+            help="Added delay in ms: fixed:MS, uniform:LOW,HIGH, exp:MEAN or lognormal:MEDIAN,SIGMA"
+        )
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 5xx')
+        parser.add_argument(
+            '--burst', metavar='EVERY,LENGTH', default='0,0',
+            help='Answer LENGTH requests out of every EVERY with a 503'
+        )
+        parser.add_argument('--timeout-rate', type=float, default=0.0, help='Share of requests never answered')
+        parser.add_argument('--hang-seconds', type=float, default=60.0, help='How long unanswered requests hang')
+        parser.add_argument('--malformed-rate', type=float, default=0.0, help='Share of truncated JSON bodies')
+        parser.add_argument('--drip-rate', type=float, default=0.0, help='Share of responses sent byte by byte')
+        parser.add_argument('--drip-seconds', type=float, default=5.0, help='Time a dripped response takes')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Only inject faults on this endpoint path (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        balances = {}
+        for item in options['balance']:
+            currency, _, amount = item.partition('=')
+            try:
+                balances[currency.upper()] = float(amount)
+            except ValueError:
+                raise CommandError(f"Invalid balance: {item}")
+
+        try:
+            burst_every, burst_length = (int(value) for value in options['burst'].split(','))
+            if options['latency']:
+                sample_latency(options['latency'])
+        except ValueError as e:
+            raise CommandError(f"Invalid fault option: {str(e)}")
+
+        faults = Faults(
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            burst_every=burst_every,
+            burst_length=burst_length,
+            timeout_rate=options['timeout_rate'],
+            hang_seconds=options['hang_seconds'],
+            malformed_rate=options['malformed_rate'],
+            drip_rate=options['drip_rate'],
+            drip_seconds=options['drip_seconds'],
+            paths=tuple(options['paths']) if options['paths'] else None,
+        )
+        stub = MobeeStub(options['host'], options['port'], balances=balances, faults=faults).start()
+        self.stdout.write(self.style.SUCCESS(f"Mobee stub listening on {stub.url}"))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stub.stop()
@@ -0,0 +1,140 @@
+from django.core.management.base import BaseCommand
+from collections import defaultdict, Counter
+from telegram.error import TelegramError
+import asyncio
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update):
+    """Per-chat ordering key of a decoded update."""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return update.update_id
+
+
+class Command(BaseCommand):
+    help = 'Fetches updates with getUpdates instead of the webhook (fallback and backlog drain)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='Updates per getUpdates batch (max 100)')
+        parser.add_argument('--timeout', type=int, default=25, help='Long-polling timeout in seconds')
+        parser.add_argument('--concurrency', type=int, default=32, help='Chats processed concurrently per batch')
+        parser.add_argument(
+            '--max-attempts', type=int, default=3,
+            help='Times a failing update is fetched again before it is skipped'
+        )
+        parser.add_argument(
+            '--drain', action='store_true',
+            help='Exit once the backlog is empty instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        from bot.views import run_on_bot_loop, get_bot_loop
+
+        future = asyncio.run_coroutine_threadsafe(self.poll(options), get_bot_loop())
+        try:
+            future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            self.stdout.write('Stopping polling')
+            # Acknowledge whatever was handled before the interrupt
+            run_on_bot_loop(self.commit_offset(), timeout=30)
+
+    async def poll(self, options):
+        from bot.views import bot, initialize_application
+        from bot.sharding import get_shard_router
+        from bot.dedup import is_duplicate_update, forget_update
+        from bot.tracing import trace
+
+        application = await initialize_application()
+        router = get_shard_router()
+
+        # getUpdates is refused while a webhook is set
+        await bot.delete_webhook(drop_pending_updates=False)
+        self.stdout.write(self.style.WARNING(
+            'Webhook removed; run `manage.py setup_webhook` to switch back to webhook delivery'
+        ))
+
+        limit = max(1, min(options['limit'], 100))
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        self.offset = None
+
+        attempts = Counter()
+
+        async def process_chat(updates):
+            """Handle one chat's updates in order; returns the id of the first that failed, else None."""
+            async with semaphore:
+                # Updates of one chat run one after another to keep their order
+                for index, update in enumerate(updates):
+                    try:
+                        with trace('telegram.polled_update', update_id=update.update_id):
+                            if router is not None:
+                                body = update.to_json().encode('utf-8')
+                                if not await asyncio.to_thread(router.forward, update_chat_key(update), body):
+                                    raise RuntimeError(f"Shard worker failed to handle update {update.update_id}")
+                            else:
+                                async with asyncio.timeout(30):
+                                    await application.process_update(update)
+                    except Exception as e:
+                        logger.error("Error processing update %s: %s", update.update_id, e, exc_info=True)
+                        attempts[update.update_id] += 1
+                        if attempts[update.update_id] >= options['max_attempts']:
+                            del attempts[update.update_id]
+                            logger.error("Skipping update %s after %s attempts", update.update_id, options['max_attempts'])
+                            continue
+                        # This update and the chat's later ones are fetched again, let them through dedup
+                        for pending in updates[index:]:
+                            forget_update(pending.update_id)
+                        return update.update_id
+                    attempts.pop(update.update_id, None)
+                return None
+
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=self.offset,
+                    limit=limit,
+                    timeout=0 if options['drain'] else options['timeout'],
+                    read_timeout=options['timeout'] + 10,
+                )
+            except TelegramError as e:
+                logger.error("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            if not updates:
+                if options['drain']:
+                    self.stdout.write(self.style.SUCCESS('Backlog drained'))
+                    return
+                continue
+
+            chats = defaultdict(list)
+            for update in updates:
+                if not is_duplicate_update(update.update_id):
+                    chats[update_chat_key(update)].append(update)
+
+            results = await asyncio.gather(*(process_chat(chat_updates) for chat_updates in chats.values()))
+            failed = [update_id for update_id in results if update_id is not None]
+
+            if failed:
+                # Acknowledge only up to the first failure; the handled updates after it
+                # come back with the next batch and are skipped as duplicates
+                self.offset = min(failed)
+                logger.warning("%s of %s chats failed, fetching again from update %s", len(failed), len(chats), self.offset)
+                await asyncio.sleep(1)
+                continue
+
+            # The next getUpdates call with this offset acknowledges the whole handled batch
+            self.offset = updates[-1].update_id + 1
+            logger.info("Handled %s updates from %s chats", len(updates), len(chats))
+
+    async def commit_offset(self):
+        from bot.views import bot
+
+        if getattr(self, 'offset', None) is not None:
+            await bot.get_updates(offset=self.offset, limit=1, timeout=0)
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import multiprocessing
+import time
+
+
+def run_worker(index):
+    """Process entry point: owns the Application and conversation state of one shard."""
+    import django
+    django.setup()
+
+    from bot.sharding import serve_shard
+    from bot.views import warm_up, handle_sharded_update
+
+    warm_up()
+    serve_shard(index, handle_sharded_update)
+
+
+class Command(BaseCommand):
+    help = 'Runs the chat-sharded bot worker processes that the webhook forwards updates to'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of shard workers (defaults to TELEGRAM_SHARD_WORKERS)'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or settings.TELEGRAM_SHARD_WORKERS
+        if workers < 1:
+            self.stdout.write(self.style.ERROR('Set --workers or TELEGRAM_SHARD_WORKERS to at least 1'))
+            return
+        if workers != settings.TELEGRAM_SHARD_WORKERS:
+            self.stdout.write(self.style.WARNING(
+                f'Running {workers} workers but TELEGRAM_SHARD_WORKERS={settings.TELEGRAM_SHARD_WORKERS}; '
+                'the webhook must use the same shard count'
+            ))
+
+        # Spawn instead of fork so no threads or DB connections leak into the workers
+        context = multiprocessing.get_context('spawn')
+        processes = {}
+
+        def start(index):
+            process = context.Process(target=run_worker, args=(index,), name=f"shard-{index}", daemon=True)
+            process.start()
+            processes[index] = process
+            self.stdout.write(f'Started shard {index} (pid {process.pid})')
+
+        for index in range(workers):
+            start(index)
+
+        try:
+            while True:
+                time.sleep(1)
+                # Restart crashed workers, their chats stay on the same shard
+                for index, process in list(processes.items()):
+                    if not process.is_alive():
+                        self.stdout.write(self.style.WARNING(
+                            f'Shard {index} exited with code {process.exitcode}, restarting'
+                        ))
+                        start(index)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping shard workers')
+        finally:
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.join(timeout=5)
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+import json
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    """Accepts OTLP/HTTP JSON trace exports, like an OpenTelemetry collector's receiver."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != '/v1/traces':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        self.server.receive(body, payload)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+
+class Command(BaseCommand):
+    help = 'Runs a local OTLP/HTTP trace collector; set TRACE_OTLP_ENDPOINT to http://HOST:PORT/v1/traces'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=4318)
+        parser.add_argument('--output', help='Also append every received export to this JSON Lines file')
+        parser.add_argument('--quiet', action='store_true', help="Don't print received spans")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer((options['host'], options['port']), CollectorHandler)
+        lock = Lock()
+
+        def receive(body, payload):
+            with lock:
+                if options['output']:
+                    with open(options['output'], 'ab') as destination:
+                        destination.write(body.rstrip(b'\n') + b'\n')
+                if not options['quiet']:
+                    for resource in payload.get('resourceSpans', []):
+                        for scope in resource.get('scopeSpans', []):
+                            for span in scope.get('spans', []):
+                                self.print_span(span)
+
+        server.receive = receive
+        self.stdout.write(self.style.SUCCESS(
+            f"Trace collector listening on http://{options['host']}:{options['port']}/v1/traces"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+
+    def print_span(self, span):
+        duration = (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+        attributes = ' '.join(
+            f"{item['key']}={item['value'].get('stringValue')}" for item in span.get('attributes', [])
+        )
+        line = f"{span['traceId'][:8]} {span['name']:<32} {duration:9.2f} ms  {attributes}"
+        if span.get('status', {}).get('code') == 2:
+            line = self.style.ERROR(f"{line}  ({span['status'].get('message')})")
+        self.stdout.write(line)
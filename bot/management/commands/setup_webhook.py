@@ -1,25 +1,41 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from telegram import Bot
+from bot.views import set_main_menu_buttons
 import asyncio
+import re
+
+# What the Bot API accepts as a webhook secret_token
+SECRET_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,256}')
 
 class Command(BaseCommand):
     help = 'Sets up Telegram webhook'
 
     def handle(self, *args, **kwargs):
+        secret_token = settings.TELEGRAM_WEBHOOK_SECRET
+        if secret_token and not SECRET_TOKEN_PATTERN.fullmatch(secret_token):
+            raise CommandError('TELEGRAM_WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ and -')
+        if not secret_token:
+            self.stdout.write(self.style.WARNING(
+                'TELEGRAM_WEBHOOK_SECRET is not set, the webhook will accept requests from anyone'
+            ))
+
         async def setup():
-            bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
+            bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, base_url=settings.TELEGRAM_API_BASE_URL)
             webhook_url = f"{settings.TELEGRAM_WEBHOOK_URL}/{settings.TELEGRAM_WEBHOOK_PATH}"
             
             # Remove any existing webhook
             await bot.delete_webhook()
             
             # Set new webhook
-            success = await bot.set_webhook(url=webhook_url)
+            # Telegram sends the secret back in X-Telegram-Bot-Api-Secret-Token with every update
+            success = await bot.set_webhook(url=webhook_url, secret_token=secret_token)
             if success:
                 self.stdout.write(
                     self.style.SUCCESS(f'Successfully set webhook to {webhook_url}')
                 )
+                # One-time Bot API configuration, done per deployment instead of per worker
+                await set_main_menu_buttons(bot)
             else:
                 self.stdout.write(
                     self.style.ERROR('Failed to set webhook')
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from datetime import timedelta
+from bot.expiry import sweep_expired_deposits, ExpiryNotifier
+import time
+
+
+class Command(BaseCommand):
+    help = 'Marks pending deposits past their expiry as failed and tells their users (run it from cron or with --every)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Deposits expired per UPDATE')
+        parser.add_argument(
+            '--time-budget', type=float, default=60.0,
+            help='Stop starting new chunks after this many seconds; the rest waits for the next run'
+        )
+        parser.add_argument(
+            '--notify-within', type=float, default=24.0,
+            help='Only notify users of deposits that expired in the last HOURS (older backlog is swept silently)'
+        )
+        parser.add_argument('--no-notify', action='store_true', help="Don't message users")
+        parser.add_argument('--batch-size', type=int, default=25, help='Notices sent per batch')
+        parser.add_argument('--batch-interval', type=float, default=1.0, help='Minimum seconds between batches')
+        parser.add_argument('--every', type=float, help='Keep running, sweeping every SECONDS')
+
+    def handle(self, *args, **options):
+        notifier = None
+        if not options['no_notify']:
+            notifier = ExpiryNotifier(batch_size=options['batch_size'], batch_interval=options['batch_interval'])
+
+        try:
+            while True:
+                self.sweep(options, notifier)
+                if not options['every']:
+                    break
+                time.sleep(options['every'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping sweeper')
+        finally:
+            if notifier is not None:
+                # Users of already committed chunks still get their notice
+                notifier.close()
+                self.stdout.write(f"Notices sent: {notifier.sent}, failed: {notifier.failed}")
+
+    def sweep(self, options, notifier):
+        started = time.perf_counter()
+        expired = chunks = notices = 0
+        for chunk in sweep_expired_deposits(
+            chunk_size=options['chunk_size'],
+            time_budget=options['time_budget'],
+            notify_within=timedelta(hours=options['notify_within']),
+        ):
+            chunks += 1
+            expired += chunk.expired
+            if notifier is not None:
+                notifier.submit(chunk.notices)
+                notices += len(chunk.notices)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired} deposits in {chunks} chunks ({time.perf_counter() - started:.2f}s), "
+            f"{notices} users to notify"
+        ))
@@ -0,0 +1,49 @@
+from collections import Counter
+from threading import Lock
+import time
+
+# Process-local counters; every worker reports its own numbers
+counters = Counter()
+
+counters_lock = Lock()
+
+started_at = time.time()
+
+
+def increment(name, amount=1):
+    with counters_lock:
+        counters[name] += amount
+
+
+def snapshot(prefix=''):
+    """Copy of the counters whose name starts with prefix."""
+    with counters_lock:
+        return {name: value for name, value in counters.items() if name.startswith(prefix)}
+
+
+def reset():
+    with counters_lock:
+        counters.clear()
+
+
+def record_cache(name, hit):
+    increment(f"cache.{name}.{'hit' if hit else 'miss'}")
+
+
+def hit_rates():
+    """{cache name: (hits, misses, hit rate)} for every cache counted with record_cache()."""
+    values = snapshot('cache.')
+    rates = {}
+    for name in sorted({key.rsplit('.', 1)[0][len('cache.'):] for key in values}):
+        hits = values.get(f"cache.{name}.hit", 0)
+        misses = values.get(f"cache.{name}.miss", 0)
+        rates[name] = (hits, misses, hits / (hits + misses) if hits + misses else 0.0)
+    return rates
+
+
+def format_hit_rates():
+    lines = [
+        f"• {name}: {rate:.0%} ({hits} hits / {misses} misses)"
+        for name, (hits, misses, rate) in hit_rates().items()
+    ]
+    return "\n".join(lines) or "No cache reads yet."
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_withdrawalrequest_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('deposit', 'Deposit'), ('withdrawal', 'Withdrawal')], max_length=10)),
+                ('currency', models.CharField(max_length=10)),
+                ('status', models.CharField(max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('converted_amount', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('fee', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day', 'kind', 'currency', 'status'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyvolume',
+            constraint=models.UniqueConstraint(fields=('day', 'kind', 'currency', 'status'), name='unique_daily_volume_bucket'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_depositrequest_deposit_status_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100, unique=True)),
+                ('action', models.CharField(choices=[('withdrawal', 'Withdrawal'), ('deposit', 'Deposit')], max_length=20)),
+                ('is_used', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.telegramuser')),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='withdrawalrequest',
+            old_name='data',
+            new_name='transaction_id',
+        ),
+        migrations.RemoveField(
+            model_name='withdrawalrequest',
+            name='confirmed_at',
+        ),
+        migrations.RemoveField(
+            model_name='withdrawalrequest',
+            name='rejected_reason',
+        ),
+        migrations.RemoveField(
+            model_name='withdrawalrequest',
+            name='txn_hash',
+        ),
+        migrations.AddField(
+            model_name='withdrawalrequest',
+            name='fee',
+            field=models.DecimalField(decimal_places=8, default=Decimal('0'), max_digits=20),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='withdrawalrequest',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Completed', 'Completed'), ('Rejected', 'Rejected')], default='Completed', max_length=10),
+        ),
+    ]
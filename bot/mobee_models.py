@@ -0,0 +1,164 @@
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.utils.dateparse import parse_datetime
+from .decoding import loads
+
+
+class MobeeResponseError(ValueError):
+    """A Mobee answer that does not have the shape its model needs.
+
+    A ValueError, so the circuit breaker counts it like a truncated or non-JSON body.
+    """
+
+    def __init__(self, model, reason, field=None):
+        where = f"{model}.{field}" if field else model
+        super().__init__(f"Unexpected Mobee response for {where}: {reason}")
+        self.model = model
+        self.field = field
+        self.reason = reason
+
+
+def unwrap(raw, model):
+    """Decode a response body once and return its 'data' object."""
+    try:
+        payload = loads(raw)
+    except ValueError as e:
+        raise MobeeResponseError(model, f"body is not JSON ({e})")
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        raise MobeeResponseError(model, "body has no 'data' object")
+    return data
+
+
+def text(value):
+    if not isinstance(value, str) or not value:
+        raise TypeError("expected a non-empty string")
+    return value
+
+
+def identifier(value):
+    """Mobee ids arrive as strings or numbers, depending on the endpoint."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return text(value)
+
+
+def integer(value):
+    if isinstance(value, bool):
+        raise TypeError("expected an integer")
+    if isinstance(value, str) and not value.isdigit():
+        raise ValueError("expected an integer")
+    if not isinstance(value, (int, str)):
+        raise TypeError("expected an integer")
+    return int(value)
+
+
+def decimal(value):
+    # Amounts are strings on most endpoints; a float goes through str() to keep its short form
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError("expected a number")
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError("expected a number")
+    if not number.is_finite():
+        raise ValueError("expected a finite number")
+    return number
+
+
+def timestamp(value):
+    parsed = parse_datetime(text(value))
+    if parsed is None:
+        raise ValueError("expected an ISO 8601 datetime")
+    return parsed
+
+
+def field(data, model, name, convert, required=True):
+    """Read data[name] through convert; raises MobeeResponseError naming the field."""
+    value = data.get(name)
+    if value is None:
+        if required:
+            raise MobeeResponseError(model, "missing", name)
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError) as e:
+        raise MobeeResponseError(model, f"{e}, got {value!r}", name)
+
+
+@dataclass(slots=True, frozen=True)
+class FiatDeposit:
+    """A fiat deposit order, as POST /v1/wallets/fiat-deposits answers it."""
+
+    deposit_id: str
+    transaction_id: str
+    amount: Decimal
+    bank_code: str
+    account_name: str
+    account_number: str
+    expired_at: datetime
+
+    @classmethod
+    def from_bytes(cls, raw):
+        data = unwrap(raw, cls.__name__)
+        return cls(
+            deposit_id=field(data, cls.__name__, 'id', identifier),
+            transaction_id=field(data, cls.__name__, 'transaction_id', identifier),
+            amount=field(data, cls.__name__, 'amount', decimal),
+            bank_code=field(data, cls.__name__, 'bank_code', text),
+            account_name=field(data, cls.__name__, 'account_name', text),
+            account_number=field(data, cls.__name__, 'account_number', identifier),
+            expired_at=field(data, cls.__name__, 'expired_at', timestamp),
+        )
+
+    def model_kwargs(self):
+        """Fields of the DepositRequest that records this order."""
+        return {
+            'deposit_id': self.deposit_id,
+            'transaction_id': self.transaction_id,
+            'amount': self.amount,
+            'bank_code': self.bank_code,
+            'account_name': self.account_name,
+            'account_number': self.account_number,
+            'expired_at': self.expired_at,
+        }
+
+
+@dataclass(slots=True, frozen=True)
+class CryptoWithdrawal:
+    """A crypto withdrawal order, as POST /v1/wallets/crypto-withdrawals answers it."""
+
+    transaction_id: int
+    currency: str
+    amount: Decimal
+    fee: Decimal
+    address: str
+    network_name: str
+    explorer_url: str | None
+
+    @classmethod
+    def from_bytes(cls, raw):
+        data = unwrap(raw, cls.__name__)
+        return cls(
+            transaction_id=field(data, cls.__name__, 'id', integer),
+            currency=field(data, cls.__name__, 'currency', text),
+            amount=field(data, cls.__name__, 'amount', decimal),
+            fee=field(data, cls.__name__, 'fee', decimal),
+            address=field(data, cls.__name__, 'address', text),
+            network_name=field(data, cls.__name__, 'network_name', text),
+            # Only known once the transaction is broadcast
+            explorer_url=field(data, cls.__name__, 'explorer_url', text, required=False),
+        )
+
+    def model_kwargs(self):
+        """Fields of the WithdrawalRequest that records this order."""
+        return {
+            'transaction_id': self.transaction_id,
+            'currency': self.currency,
+            'amount': self.amount,
+            'fee': self.fee,
+            'address': self.address,
+            'network_name': self.network_name,
+            'explorer_url': self.explorer_url,
+        }
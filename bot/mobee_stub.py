@@ -0,0 +1,264 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import namedtuple, Counter
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Lock
+from urllib.parse import urlparse
+from django.conf import settings
+from .mobee_utils import generate_mobee_auth_headers
+import itertools
+import random
+import hmac
+import json
+import time
+import logging
+import sys
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Injected failures. Rates are per-request probabilities; a burst answers burst_length
+# requests in every burst_every with a 503; paths limits the faults to some endpoints.
+Faults = namedtuple('Faults', [
+    'latency', 'error_rate', 'burst_every', 'burst_length', 'timeout_rate', 'hang_seconds',
+    'malformed_rate', 'drip_rate', 'drip_seconds', 'paths',
+], defaults=[None, 0.0, 0, 0, 0.0, 60.0, 0.0, 0.0, 5.0, None])
+
+NO_FAULTS = Faults()
+
+DEFAULT_CURRENCIES = [
+    {"code": "IDR", "type": "fiat", "banks": ["BNI"], "min_deposit": "50000", "deposit_enabled": True},
+    {"code": "USDT", "type": "crypto", "networks": [
+        {"id": 12, "name": "BEP20", "min_withdrawal": "2.5", "withdrawal_fee": "1.5", "withdrawal_enabled": True},
+    ]},
+]
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a hung or dripping response are expected, not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def sample_latency(spec):
+    """Seconds of delay from a spec in milliseconds.
+
+    'fixed:MS', 'uniform:LOW,HIGH', 'exp:MEAN' or 'lognormal:MEDIAN,SIGMA'
+    (lognormal gives the long tail real APIs have).
+    """
+    kind, _, values = spec.partition(':')
+    numbers = [float(value) for value in values.split(',') if value]
+    if kind == 'fixed':
+        delay = numbers[0]
+    elif kind == 'uniform':
+        delay = random.uniform(numbers[0], numbers[1])
+    elif kind == 'exp':
+        delay = random.expovariate(1 / numbers[0])
+    elif kind == 'lognormal':
+        delay = numbers[0] * random.lognormvariate(0, numbers[1])
+    else:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return delay / 1000
+
+
+class MobeeStubHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Mobee open API that checks our HMAC headers."""
+
+    server_version = "MobeeStub/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("Mobee stub: " + format, *args)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length).decode('utf-8') if length else None
+
+    def _authorized(self, body):
+        """Recompute the signature the way generate_mobee_auth_headers does."""
+        timestamp = self.headers.get('X-Request-Timestamp')
+        signature = self.headers.get('X-Request-Signature') or ''
+        if self.headers.get('X-API-Key') != settings.MOBEE_API_KEY or not timestamp:
+            return False
+
+        expected = generate_mobee_auth_headers(self.command, self.path, body, timestamp=timestamp)
+        return hmac.compare_digest(expected['X-Request-Signature'], signature)
+
+    def _send_json(self, status, payload, malformed=False, drip_seconds=0):
+        body = json.dumps(payload).encode('utf-8')
+        if malformed:
+            # Cut mid-document, as a proxy or a crashing upstream would
+            body = body[:max(1, len(body) // 2)]
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not drip_seconds:
+            self.wfile.write(body)
+            return
+        # Slow drip: every byte arrives well within a read timeout, the whole body does not
+        pause = drip_seconds / len(body)
+        for index in range(len(body)):
+            self.wfile.write(body[index:index + 1])
+            self.wfile.flush()
+            time.sleep(pause)
+
+    def _dispatch(self):
+        body = self._read_body()
+        if not self._authorized(body):
+            return self._send_json(401, {"error": "invalid signature"})
+
+        path = urlparse(self.path).path
+        route = self.server.routes.get((self.command, path))
+        if route is None:
+            return self._send_json(404, {"error": "not found"})
+
+        faults = self.server.faults
+        if faults.paths is not None and path not in faults.paths:
+            faults = NO_FAULTS
+        number = next(self.server.request_numbers)
+
+        if faults.latency:
+            time.sleep(sample_latency(faults.latency))
+        if random.random() < faults.timeout_rate:
+            self.server.count('timeout')
+            time.sleep(faults.hang_seconds)
+            return
+        if faults.burst_every and number % faults.burst_every < faults.burst_length:
+            self.server.count('burst')
+            return self._send_json(503, {"error": "service unavailable"})
+        if random.random() < faults.error_rate:
+            self.server.count('error')
+            return self._send_json(random.choice([500, 502, 503]), {"error": "upstream error"})
+
+        status, payload = route(self.server, json.loads(body) if body else None, self.headers)
+        malformed = random.random() < faults.malformed_rate
+        drip = random.random() < faults.drip_rate
+        self.server.count('malformed' if malformed else 'drip' if drip else 'ok')
+        self._send_json(status, payload, malformed=malformed, drip_seconds=faults.drip_seconds if drip else 0)
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+
+def wallet_balances(server, body, headers):
+    return 200, {"data": [
+        {"currency": currency, "available": str(amount), "locked": "0"}
+        for currency, amount in server.balances.items()
+    ]}
+
+
+def currencies(server, body, headers):
+    return 200, {"data": server.currencies}
+
+
+def _idempotent(server, headers, create):
+    """Replay the first answer for a repeated Idempotency-Key, as Mobee does."""
+    key = headers.get('Idempotency-Key')
+    with server.lock:
+        if key and key in server.orders:
+            return server.orders[key]
+        response = create(next(server.order_ids))
+        if key:
+            server.orders[key] = response
+        return response
+
+
+def fiat_deposit(server, body, headers):
+    if not body or not body.get('amount') or not body.get('bank_code'):
+        return 422, {"error": "amount and bank_code are required"}
+
+    def create(order_id):
+        expired_at = datetime.now(timezone.utc) + timedelta(hours=24)
+        return 200, {"data": {
+            "id": f"dep-{order_id}",
+            "transaction_id": f"TXD{order_id:010d}",
+            "amount": body['amount'],
+            "bank_code": body['bank_code'],
+            "account_name": "MOBEE STUB",
+            "account_number": f"8808{order_id:08d}",
+            "expired_at": expired_at.isoformat(),
+            "status": "pending",
+        }}
+    return _idempotent(server, headers, create)
+
+
+def crypto_withdrawal(server, body, headers):
+    if not body or not body.get('amount') or not body.get('address'):
+        return 422, {"error": "amount and address are required"}
+
+    def create(order_id):
+        return 200, {"data": {
+            "id": order_id,
+            "currency": body.get('currency'),
+            "amount": str(body['amount']),
+            "fee": "1.5",
+            "address": body['address'],
+            "network_name": "BEP20",
+            "explorer_url": f"https://bscscan.com/tx/0x{order_id:064x}",
+            "status": "pending",
+        }}
+    return _idempotent(server, headers, create)
+
+
+class MobeeStub:
+    """Runs the stub in a background thread; point MOBEE_API_BASE_URL at .url to use it.
+
+    Assign .faults at any time to change the injected failures.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, balances=None, faults=NO_FAULTS):
+        self.server = StubServer((host, port), MobeeStubHandler)
+        self.server.balances = dict(balances or {})
+        self.server.currencies = DEFAULT_CURRENCIES
+        self.server.faults = faults
+        self.server.lock = Lock()
+        self.server.orders = {}
+        self.server.order_ids = itertools.count(1)
+        self.server.request_numbers = itertools.count()
+        self.server.outcomes = Counter()
+        self.server.count = self._count
+        self.server.routes = {
+            ('GET', '/v1/wallets/balances'): wallet_balances,
+            ('GET', '/v1/currencies'): currencies,
+            ('POST', '/v1/wallets/fiat-deposits'): fiat_deposit,
+            ('POST', '/v1/wallets/crypto-withdrawals'): crypto_withdrawal,
+        }
+        self._thread = None
+
+    def _count(self, outcome):
+        with self.server.lock:
+            self.server.outcomes[outcome] += 1
+
+    @property
+    def faults(self):
+        return self.server.faults
+
+    @faults.setter
+    def faults(self, faults):
+        self.server.faults = faults
+
+    @property
+    def outcomes(self):
+        return self.server.outcomes
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = Thread(target=self.server.serve_forever, name="mobee-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
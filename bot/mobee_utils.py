@@ -3,19 +3,27 @@ import hashlib
 import base64
 import time
 import requests
+import urllib3
+import socket
 import json
+import asyncio
+import weakref
+import httpx
 from django.conf import settings
 from asgiref.sync import sync_to_async
 from urllib.parse import urlparse
 import logging
 from .utils import get_user_balance
+from .tracing import span
+from .resilience import mobee_guard, amobee_guard, MobeeUnavailable
+from .mobee_models import FiatDeposit, CryptoWithdrawal, MobeeResponseError
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def generate_mobee_auth_headers(method, url, body=None):
-    # Generate timestamp
-    timestamp = str(int(time.time()))
+def generate_mobee_auth_headers(method, url, body=None, timestamp=None):
+    # Generate timestamp (a given one is only used to verify received signatures)
+    timestamp = timestamp or str(int(time.time()))
     
     # Get URL path
     path = urlparse(url).path
@@ -43,44 +51,157 @@ def generate_mobee_auth_headers(method, url, body=None):
     return headers
 
 
-def createFiatDeposit(amount, bank_code):
-    url = "https://open-api.mobee.io/v1/wallets/fiat-deposits"
+def send_mobee_request(method, url, headers, body=None):
+    """Send a signed request to Mobee, timed as a span of the current trace.
+
+    Connect and read timeouts bound each socket operation; MOBEE_TOTAL_TIMEOUT also
+    stops a response that trickles in a few bytes at a time.
+    """
+    deadline = time.monotonic() + settings.MOBEE_TOTAL_TIMEOUT
+    with span('mobee.request', method=method, path=urlparse(url).path) as mobee_span:
+        response = requests.request(
+            method, url, headers=headers, data=body, stream=True,
+            timeout=(settings.MOBEE_CONNECT_TIMEOUT, settings.MOBEE_READ_TIMEOUT),
+        )
+        mobee_span.set(status_code=response.status_code)
+        try:
+            chunks = []
+            while True:
+                # read1 returns what one socket read gives, so the deadline is checked as data arrives;
+                # decoded, as response.content would be for a gzipped reply
+                chunk = response.raw.read1(64 * 1024, decode_content=True)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if time.monotonic() > deadline:
+                    raise requests.Timeout(f"Mobee response took longer than {settings.MOBEE_TOTAL_TIMEOUT}s")
+            response._content = b''.join(chunks)
+        except (urllib3.exceptions.ReadTimeoutError, socket.timeout) as e:
+            raise requests.Timeout(str(e))
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.ConnectionError(str(e))
+        except urllib3.exceptions.DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(str(e))
+        finally:
+            response.close()
+        return response
+
+
+# httpx clients must stay on the event loop they were first used on, so each loop
+# (the bot loop, or the ASGI server's) gets one pooled client of its own
+async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.MOBEE_READ_TIMEOUT, connect=settings.MOBEE_CONNECT_TIMEOUT)
+        )
+        async_clients[loop] = client
+    return client
+
+
+async def asend_mobee_request(method, url, headers, body=None):
+    """send_mobee_request() without blocking the event loop.
+
+    Failures surface as the same requests exceptions, including HTTPError for an
+    error status, so callers and the circuit breakers treat both clients alike.
+    """
+    with span('mobee.request', method=method, path=urlparse(url).path) as mobee_span:
+        try:
+            async with asyncio.timeout(settings.MOBEE_TOTAL_TIMEOUT):
+                response = await get_async_client().request(method, url, headers=headers, content=body)
+        except (TimeoutError, httpx.TimeoutException) as e:
+            raise requests.Timeout(str(e) or f"Mobee response took longer than {settings.MOBEE_TOTAL_TIMEOUT}s")
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+        mobee_span.set(status_code=response.status_code)
+        if response.is_error:
+            raise requests.HTTPError(f"{response.status_code} Error for url: {url}", response=response)
+        return response
+
+
+def fiat_deposit_request(amount, bank_code, idempotency_key=None):
+    """URL, signed headers and JSON body of a fiat deposit request."""
+    url = f"{settings.MOBEE_API_BASE_URL}/v1/wallets/fiat-deposits"
     method = "POST"
 
     body = {
         "amount": amount,
         "bank_code": bank_code
     }
-    print(f"Request body: {body}")
     body_json = json.dumps(body, separators=(',', ':'))
-    print(f"Request body JSON: {body_json}")
+    logger.debug("Mobee fiat deposit request: %s", body_json)
     # Generate headers
     headers = generate_mobee_auth_headers(method, url, body_json)
     headers["Content-Type"] = "application/json"
     headers["accept"] = "application/json"
-    print(f"Request headers: {headers}")
-    
+    if idempotency_key:
+        # Lets Mobee collapse retries of the same deposit into one order
+        headers["Idempotency-Key"] = idempotency_key
+    return url, headers, body_json
+
+
+def createFiatDeposit(amount, bank_code, idempotency_key=None):
+    url, headers, body_json = fiat_deposit_request(amount, bank_code, idempotency_key)
+
     try:
-        # Make the POST request
-        response = requests.post(url, headers=headers, data=body_json)
-        
-        # Check if request was successful
-        response.raise_for_status()
-        
-        # Return JSON response
-        logger.info(f"Response from Mobee: {response.json()}")
-        return response.json()
-    
+        with mobee_guard('deposit'):
+            # Make the POST request
+            response = send_mobee_request("POST", url, headers, body_json)
+
+            # Check if request was successful
+            response.raise_for_status()
+
+            # Parsed and validated once, straight from the body bytes
+            order = FiatDeposit.from_bytes(response.content)
+            logger.info("Response from Mobee: %s", order)
+            return order
+
+    except MobeeUnavailable as e:
+        logger.warning("Skipped Mobee call: %s", e)
+        raise
+    except MobeeResponseError as e:
+        logger.error("%s", e)
+        raise
     except requests.HTTPError as e:
-        print(f"HTTP Error: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP Error: %s - %s", e.response.status_code, e.response.text)
         raise
     except requests.RequestException as e:
-        print(f"Request failed: {str(e)}")
+        logger.error("Request failed: %s", e)
         raise
 
 
-def createCryptoWithdrawal(currency, amount, address, network_id):
-    url = "https://open-api.mobee.io/v1/wallets/crypto-withdrawals"
+async def acreateFiatDeposit(amount, bank_code, idempotency_key=None):
+    """createFiatDeposit() for async views and handlers."""
+    url, headers, body_json = fiat_deposit_request(amount, bank_code, idempotency_key)
+
+    try:
+        async with amobee_guard('deposit'):
+            response = await asend_mobee_request("POST", url, headers, body_json)
+            order = FiatDeposit.from_bytes(response.content)
+            logger.info("Response from Mobee: %s", order)
+            return order
+
+    except MobeeUnavailable as e:
+        logger.warning("Skipped Mobee call: %s", e)
+        raise
+    except MobeeResponseError as e:
+        logger.error("%s", e)
+        raise
+    except requests.HTTPError as e:
+        logger.error("HTTP Error: %s - %s", e.response.status_code, e.response.text)
+        raise
+    except requests.RequestException as e:
+        logger.error("Request failed: %s", e)
+        raise
+
+
+def crypto_withdrawal_request(currency, amount, address, network_id, idempotency_key=None):
+    """URL, signed headers and JSON body of a crypto withdrawal request."""
+    url = f"{settings.MOBEE_API_BASE_URL}/v1/wallets/crypto-withdrawals"
     method = "POST"
 
     # Construct the request body
@@ -98,21 +219,114 @@ def createCryptoWithdrawal(currency, amount, address, network_id):
     headers = generate_mobee_auth_headers(method, url, body_json)
     headers["Content-Type"] = "application/json"
     headers["accept"] = "application/json"
-    
+    if idempotency_key:
+        # Lets Mobee collapse retries of the same withdrawal into one order
+        headers["Idempotency-Key"] = idempotency_key
+    return url, headers, body_json
+
+
+def createCryptoWithdrawal(currency, amount, address, network_id, idempotency_key=None):
+    url, headers, body_json = crypto_withdrawal_request(currency, amount, address, network_id, idempotency_key)
+
     try:
-        # Make the POST request
-        response = requests.post(url, headers=headers, data=body_json)
-        
-        # Check if request was successful
-        response.raise_for_status()
-        
-        # Log and return JSON response
-        logger.info(f"Response from Mobee: {response.json()}")
-        return response.json()
-    
+        with mobee_guard('withdrawal'):
+            # Make the POST request
+            response = send_mobee_request("POST", url, headers, body_json)
+
+            # Check if request was successful
+            response.raise_for_status()
+
+            # Parsed and validated once, straight from the body bytes
+            order = CryptoWithdrawal.from_bytes(response.content)
+            logger.info("Response from Mobee: %s", order)
+            return order
+
+    except MobeeUnavailable as e:
+        logger.warning("Skipped Mobee call: %s", e)
+        raise
+    except MobeeResponseError as e:
+        logger.error("%s", e)
+        raise
+    except requests.HTTPError as e:
+        logger.error("HTTP Error: %s - %s", e.response.status_code, e.response.text)
+        raise
+    except requests.RequestException as e:
+        logger.error("Request failed: %s", e)
+        raise
+
+
+async def acreateCryptoWithdrawal(currency, amount, address, network_id, idempotency_key=None):
+    """createCryptoWithdrawal() for async views and handlers."""
+    url, headers, body_json = crypto_withdrawal_request(currency, amount, address, network_id, idempotency_key)
+
+    try:
+        async with amobee_guard('withdrawal'):
+            response = await asend_mobee_request("POST", url, headers, body_json)
+            order = CryptoWithdrawal.from_bytes(response.content)
+            logger.info("Response from Mobee: %s", order)
+            return order
+
+    except MobeeUnavailable as e:
+        logger.warning("Skipped Mobee call: %s", e)
+        raise
+    except MobeeResponseError as e:
+        logger.error("%s", e)
+        raise
+    except requests.HTTPError as e:
+        logger.error("HTTP Error: %s - %s", e.response.status_code, e.response.text)
+        raise
+    except requests.RequestException as e:
+        logger.error("Request failed: %s", e)
+        raise
+
+
+def getCurrencies():
+    """Fetch the currencies, networks, fees and limits Mobee supports."""
+    url = f"{settings.MOBEE_API_BASE_URL}/v1/currencies"
+    method = "GET"
+
+    # Generate headers
+    headers = generate_mobee_auth_headers(method, url)
+    headers["accept"] = "application/json"
+
+    try:
+        with mobee_guard('currencies'):
+            response = send_mobee_request(method, url, headers)
+            response.raise_for_status()
+            return response.json()
+
+    except MobeeUnavailable as e:
+        logger.warning("Skipped Mobee call: %s", e)
+        raise
+    except requests.HTTPError as e:
+        logger.error("HTTP Error: %s - %s", e.response.status_code, e.response.text)
+        raise
+    except requests.RequestException as e:
+        logger.error("Request failed: %s", e)
+        raise
+
+
+def getWalletBalances():
+    """Fetch the balances held in our Mobee wallet, per currency."""
+    url = f"{settings.MOBEE_API_BASE_URL}/v1/wallets/balances"
+    method = "GET"
+
+    # Generate headers
+    headers = generate_mobee_auth_headers(method, url)
+    headers["accept"] = "application/json"
+
+    try:
+        with mobee_guard('balances'):
+            response = send_mobee_request(method, url, headers)
+            response.raise_for_status()
+            return response.json()
+
+    except MobeeUnavailable as e:
+        logger.warning("Skipped Mobee call: %s", e)
+        raise
     except requests.HTTPError as e:
-        logger.error(f"HTTP Error: {e.response.status_code} - {e.response.text}")
+        logger.error("HTTP Error: %s - %s", e.response.status_code, e.response.text)
         raise
     except requests.RequestException as e:
-        logger.error(f"Request failed: {str(e)}")
+        logger.error("Request failed: %s", e)
         raise
@@ -36,6 +36,12 @@ class DepositRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Pending deposits by expiry, for the expiry sweeper
+            models.Index(fields=['status', 'expired_at'], name='deposit_status_expiry_idx'),
+        ]
+
     def __str__(self):
         return f"Deposit Request of {self.amount} for {self.user.username}"
 
@@ -79,4 +85,30 @@ class ActionToken(models.Model):
         return self.is_used
 
     def __str__(self):
-        return f"Token for {self.user.username} - {self.action} - {'Used' if self.is_used else 'Valid'}"
\ No newline at end of file
+        return f"Token for {self.user.username} - {self.action} - {'Used' if self.is_used else 'Valid'}"
+
+class DailyVolume(models.Model):
+    """Per-day totals of requests by currency and status, kept up to date by signals."""
+    KIND_CHOICES = [
+        ('deposit', 'Deposit'),
+        ('withdrawal', 'Withdrawal'),
+    ]
+
+    day = models.DateField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    currency = models.CharField(max_length=10)
+    status = models.CharField(max_length=10)
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=28, decimal_places=8, default=0)
+    converted_amount = models.DecimalField(max_digits=28, decimal_places=8, default=0)  # USDT credited for deposits
+    fee = models.DecimalField(max_digits=28, decimal_places=8, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'kind', 'currency', 'status'], name='unique_daily_volume_bucket'),
+        ]
+        ordering = ['-day', 'kind', 'currency', 'status']
+
+    def __str__(self):
+        return f"{self.day} {self.kind} {self.currency} {self.status}: {self.count}"
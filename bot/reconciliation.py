@@ -0,0 +1,162 @@
+try:
+    import numpy as np
+except ImportError:  # optional, a pure-Python columnar fallback is used without it
+    np = None
+from array import array
+from collections import namedtuple
+from django.db import connections
+from django.db.models import FloatField, IntegerField, Value
+from django.db.models.functions import Cast, Coalesce
+from .models import TelegramUser, DepositRequest, WithdrawalRequest
+
+RECONCILE_CHUNK_SIZE = 20000
+
+# One user whose stored balance differs from what the ledger rows add up to
+Discrepancy = namedtuple('Discrepancy', ['telegram_id', 'balance', 'expected', 'difference'])
+
+Report = namedtuple('Report', [
+    'users', 'total_balance', 'total_credits', 'total_debits', 'pending_withdrawals',
+    'expected_wallet', 'wallet_balance', 'wallet_difference', 'discrepancies',
+])
+
+
+def _float(field):
+    return Coalesce(Cast(field, FloatField()), Value(0.0), output_field=FloatField())
+
+
+def _int(field):
+    return Coalesce(field, Value(0), output_field=IntegerField())
+
+
+def fetch_columns(queryset, typecodes, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Run a values_list() queryset on a raw cursor and return one typed array per column.
+
+    Rows are transposed per fetchmany() batch, so no model instances or per-row
+    dicts are created and memory is a few bytes per value.
+    """
+    sql, params = queryset.query.sql_with_params()
+    columns = [array(code) for code in typecodes]
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+    return columns
+
+
+def load_ledger(currency='USDT', chunk_size=RECONCILE_CHUNK_SIZE):
+    """Columnar snapshot of balances and of the request rows that should explain them."""
+    users = TelegramUser.objects.order_by('pk').annotate(
+        _telegram_id=_int('telegram_id'), _balance=_float('balance'),
+    ).values_list('pk', '_telegram_id', '_balance')
+
+    credits = DepositRequest.objects.filter(status='completed').annotate(
+        _amount=_float('converted_amount'),
+    ).values_list('user_id', '_amount')
+
+    debits = WithdrawalRequest.objects.filter(user__isnull=False, currency=currency).exclude(
+        status='Rejected',
+    ).annotate(
+        _amount=_float('amount'), _fee=_float('fee'),
+    ).values_list('user_id', '_amount', '_fee')
+
+    pending = WithdrawalRequest.objects.filter(currency=currency, status='Pending').annotate(
+        _amount=_float('amount'),
+    ).values_list('_amount')
+
+    return {
+        'users': fetch_columns(users, 'qqd', chunk_size),
+        'credits': fetch_columns(credits, 'qd', chunk_size),
+        'debits': fetch_columns(debits, 'qdd', chunk_size),
+        'pending': fetch_columns(pending, 'd', chunk_size)[0],
+    }
+
+
+def _per_user_numpy(user_ids, row_user_ids, amounts):
+    """Sum amounts per user with one searchsorted and one bincount."""
+    user_ids = np.frombuffer(user_ids, dtype=np.int64)
+    row_user_ids = np.frombuffer(row_user_ids, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if not len(user_ids) or not len(row_user_ids):
+        return np.zeros(len(user_ids))
+    index = np.searchsorted(user_ids, row_user_ids)
+    index = np.clip(index, 0, len(user_ids) - 1)
+    known = user_ids[index] == row_user_ids
+    return np.bincount(index[known], weights=amounts[known], minlength=len(user_ids))
+
+
+def _per_user_python(user_ids, row_user_ids, amounts):
+    position = {user_id: index for index, user_id in enumerate(user_ids)}
+    totals = array('d', bytes(8 * len(user_ids)))
+    for user_id, amount in zip(row_user_ids, amounts):
+        index = position.get(user_id)
+        if index is not None:
+            totals[index] += amount
+    return totals
+
+
+def reconcile(ledger, wallet_balance=None, tolerance=0.01):
+    """Compare each balance with completed deposits minus withdrawals, and the total with the wallet.
+
+    Withdrawals debit amount + fee; a pending withdrawal is already debited from the
+    user but still held by the wallet, so it is added to the expected wallet total.
+    """
+    user_ids, telegram_ids, balances = ledger['users']
+    credit_users, credit_amounts = ledger['credits']
+    debit_users, debit_amounts, debit_fees = ledger['debits']
+
+    if np is not None:
+        balance_values = np.frombuffer(balances, dtype=np.float64)
+        debit_totals = np.frombuffer(debit_amounts, dtype=np.float64) + np.frombuffer(debit_fees, dtype=np.float64)
+        credited = _per_user_numpy(user_ids, credit_users, np.frombuffer(credit_amounts, dtype=np.float64))
+        debited = _per_user_numpy(user_ids, debit_users, debit_totals)
+        expected = credited - debited
+        difference = balance_values - expected
+        flagged = np.flatnonzero(np.abs(difference) > tolerance)
+        flagged = flagged[np.argsort(-np.abs(difference[flagged]), kind='stable')]
+        total_balance = float(balance_values.sum())
+        total_credits = float(credited.sum())
+        total_debits = float(debited.sum())
+        pending_withdrawals = float(np.frombuffer(ledger['pending'], dtype=np.float64).sum())
+        discrepancies = [
+            Discrepancy(int(telegram_ids[i]), float(balance_values[i]), float(expected[i]), float(difference[i]))
+            for i in flagged
+        ]
+    else:
+        debit_totals = [amount + fee for amount, fee in zip(debit_amounts, debit_fees)]
+        credited = _per_user_python(user_ids, credit_users, credit_amounts)
+        debited = _per_user_python(user_ids, debit_users, debit_totals)
+        discrepancies = []
+        for i, balance in enumerate(balances):
+            expected = credited[i] - debited[i]
+            if abs(balance - expected) > tolerance:
+                discrepancies.append(Discrepancy(telegram_ids[i], balance, expected, balance - expected))
+        discrepancies.sort(key=lambda item: -abs(item.difference))
+        total_balance = sum(balances)
+        total_credits = sum(credited)
+        total_debits = sum(debited)
+        pending_withdrawals = sum(ledger['pending'])
+
+    expected_wallet = total_balance + pending_withdrawals
+    return Report(
+        users=len(user_ids),
+        total_balance=total_balance,
+        total_credits=total_credits,
+        total_debits=total_debits,
+        pending_withdrawals=pending_withdrawals,
+        expected_wallet=expected_wallet,
+        wallet_balance=wallet_balance,
+        wallet_difference=None if wallet_balance is None else wallet_balance - expected_wallet,
+        discrepancies=discrepancies,
+    )
+
+
+def wallet_balance_from_response(payload, currency='USDT'):
+    """Total (available + locked) of one currency from Mobee's wallet balances response."""
+    for entry in payload['data']:
+        if entry['currency'].upper() == currency:
+            return float(entry.get('available') or 0) + float(entry.get('locked') or 0)
+    return 0.0
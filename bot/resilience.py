@@ -0,0 +1,297 @@
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from threading import Lock, BoundedSemaphore
+from django.conf import settings
+from . import metrics
+import requests
+import asyncio
+import logging
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class MobeeUnavailable(Exception):
+    """Raised instead of calling Mobee while its circuit is open or its bulkhead is full."""
+
+    def __init__(self, operation, reason, retry_after=None):
+        super().__init__(f"Mobee {operation} unavailable: {reason}")
+        self.operation = operation
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_failure(error):
+    """Whether an error says Mobee is unhealthy; our own 4xx mistakes do not count."""
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 500
+        return status >= 500 or status == 429
+    # ValueError covers a truncated or non-JSON body
+    return isinstance(error, (requests.RequestException, ValueError))
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over the last `window` calls of one Mobee endpoint.
+
+    Opens when at least `min_calls` calls were seen and the share of failures or of
+    calls slower than `slow_seconds` reaches its threshold. After `open_seconds`,
+    `half_open_calls` trial calls decide whether it closes again.
+    """
+
+    def __init__(self, name, window, min_calls, error_rate, slow_seconds, slow_rate, open_seconds, half_open_calls):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._calls = deque(maxlen=window)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self._generation = 0  # bumped on every transition, tells a call which state it started in
+        self._lock = Lock()
+
+    def retry_after(self):
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allows(self):
+        """Cheap check for callers that want to answer early; does not take a trial slot."""
+        return self.state != OPEN or self.retry_after() == 0
+
+    def _transition(self, state):
+        logger.warning("Mobee circuit %s: %s -> %s", self.name, self.state, state)
+        metrics.increment(f"mobee.breaker.{self.name}.{state}")
+        self.state = state
+        self._generation += 1
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._calls.clear()
+        elif state == HALF_OPEN:
+            self._trials = self._trial_successes = 0
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                if self.retry_after() > 0:
+                    metrics.increment(f"mobee.breaker.{self.name}.rejected")
+                    raise MobeeUnavailable(self.name, 'circuit open', self.retry_after())
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    metrics.increment(f"mobee.breaker.{self.name}.rejected")
+                    raise MobeeUnavailable(self.name, 'circuit half-open', self.open_seconds)
+                self._trials += 1
+            return self._generation
+
+    def record(self, failed, duration, generation):
+        """Count the outcome of a call that before_call() returned generation for."""
+        slow = duration >= self.slow_seconds
+        metrics.increment(f"mobee.breaker.{self.name}.{'failure' if failed else 'success'}")
+        with self._lock:
+            if generation != self._generation:
+                # The call started before the circuit last changed state, e.g. a success
+                # from before it opened must not count as a half-open trial
+                return
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self._transition(CLOSED)
+                return
+            self._calls.append((failed, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for call_failed, call_slow in self._calls if call_failed)
+            slow_calls = sum(1 for call_failed, call_slow in self._calls if call_slow)
+            if failures / len(self._calls) >= self.error_rate or slow_calls / len(self._calls) >= self.slow_rate:
+                self._transition(OPEN)
+
+    def abandon(self, generation):
+        """Give back the trial slot of a call that ended without an outcome."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._generation == generation:
+                self._trials -= 1
+
+    @contextmanager
+    def call(self):
+        generation = self.before_call()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record(is_failure(e), time.monotonic() - started, generation)
+            raise
+        except BaseException:
+            # Cancelled or closed: says nothing about Mobee, but a half-open
+            # circuit would otherwise wait for this trial forever
+            self.abandon(generation)
+            raise
+        self.record(False, time.monotonic() - started, generation)
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'error_rate': round(sum(1 for failed, slow in self._calls if failed) / calls, 4) if calls else 0.0,
+                'slow_rate': round(sum(1 for failed, slow in self._calls if slow) / calls, 4) if calls else 0.0,
+                'retry_after': round(self.retry_after(), 1) if self.state == OPEN else 0.0,
+            }
+
+
+class Bulkhead:
+    """Caps concurrent Mobee calls of one kind so they cannot tie up every worker thread."""
+
+    def __init__(self, name, limit, wait):
+        self.name = name
+        self.limit = limit
+        self.wait = wait
+        self.in_use = 0
+        self._slots = BoundedSemaphore(limit)
+        self._lock = Lock()
+
+    @contextmanager
+    def hold(self):
+        if not self._slots.acquire(timeout=self.wait):
+            metrics.increment(f"mobee.bulkhead.{self.name}.rejected")
+            raise MobeeUnavailable(self.name, 'too many requests in flight')
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def ahold(self):
+        """hold() for coroutines: waits for a slot without blocking the event loop."""
+        deadline = time.monotonic() + self.wait
+        # Polls the same semaphore, so sync and async callers share the limit
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                metrics.increment(f"mobee.bulkhead.{self.name}.rejected")
+                raise MobeeUnavailable(self.name, 'too many requests in flight')
+            await asyncio.sleep(0.01)
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {'in_use': self.in_use, 'limit': self.limit}
+
+
+# Per worker process, like the metrics they report to
+breakers = {}
+
+bulkheads = {}
+
+registry_lock = Lock()
+
+
+def get_breaker(operation):
+    with registry_lock:
+        if operation not in breakers:
+            breakers[operation] = CircuitBreaker(
+                operation,
+                window=settings.MOBEE_BREAKER_WINDOW,
+                min_calls=settings.MOBEE_BREAKER_MIN_CALLS,
+                error_rate=settings.MOBEE_BREAKER_ERROR_RATE,
+                slow_seconds=settings.MOBEE_BREAKER_SLOW_SECONDS,
+                slow_rate=settings.MOBEE_BREAKER_SLOW_RATE,
+                open_seconds=settings.MOBEE_BREAKER_OPEN_SECONDS,
+                half_open_calls=settings.MOBEE_BREAKER_HALF_OPEN_CALLS,
+            )
+        return breakers[operation]
+
+
+def get_bulkhead(operation):
+    """The bulkhead of an operation listed in MOBEE_BULKHEADS, otherwise None."""
+    limit = settings.MOBEE_BULKHEADS.get(operation)
+    if limit is None:
+        return None
+    with registry_lock:
+        if operation not in bulkheads:
+            bulkheads[operation] = Bulkhead(operation, int(limit), settings.MOBEE_BULKHEAD_WAIT)
+        return bulkheads[operation]
+
+
+def mobee_available(operation):
+    """False while the operation's circuit is open, so callers can answer right away."""
+    return get_breaker(operation).allows()
+
+
+@contextmanager
+def mobee_guard(operation):
+    """Run one Mobee call under the operation's circuit breaker and bulkhead.
+
+    Raises MobeeUnavailable without calling Mobee when either refuses the call.
+    """
+    breaker = get_breaker(operation)
+    if not breaker.allows():
+        # Fail fast before queueing for a bulkhead slot
+        breaker.before_call()
+    bulkhead = get_bulkhead(operation)
+    if bulkhead is None:
+        with breaker.call():
+            yield
+        return
+    with bulkhead.hold(), breaker.call():
+        yield
+
+
+@asynccontextmanager
+async def amobee_guard(operation):
+    """mobee_guard() for calls made from coroutines."""
+    breaker = get_breaker(operation)
+    if not breaker.allows():
+        breaker.before_call()
+    bulkhead = get_bulkhead(operation)
+    if bulkhead is None:
+        with breaker.call():
+            yield
+        return
+    async with bulkhead.ahold():
+        with breaker.call():
+            yield
+
+
+def resilience_stats():
+    """{'circuit_breakers': {...}, 'bulkheads': {...}} for the metrics endpoint."""
+    with registry_lock:
+        current_breakers = dict(breakers)
+        current_bulkheads = dict(bulkheads)
+    return {
+        'circuit_breakers': {name: breaker.stats() for name, breaker in sorted(current_breakers.items())},
+        'bulkheads': {name: bulkhead.stats() for name, bulkhead in sorted(current_bulkheads.items())},
+    }
+
+
+def format_breakers():
+    lines = []
+    for name, stats in resilience_stats()['circuit_breakers'].items():
+        if stats['state'] == OPEN:
+            lines.append(f"• {name}: open, retrying in {stats['retry_after']:.0f}s")
+        else:
+            lines.append(
+                f"• {name}: {stats['state'].replace('_', '-')} ({stats['error_rate']:.0%} errors, "
+                f"{stats['slow_rate']:.0%} slow of {stats['calls']} calls)"
+            )
+    return "\n".join(lines) or "No Mobee calls yet."
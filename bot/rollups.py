@@ -0,0 +1,140 @@
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value, DecimalField
+from django.db.models.functions import TruncDate, Coalesce, Cast
+from django.utils import timezone
+from .models import DailyVolume, DepositRequest, WithdrawalRequest
+
+# DepositRequest has no currency column, every deposit is a fiat IDR deposit
+DEPOSIT_CURRENCY = "IDR"
+
+ZERO = Decimal(0)
+
+
+def _decimal(value):
+    return Decimal(str(value)) if value is not None else ZERO
+
+
+def rollup_values(instance):
+    """Bucket key and totals of one request: (kind, currency, status, amount, converted_amount, fee)."""
+    if isinstance(instance, DepositRequest):
+        return ('deposit', DEPOSIT_CURRENCY, instance.status,
+                _decimal(instance.amount), _decimal(instance.converted_amount), ZERO)
+    return ('withdrawal', instance.currency, instance.status,
+            _decimal(instance.amount), ZERO, _decimal(instance.fee))
+
+
+def rollup_day(instance):
+    return timezone.localdate(instance.created_at) if instance.created_at else timezone.localdate()
+
+
+def apply_delta(day, kind, currency, status, count, amount, converted_amount, fee):
+    """Add a delta to one bucket with a single UPDATE, creating the bucket on first use."""
+    bucket = DailyVolume.objects.filter(day=day, kind=kind, currency=currency, status=status)
+    changes = dict(
+        count=F('count') + count,
+        amount=F('amount') + amount,
+        converted_amount=F('converted_amount') + converted_amount,
+        fee=F('fee') + fee,
+        updated_at=timezone.now(),
+    )
+    if bucket.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyVolume.objects.create(
+                day=day, kind=kind, currency=currency, status=status, count=count,
+                amount=amount, converted_amount=converted_amount, fee=fee,
+            )
+    except IntegrityError:
+        # Another worker created the bucket first
+        bucket.update(**changes)
+
+
+def record_change(instance, previous, created):
+    """Apply the rollup effect of saving a request; previous is its rollup_values() when loaded."""
+    current = rollup_values(instance)
+    if not created and previous == current:
+        return
+    day = rollup_day(instance)
+    if not created and previous is not None:
+        kind, currency, status, amount, converted_amount, fee = previous
+        apply_delta(day, kind, currency, status, -1, -amount, -converted_amount, -fee)
+    apply_delta(day, *current[:3], 1, *current[3:])
+
+
+def record_bulk_status_change(model, rows, new_status):
+    """Rollup effect of a bulk status UPDATE, which bypasses model signals.
+
+    rows are dicts of field values (created_at, status, amounts) as they were before
+    the update. Deltas are merged per bucket so each bucket is written once.
+    """
+    deltas = {}
+    for row in rows:
+        instance = model(**row)
+        day = rollup_day(instance)
+        previous = rollup_values(instance)
+        instance.status = new_status
+        current = rollup_values(instance)
+        for values, sign in ((previous, -1), (current, 1)):
+            key = (day,) + values[:3]
+            totals = deltas.setdefault(key, [0, ZERO, ZERO, ZERO])
+            totals[0] += sign
+            for index, value in enumerate(values[3:], start=1):
+                totals[index] += sign * value
+
+    for key, totals in deltas.items():
+        if any(totals):
+            apply_delta(*key, *totals)
+
+
+def _money(expression):
+    return Coalesce(Sum(Cast(expression, DecimalField(max_digits=28, decimal_places=8))),
+                    Value(ZERO), output_field=DecimalField(max_digits=28, decimal_places=8))
+
+
+@transaction.atomic
+def rebuild_daily_volume(since=None):
+    """Recompute the rollup table from the request tables, optionally from a day onwards."""
+    buckets = DailyVolume.objects.all()
+    deposits = DepositRequest.objects.all()
+    withdrawals = WithdrawalRequest.objects.all()
+    if since:
+        buckets = buckets.filter(day__gte=since)
+        deposits = deposits.filter(created_at__date__gte=since)
+        withdrawals = withdrawals.filter(created_at__date__gte=since)
+    buckets.delete()
+
+    rows = []
+    for bucket in (deposits.annotate(day=TruncDate('created_at'))
+                   .values('day', 'status')
+                   .annotate(count=Count('id'), amount=_money('amount'),
+                             converted_amount=_money('converted_amount'))):
+        rows.append(DailyVolume(
+            day=bucket['day'], kind='deposit', currency=DEPOSIT_CURRENCY, status=bucket['status'],
+            count=bucket['count'], amount=bucket['amount'], converted_amount=bucket['converted_amount'],
+        ))
+    for bucket in (withdrawals.annotate(day=TruncDate('created_at'))
+                   .values('day', 'currency', 'status')
+                   .annotate(count=Count('id'), amount=_money('amount'), fee=_money('fee'))):
+        rows.append(DailyVolume(
+            day=bucket['day'], kind='withdrawal', currency=bucket['currency'], status=bucket['status'],
+            count=bucket['count'], amount=bucket['amount'], fee=bucket['fee'],
+        ))
+
+    DailyVolume.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def summarize(since, until=None):
+    """Totals per (kind, currency, status) between two days, read from the rollup table only."""
+    buckets = DailyVolume.objects.filter(day__gte=since)
+    if until:
+        buckets = buckets.filter(day__lte=until)
+    return list(
+        buckets.values('kind', 'currency', 'status')
+        .annotate(count=Sum('count'), amount=Sum('amount'),
+                  converted_amount=Sum('converted_amount'), fee=Sum('fee'))
+        .filter(count__gt=0)
+        .order_by('kind', 'currency', 'status')
+    )
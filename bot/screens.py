@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from telegram import Message
+from telegram.error import BadRequest
+from . import metrics
+import hashlib
+
+
+def fingerprint(*parts):
+    """Short stable hash of the parts, to store renders without keeping their text."""
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def markup_data(markup):
+    return markup.to_dict() if markup is not None else None
+
+
+def shown_fingerprint(message):
+    """Hash of a message as Telegram reports it, the same for every worker that sees it."""
+    return fingerprint(message.text, markup_data(message.reply_markup))
+
+
+class ScreenCache:
+    """Bounded LRU of (render fingerprint, shown fingerprint) per (chat_id, message_id)."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, render, shown):
+        with self._lock:
+            self._entries[key] = (render, shown)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+screens = ScreenCache(settings.TELEGRAM_SCREEN_CACHE_SIZE)
+
+
+async def edit_screen(query, text, parse_mode=None, reply_markup=None):
+    """Edit the message behind a callback query unless it already shows this exact render.
+
+    A skip needs both the render we last put on the message and the message Telegram
+    sends with the query to match, so an edit made elsewhere (another worker, a newer
+    screen) is never mistaken for the current one.
+    """
+    message = query.message
+    if not isinstance(message, Message):
+        # Too old to be sent with the query, nothing to compare against
+        return await query.edit_message_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+    key = (message.chat_id, message.message_id)
+    render = fingerprint(text, parse_mode, markup_data(reply_markup))
+    if screens.get(key) == (render, shown_fingerprint(message)):
+        metrics.increment('telegram.edits.skipped')
+        return message
+
+    try:
+        edited = await message.edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+        metrics.increment('telegram.edits.sent')
+    except BadRequest as e:
+        if 'not modified' not in str(e).lower():
+            raise
+        # Already showing this render, e.g. the menu /start sent
+        metrics.increment('telegram.edits.not_modified')
+        edited = message
+    screens.set(key, render, shown_fingerprint(edited if isinstance(edited, Message) else message))
+    return edited
+
+
+def format_edit_savings():
+    values = metrics.snapshot('telegram.edits.')
+    skipped = values.get('telegram.edits.skipped', 0)
+    total = skipped + values.get('telegram.edits.sent', 0) + values.get('telegram.edits.not_modified', 0)
+    if not total:
+        return "No screen edits yet."
+    return (
+        f"• {skipped} of {total} edits skipped ({skipped / total:.0%}), "
+        f"{values.get('telegram.edits.not_modified', 0)} answered 'not modified'"
+    )
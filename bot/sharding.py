@@ -0,0 +1,178 @@
+from multiprocessing.connection import Listener, Client
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from threading import Thread, Lock, local
+from bisect import bisect
+from pathlib import Path
+from django.conf import settings
+import hashlib
+import logging
+import sys
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring, so changing the shard count only moves about 1/N of the chats."""
+
+    def __init__(self, shards, replicas=64):
+        self.shards = shards
+        points = sorted(
+            (_hash(f"shard-{shard}:{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        index = bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._shards[index]
+
+
+def shard_address(index):
+    """Local IPC address of a shard worker."""
+    if sys.platform == 'win32':
+        return ('127.0.0.1', settings.TELEGRAM_SHARD_BASE_PORT + index)
+    return str(Path(settings.BOT_RUNTIME_DIR) / f"shard-{index}.sock")
+
+
+def _authkey():
+    return settings.SECRET_KEY.encode('utf-8')
+
+
+class ShardRouter:
+    """Ingress side: forwards raw update bodies to the worker that owns their chat."""
+
+    def __init__(self, shards):
+        self.ring = HashRing(shards)
+        # One connection per (thread, shard), a connection is never shared between threads
+        self._local = local()
+
+    def _connection(self, shard):
+        connections = self._local.__dict__.setdefault('connections', {})
+        if shard not in connections:
+            connections[shard] = Client(shard_address(shard), authkey=_authkey())
+        return connections[shard]
+
+    def _drop(self, shard):
+        connection = self._local.__dict__.get('connections', {}).pop(shard, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def forward(self, key, body):
+        """Send a raw update to its shard and wait until it was handled. Returns True on success."""
+        shard = self.ring.shard_for(key)
+        for attempt in range(2):
+            try:
+                connection = self._connection(shard)
+                # The worker orders updates per chat by this key, without parsing the body
+                connection.send_bytes(str(key).encode('utf-8') + b' ' + body)
+                return connection.recv_bytes() == b'OK'
+            except (OSError, EOFError):
+                # The worker restarted, reconnect once before giving up
+                self._drop(shard)
+                if attempt:
+                    raise
+        return False
+
+
+shard_router = None
+
+shard_router_lock = Lock()
+
+
+def get_shard_router():
+    """Return the process-wide ShardRouter, or None when sharding is disabled."""
+    global shard_router
+    if not settings.TELEGRAM_SHARD_WORKERS:
+        return None
+    with shard_router_lock:
+        if shard_router is None:
+            shard_router = ShardRouter(settings.TELEGRAM_SHARD_WORKERS)
+    return shard_router
+
+
+class ChatQueues:
+    """Runs handler(body) one update at a time per chat, in arrival order, on a thread pool.
+
+    Ingress threads each have their own connection, so two updates of one chat can
+    arrive on different connections at once; the chat's queue keeps them in order.
+    """
+
+    def __init__(self, handler, threads=32):
+        self.handler = handler
+        self._queues = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix='shard-chat')
+
+    def submit(self, key, body):
+        """Queue an update behind the chat's earlier ones; returns a Future of handler(body)."""
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                # A drain of this chat is running and will get to it
+                queue.append((body, future))
+                return future
+            self._queues[key] = deque([(body, future)])
+        self._executor.submit(self._drain, key)
+        return future
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                body, future = queue.popleft()
+            try:
+                future.set_result(self.handler(body))
+            except Exception as e:
+                future.set_exception(e)
+
+
+def serve_shard(index, handler, threads=32):
+    """Worker side: accept forwarded updates for one shard and run handler(body) for each.
+
+    Updates of one chat are handled one after another, up to threads chats at once.
+    """
+    address = shard_address(index)
+    if isinstance(address, str):
+        Path(address).parent.mkdir(parents=True, exist_ok=True)
+        Path(address).unlink(missing_ok=True)
+
+    chats = ChatQueues(handler, threads)
+    with Listener(address, authkey=_authkey()) as listener:
+        logger.info("Shard %s listening on %s", index, address)
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                logger.error("Shard %s failed to accept a connection: %s", index, e)
+                continue
+            Thread(target=_serve_connection, args=(connection, chats), daemon=True).start()
+
+
+def _serve_connection(connection, chats):
+    with connection:
+        while True:
+            try:
+                key, _, body = connection.recv_bytes().partition(b' ')
+            except (EOFError, OSError):
+                return
+            try:
+                chats.submit(key, body).result()
+                connection.send_bytes(b'OK')
+            except Exception as e:
+                logger.error("Error handling sharded update: %s", e, exc_info=True)
+                connection.send_bytes(b'ERR')
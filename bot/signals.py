@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_init, post_delete, pre_save
+from django.db.backends.signals import connection_created
 from django.dispatch import receiver
-from .models import DepositRequest, TelegramUser
+from .models import DepositRequest, TelegramUser, WithdrawalRequest, ActionToken
+from .rollups import rollup_values, record_change, apply_delta, rollup_day
+from .user_cache import invalidate_user
+from .db_router import remember_write, REPLICA_DB_ALIAS
+from .tracing import TracedHTTPXRequest, install_db_tracing, span
 from django.conf import settings
 from telegram import Bot
 import asyncio
@@ -16,7 +21,7 @@ def update_user_balance(sender, instance, **kwargs):
         # Save the updated user instance
         user.save()
 
-        bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
+        bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, base_url=settings.TELEGRAM_API_BASE_URL, request=TracedHTTPXRequest())
         message = (
             f"✅ *Conversion Successful!*\n\n"
             f"Conversion Rate: {instance.conversion_rate}/IDR\n"
@@ -31,4 +36,96 @@ def update_user_balance(sender, instance, **kwargs):
             )
 
         # Run the coroutine
-        asyncio.run(send_message())
\ No newline at end of file
+        with span('telegram.asyncio_run'):
+            asyncio.run(send_message())
+
+
+@receiver(post_init, sender=DepositRequest)
+@receiver(post_init, sender=WithdrawalRequest)
+def remember_rollup_values(sender, instance, **kwargs):
+    # Snapshot of the loaded row, so a later save knows which bucket it leaves.
+    # Rows loaded with deferred fields are looked up in pre_save instead.
+    if instance.pk and not instance.get_deferred_fields():
+        instance._rollup_previous = rollup_values(instance)
+    else:
+        instance._rollup_previous = None
+
+
+@receiver(pre_save, sender=DepositRequest)
+@receiver(pre_save, sender=WithdrawalRequest)
+def load_rollup_values(sender, instance, **kwargs):
+    if instance.pk and not instance._state.adding and getattr(instance, '_rollup_previous', None) is None:
+        stored = sender.objects.using(kwargs.get('using')).filter(pk=instance.pk).first()
+        instance._rollup_previous = rollup_values(stored) if stored else None
+
+
+@receiver(post_save, sender=DepositRequest)
+@receiver(post_save, sender=WithdrawalRequest)
+def update_daily_volume(sender, instance, created, **kwargs):
+    record_change(instance, getattr(instance, '_rollup_previous', None), created)
+    instance._rollup_previous = rollup_values(instance)
+
+
+@receiver(post_delete, sender=DepositRequest)
+@receiver(post_delete, sender=WithdrawalRequest)
+def remove_from_daily_volume(sender, instance, **kwargs):
+    kind, currency, status, amount, converted_amount, fee = rollup_values(instance)
+    apply_delta(rollup_day(instance), kind, currency, status, -1, -amount, -converted_amount, -fee)
+
+
+@receiver(post_init, sender=TelegramUser)
+def remember_balance(sender, instance, **kwargs):
+    # None when balance was deferred, the next save then always invalidates
+    instance._loaded_balance = instance.__dict__.get('balance')
+
+
+@receiver(post_save, sender=TelegramUser)
+def invalidate_cached_balance(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'balance' not in update_fields:
+        return
+    if created or instance.balance != instance._loaded_balance:
+        invalidate_user(instance.pk, kinds=('balance',))
+    instance._loaded_balance = instance.balance
+
+
+@receiver(post_delete, sender=TelegramUser)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=DepositRequest)
+@receiver(post_save, sender=WithdrawalRequest)
+@receiver(post_delete, sender=DepositRequest)
+@receiver(post_delete, sender=WithdrawalRequest)
+def invalidate_cached_history(sender, instance, **kwargs):
+    if instance.user_id:
+        kinds = ('history', 'payment') if sender is DepositRequest else ('history',)
+        invalidate_user(instance.user_id, kinds=kinds)
+
+
+@receiver(post_save, sender=TelegramUser)
+@receiver(post_delete, sender=TelegramUser)
+def remember_user_write(sender, instance, **kwargs):
+    remember_write(instance.telegram_id)
+
+
+@receiver(post_save, sender=DepositRequest)
+@receiver(post_save, sender=WithdrawalRequest)
+@receiver(post_save, sender=ActionToken)
+@receiver(post_delete, sender=DepositRequest)
+@receiver(post_delete, sender=WithdrawalRequest)
+@receiver(post_delete, sender=ActionToken)
+def remember_request_write(sender, instance, **kwargs):
+    # The user's next reads, e.g. the action link or payment details, must see this row.
+    # Checked here too, so saves without a replica never look the user up
+    if not instance.user_id or REPLICA_DB_ALIAS not in settings.DATABASES:
+        return
+    if sender.user.is_cached(instance):
+        telegram_id = instance.user.telegram_id
+    else:
+        telegram_id = TelegramUser.objects.filter(pk=instance.user_id).values_list('telegram_id', flat=True).first()
+    remember_write(telegram_id)
+
+
+# Every new DB connection gets the query span wrapper
+connection_created.connect(install_db_tracing)
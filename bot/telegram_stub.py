@@ -0,0 +1,112 @@
+from http.server import BaseHTTPRequestHandler
+from collections import Counter
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qs
+from .mobee_stub import StubServer
+import itertools
+import random
+import json
+import time
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+STUB_BOT = {'id': 7000000000, 'is_bot': True, 'first_name': 'Mobee', 'username': 'mobee_stub_bot'}
+
+# Methods answered with a Message; everything else gets True
+MESSAGE_METHODS = {'sendMessage', 'sendDocument', 'editMessageText', 'editMessageReplyMarkup'}
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    """Answers Bot API calls with minimal valid results and counts them per method."""
+
+    server_version = "TelegramStub/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("Telegram stub: " + format, *args)
+
+    def _parameters(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body or b'{}')
+        # Uploads are multipart; the stub only needs the simple form fields
+        return {key: values[0] for key, values in parse_qs(body.decode('utf-8', 'replace')).items()}
+
+    def do_POST(self):
+        method = urlparse(self.path).path.rsplit('/', 1)[-1]
+        parameters = self._parameters()
+        self.server.count(method)
+        if self.server.latency:
+            time.sleep(random.uniform(*self.server.latency))
+
+        if method == 'getMe':
+            result = STUB_BOT
+        elif method in MESSAGE_METHODS:
+            result = {
+                # Edits answer with the edited message, as Telegram does
+                'message_id': int(parameters.get('message_id') or next(self.server.message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': int(parameters.get('chat_id') or 1), 'type': 'private'},
+                'from': STUB_BOT,
+                'text': parameters.get('text') or '',
+            }
+            reply_markup = parameters.get('reply_markup')
+            if reply_markup:
+                result['reply_markup'] = json.loads(reply_markup) if isinstance(reply_markup, str) else reply_markup
+        else:
+            result = True
+
+        body = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+
+class TelegramStub:
+    """Runs the Bot API stub in a background thread; set TELEGRAM_API_BASE_URL to .base_url to use it.
+
+    latency is an optional (low, high) range of seconds added to every call.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=None):
+        self.server = StubServer((host, port), TelegramStubHandler)
+        self.server.latency = latency
+        self.server.message_ids = itertools.count(1)
+        self.server.calls = Counter()
+        self.server.lock = Lock()
+        self.server.count = self._count
+        self._thread = None
+
+    def _count(self, method):
+        with self.server.lock:
+            self.server.calls[method] += 1
+
+    @property
+    def calls(self):
+        return self.server.calls
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = Thread(target=self.server.serve_forever, name="telegram-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
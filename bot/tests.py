@@ -1,3 +1,1526 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from unittest import mock
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from .mobee_models import FiatDeposit, CryptoWithdrawal, MobeeResponseError
+from .models import TelegramUser, ActionToken, DepositRequest, WithdrawalRequest, DailyVolume
+from .resilience import CircuitBreaker, MobeeUnavailable, CLOSED, OPEN, HALF_OPEN
+import httpx
+import gzip
+import asyncio
+import requests
 
-# Create your tests here.
+# Mobee responses recorded from the API's documented shapes
+FIXTURES = Path(__file__).resolve().parent / 'testdata' / 'mobee'
+
+
+def fixture(name):
+    return (FIXTURES / name).read_bytes()
+
+
+def mobee_replies(name):
+    """Patch the async Mobee client to answer every call with a recorded fixture."""
+    async def reply(method, url, headers, body=None):
+        return httpx.Response(200, content=fixture(name))
+    return mock.patch('bot.mobee_utils.asend_mobee_request', reply)
+
+
+class FiatDepositContractTests(SimpleTestCase):
+
+    def test_parses_recorded_order(self):
+        order = FiatDeposit.from_bytes(fixture('fiat_deposit.json'))
+        self.assertEqual(order.deposit_id, 'dep-1')
+        self.assertEqual(order.transaction_id, 'TXD0000000001')
+        self.assertEqual(order.amount, Decimal('150000'))
+        self.assertEqual(order.account_number, '880800000001')
+        self.assertEqual(order.expired_at, datetime(2026, 10, 20, 9, 30, 0, 123456, tzinfo=timezone.utc))
+
+    def test_model_kwargs_are_deposit_request_fields(self):
+        kwargs = FiatDeposit.from_bytes(fixture('fiat_deposit.json')).model_kwargs()
+        fields = {field.name for field in DepositRequest._meta.get_fields()}
+        self.assertLessEqual(set(kwargs), fields)
+
+    def test_is_slotted_and_frozen(self):
+        order = FiatDeposit.from_bytes(fixture('fiat_deposit.json'))
+        self.assertFalse(hasattr(order, '__dict__'))
+        with self.assertRaises(AttributeError):
+            order.amount = Decimal('1')
+
+    def test_missing_field_is_named(self):
+        with self.assertRaises(MobeeResponseError) as raised:
+            FiatDeposit.from_bytes(fixture('fiat_deposit_missing_account_number.json'))
+        self.assertEqual(raised.exception.field, 'account_number')
+        self.assertIn('FiatDeposit.account_number: missing', str(raised.exception))
+
+    def test_unparseable_expiry(self):
+        with self.assertRaises(MobeeResponseError) as raised:
+            FiatDeposit.from_bytes(fixture('fiat_deposit_bad_expiry.json'))
+        self.assertEqual(raised.exception.field, 'expired_at')
+
+    def test_body_without_data(self):
+        with self.assertRaisesMessage(MobeeResponseError, "body has no 'data' object"):
+            FiatDeposit.from_bytes(fixture('no_data.json'))
+
+    def test_truncated_body(self):
+        with self.assertRaisesMessage(MobeeResponseError, "body is not JSON"):
+            FiatDeposit.from_bytes(fixture('truncated.json'))
+
+    def test_counts_as_mobee_failure(self):
+        from .resilience import is_failure
+        self.assertTrue(is_failure(MobeeResponseError('FiatDeposit', 'missing', 'id')))
+
+
+class CryptoWithdrawalContractTests(SimpleTestCase):
+
+    def test_parses_recorded_order(self):
+        order = CryptoWithdrawal.from_bytes(fixture('crypto_withdrawal.json'))
+        self.assertEqual(order.transaction_id, 4)
+        self.assertEqual(order.amount, Decimal('25.5'))
+        self.assertEqual(order.fee, Decimal('1.5'))
+        self.assertEqual(order.network_name, 'BEP20')
+        self.assertTrue(order.explorer_url.startswith('https://bscscan.com/tx/'))
+
+    def test_model_kwargs_are_withdrawal_request_fields(self):
+        kwargs = CryptoWithdrawal.from_bytes(fixture('crypto_withdrawal.json')).model_kwargs()
+        fields = {field.name for field in WithdrawalRequest._meta.get_fields()}
+        self.assertLessEqual(set(kwargs), fields)
+
+    def test_explorer_url_is_optional(self):
+        order = CryptoWithdrawal.from_bytes(fixture('crypto_withdrawal_not_broadcast.json'))
+        self.assertIsNone(order.explorer_url)
+
+    def test_wrong_type_is_named(self):
+        with self.assertRaises(MobeeResponseError) as raised:
+            CryptoWithdrawal.from_bytes(fixture('crypto_withdrawal_bad_fee.json'))
+        self.assertEqual(raised.exception.field, 'fee')
+        self.assertIn('got True', str(raised.exception))
+
+
+class GzipReplyTests(SimpleTestCase):
+    """The sync client reads the body itself, so it has to undo Content-Encoding too."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        body = gzip.compress(fixture('fiat_deposit.json'))
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def test_gzipped_reply_is_decoded(self):
+        from .mobee_utils import send_mobee_request
+        host, port = self.server.server_address[:2]
+        response = send_mobee_request('POST', f"http://{host}:{port}/v1/wallets/fiat-deposits", {}, '{}')
+        self.assertEqual(response.content, fixture('fiat_deposit.json'))
+        self.assertEqual(FiatDeposit.from_bytes(response.content).deposit_id, 'dep-1')
+
+
+class RecordOrderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = TelegramUser.objects.create(telegram_id=1001, username='alice', balance=100.0)
+
+    async def test_deposit_is_recorded_from_the_order(self):
+        from .deposits import acreate_deposit, payment_details_text
+        from .user_cache import user_key
+        await ActionToken.objects.acreate(user=self.user, token='deposit-token', action='deposit')
+        with mobee_replies('fiat_deposit.json'):
+            deposit, text = await acreate_deposit(1001, '150000', 'BCA', 'deposit-token')
+
+        stored = await DepositRequest.objects.aget(pk=deposit.pk)
+        self.assertEqual(stored.deposit_id, 'dep-1')
+        self.assertEqual(stored.status, 'pending')
+        self.assertEqual(stored.amount, 150000.0)
+        self.assertEqual(stored.expired_at, datetime(2026, 10, 20, 9, 30, 0, 123456, tzinfo=timezone.utc))
+        self.assertTrue((await ActionToken.objects.aget(token='deposit-token')).is_used)
+        # Fresh and stored deposits read the same to the user, and the details are cached
+        self.assertIn('`880800000001`', text)
+        self.assertEqual(text, payment_details_text(stored))
+        self.assertEqual(cache.get(user_key('payment', self.user.pk)), text)
+
+    async def test_withdrawal_is_recorded_from_the_order(self):
+        from .withdrawals import acreate_withdrawal
+        await ActionToken.objects.acreate(user=self.user, token='withdrawal-token', action='withdrawal')
+        with mobee_replies('crypto_withdrawal.json'):
+            withdrawal = await acreate_withdrawal(
+                1001, 'USDT', '25.5', '0x52908400098527886E0F7030069857D2E4169EE7', 12, 1.5, 'withdrawal-token'
+            )
+
+        stored = await WithdrawalRequest.objects.aget(pk=withdrawal.pk)
+        self.assertEqual(stored.transaction_id, 4)
+        self.assertEqual(stored.amount, Decimal('25.5'))
+        self.assertEqual(stored.fee, Decimal('1.5'))
+        self.assertEqual((await TelegramUser.objects.aget(pk=self.user.pk)).balance, 73.0)
+        self.assertTrue((await ActionToken.objects.aget(token='withdrawal-token')).is_used)
+
+    async def test_malformed_withdrawal_keeps_the_reservation(self):
+        from .withdrawals import acreate_withdrawal
+        await ActionToken.objects.acreate(user=self.user, token='withdrawal-token', action='withdrawal')
+        with mobee_replies('crypto_withdrawal_bad_fee.json'), self.assertRaises(MobeeResponseError):
+            await acreate_withdrawal(
+                1001, 'USDT', '25.5', '0x52908400098527886E0F7030069857D2E4169EE7', 1, 1.5, 'withdrawal-token'
+            )
+
+        # Mobee may have created the order, so the balance is not handed back and the link is spent
+        self.assertEqual((await TelegramUser.objects.aget(pk=self.user.pk)).balance, 73.0)
+        self.assertFalse(await WithdrawalRequest.objects.aexists())
+        self.assertTrue((await ActionToken.objects.aget(token='withdrawal-token')).is_used)
+
+
+def breaker(**overrides):
+    options = dict(
+        window=10, min_calls=4, error_rate=0.5, slow_seconds=60, slow_rate=0.5,
+        open_seconds=60, half_open_calls=2,
+    )
+    options.update(overrides)
+    return CircuitBreaker('test', **options)
+
+
+def fail(circuit, error=None):
+    try:
+        with circuit.call():
+            raise error or requests.ConnectionError("refused")
+    except (requests.RequestException, ValueError):
+        pass
+
+
+def succeed(circuit):
+    with circuit.call():
+        pass
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_stays_closed_below_min_calls(self):
+        circuit = breaker()
+        for _ in range(3):
+            fail(circuit)
+        self.assertEqual(circuit.state, CLOSED)
+
+    def test_opens_at_error_rate(self):
+        circuit = breaker()
+        succeed(circuit)
+        succeed(circuit)
+        fail(circuit)
+        self.assertEqual(circuit.state, CLOSED)
+        fail(circuit)
+        self.assertEqual(circuit.state, OPEN)
+        with self.assertRaises(MobeeUnavailable):
+            succeed(circuit)
+
+    def test_client_errors_do_not_count(self):
+        circuit = breaker()
+        response = requests.Response()
+        response.status_code = 422
+        for _ in range(4):
+            fail(circuit, requests.HTTPError(response=response))
+        self.assertEqual(circuit.state, CLOSED)
+
+    def test_opens_on_slow_calls(self):
+        circuit = breaker(slow_seconds=0)
+        for _ in range(4):
+            succeed(circuit)
+        self.assertEqual(circuit.state, OPEN)
+
+    def test_half_open_trials_close_it(self):
+        circuit = breaker(open_seconds=0)
+        for _ in range(4):
+            fail(circuit)
+        self.assertEqual(circuit.state, OPEN)
+        succeed(circuit)
+        self.assertEqual(circuit.state, HALF_OPEN)
+        succeed(circuit)
+        self.assertEqual(circuit.state, CLOSED)
+
+    def test_failed_trial_reopens_it(self):
+        circuit = breaker(open_seconds=0)
+        for _ in range(4):
+            fail(circuit)
+        fail(circuit)
+        self.assertEqual(circuit.state, OPEN)
+
+    def test_half_open_admits_only_its_trials(self):
+        circuit = breaker(open_seconds=0, half_open_calls=1)
+        for _ in range(4):
+            fail(circuit)
+        with circuit.call():
+            with self.assertRaises(MobeeUnavailable):
+                with circuit.call():
+                    pass
+
+    def test_cancelled_trial_gives_its_slot_back(self):
+        circuit = breaker(open_seconds=0, half_open_calls=1)
+        for _ in range(4):
+            fail(circuit)
+
+        async def cancelled():
+            with circuit.call():
+                raise asyncio.CancelledError
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancelled())
+        self.assertEqual(circuit.state, HALF_OPEN)
+        succeed(circuit)
+        self.assertEqual(circuit.state, CLOSED)
+
+    def test_late_outcome_from_before_the_trip_is_ignored(self):
+        circuit = breaker(open_seconds=0, half_open_calls=1)
+        late_success, late_failure = circuit.call(), circuit.call()
+        late_success.__enter__()
+        late_failure.__enter__()
+        for _ in range(4):
+            fail(circuit)
+        self.assertEqual(circuit.state, OPEN)
+
+        trial = circuit.call()
+        trial.__enter__()
+        self.assertEqual(circuit.state, HALF_OPEN)
+        # Neither answers for the trial: the success does not close it, the failure does not reopen it
+        late_success.__exit__(None, None, None)
+        error = requests.ConnectionError("refused")
+        late_failure.__exit__(type(error), error, None)
+        self.assertEqual(circuit.state, HALF_OPEN)
+        trial.__exit__(None, None, None)
+        self.assertEqual(circuit.state, CLOSED)
+
+
+class RedactTests(SimpleTestCase):
+
+    def test_bearer_credential(self):
+        from .logging_utils import redact
+        self.assertEqual(redact("Authorization: Bearer abc.def-123"), "Authorization: Bearer [REDACTED]")
+        self.assertEqual(redact('{"authorization": "Basic dXNlcjpwYXNz"}'), '{"authorization": "Basic [REDACTED]"}')
+
+    def test_plain_pair(self):
+        from .logging_utils import redact
+        self.assertEqual(redact("api_key=k3y&amount=5"), "api_key=[REDACTED]&amount=5")
+
+    def test_action_link_tokens(self):
+        from .logging_utils import redact
+        self.assertEqual(
+            redact('"GET /create-deposit/1001/150000/BNI/Xy9_token/ HTTP/1.1" 302'),
+            '"GET /create-deposit/1001/150000/BNI/[REDACTED]/ HTTP/1.1" 302',
+        )
+        self.assertEqual(
+            redact("https://x.example/create-withdraw/1001/USDT/25/0xabc/12/Xy9_token/"),
+            "https://x.example/create-withdraw/1001/USDT/25/0xabc/12/[REDACTED]/",
+        )
+
+
+class TraceSamplingTests(SimpleTestCase):
+    TRACEPARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+    def sampled(self, **kwargs):
+        from .tracing import trace, NOOP_SPAN
+        with mock.patch('bot.tracing.exporter'), trace('test', **kwargs) as root:
+            return root is not NOOP_SPAN
+
+    @override_settings(TRACE_SAMPLE_RATE=0.0)
+    def test_untrusted_sampled_flag_is_ignored(self):
+        self.assertFalse(self.sampled(traceparent=self.TRACEPARENT))
+
+    @override_settings(TRACE_SAMPLE_RATE=0.0)
+    def test_trusted_sampled_flag_is_kept(self):
+        self.assertTrue(self.sampled(traceparent=self.TRACEPARENT, trust_sampled=True))
+
+    @override_settings(TRACE_SAMPLE_RATE=1.0)
+    def test_sampled_trace_joins_the_callers(self):
+        from .tracing import trace
+        with mock.patch('bot.tracing.exporter'), trace('test', traceparent=self.TRACEPARENT) as root:
+            self.assertEqual(root.trace_id, '0af7651916cd43dd8448eb211c80319c')
+
+    @override_settings(TRACE_TRUSTED_TOKEN='internal-hop-token')
+    def test_trusted_token_header(self):
+        from django.test import RequestFactory
+        from .tracing import trusts_trace_context
+        factory = RequestFactory()
+        self.assertTrue(trusts_trace_context(factory.get('/', HTTP_X_TRACE_TOKEN='internal-hop-token')))
+        self.assertFalse(trusts_trace_context(factory.get('/', HTTP_X_TRACE_TOKEN='guess')))
+        self.assertFalse(trusts_trace_context(factory.get('/')))
+
+
+class Clock:
+    """Stands in for time.monotonic so expiry can be stepped through."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConversationStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        from . import metrics
+        metrics.reset()
+        self.clock = Clock()
+        patches = [
+            mock.patch('bot.conversations.time.monotonic', self.clock),
+            # No sweeper thread writing stats files from the tests
+            mock.patch('bot.conversations.ConversationStore._start_sweeper'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def store(self, budget=1024 * 1024):
+        from .conversations import ConversationStore, DEPOSIT_AMOUNT, WITHDRAWAL_ADDRESS
+        return ConversationStore({DEPOSIT_AMOUNT: 60, WITHDRAWAL_ADDRESS: 30}, budget, sweep_interval=30)
+
+    def test_enter_get_end(self):
+        store = self.store()
+        store.enter(1, 'deposit_amount', method='IDR')
+        self.assertEqual(store.get(1).data, {'method': 'IDR'})
+        store.end(1)
+        self.assertIsNone(store.get(1))
+        self.assertEqual(store.bytes, 0)
+
+    def test_reentering_replaces_the_step(self):
+        store = self.store()
+        store.enter(1, 'withdrawal_amount', method='USDT')
+        entered = store.enter(1, 'withdrawal_address', method='USDT', amount=10.0)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.bytes, entered.size)
+        self.assertEqual(store.get(1).state, 'withdrawal_address')
+
+    def test_expires_after_its_steps_idle_timeout(self):
+        store = self.store()
+        store.enter(1, 'withdrawal_address', method='USDT', amount=10.0)
+        self.clock.now += 29
+        self.assertIsNotNone(store.get(1))
+        # The read above reset the idle timer
+        self.clock.now += 29
+        self.assertIsNotNone(store.get(1))
+        self.clock.now += 30
+        self.assertIsNone(store.get(1))
+        self.assertEqual(store.bytes, 0)
+        self.assertEqual(store.stats()['expired'], 1)
+
+    def test_unknown_steps_use_the_default_timeout(self):
+        from .conversations import DEFAULT_TIMEOUT
+        store = self.store()
+        store.enter(1, 'something_else')
+        self.clock.now += DEFAULT_TIMEOUT - 1
+        self.assertIsNotNone(store.get(1))
+
+    def test_sweep_drops_only_expired(self):
+        store = self.store()
+        store.enter(1, 'withdrawal_address', method='USDT', amount=10.0)
+        store.enter(2, 'deposit_amount', method='IDR')
+        self.clock.now += 45
+        self.assertEqual(store.sweep(), 1)
+        self.assertEqual(store.stats()['by_state'], {'deposit_amount': 1})
+
+    def test_evicts_least_recently_used_over_budget(self):
+        from .conversations import estimate_size
+        size = estimate_size({'method': 'IDR'})
+        store = self.store(budget=2 * size)
+        store.enter(1, 'deposit_amount', method='IDR')
+        store.enter(2, 'deposit_amount', method='IDR')
+        store.get(1)
+        store.enter(3, 'deposit_amount', method='IDR')
+
+        self.assertIsNotNone(store.get(1))
+        self.assertIsNone(store.get(2))
+        self.assertIsNotNone(store.get(3))
+        self.assertLessEqual(store.bytes, store.budget)
+        self.assertEqual(store.stats()['evicted'], 1)
+
+    def test_keeps_a_single_conversation_above_budget(self):
+        store = self.store(budget=1)
+        store.enter(1, 'deposit_amount', method='IDR')
+        self.assertIsNotNone(store.get(1))
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET='s3cret-token_value', TELEGRAM_WEBHOOK_MAX_BYTES=1024)
+class CheckWebhookTests(SimpleTestCase):
+
+    def check(self, method='POST', secret='s3cret-token_value', length='100'):
+        from .ingress import check_webhook
+        return check_webhook(method, secret, length)
+
+    def test_accepts_telegram_request(self):
+        self.assertIsNone(self.check())
+        self.assertIsNone(self.check(length='1024'))
+
+    def test_only_post(self):
+        self.assertEqual(self.check(method='GET').status, 405)
+
+    def test_secret_must_match(self):
+        self.assertEqual(self.check(secret=None).status, 403)
+        self.assertEqual(self.check(secret='s3cret-token_valuE').status, 403)
+        self.assertEqual(self.check(secret='').status, 403)
+
+    def test_secret_is_compared_in_constant_time(self):
+        import hmac
+        with mock.patch('bot.ingress.hmac.compare_digest', wraps=hmac.compare_digest) as compare:
+            self.check(secret='guess')
+        compare.assert_called_once_with(b'guess', b's3cret-token_value')
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET=None)
+    def test_no_secret_configured(self):
+        self.assertIsNone(self.check(secret=None))
+
+    def test_length_required(self):
+        self.assertEqual(self.check(length=None).status, 411)
+        self.assertEqual(self.check(length='-5').status, 411)
+        self.assertEqual(self.check(length='12abc').status, 411)
+
+    def test_body_too_large(self):
+        self.assertEqual(self.check(length='1025').status, 413)
+
+    def test_rejections_are_counted(self):
+        from . import metrics
+        metrics.reset()
+        self.check(method='GET')
+        self.check(secret='guess')
+        self.assertEqual(metrics.snapshot('webhook.rejected.'), {
+            'webhook.rejected.method': 1, 'webhook.rejected.secret': 1,
+        })
+
+
+
+# A message update the way Telegram serializes it: update_id first
+def update_body(update_id, chat_id=1001):
+    return (
+        f'{{"update_id": {update_id}, "message": {{"message_id": 1, "date": 1760000000, '
+        f'"chat": {{"id": {chat_id}, "type": "private"}}, "from": {{"id": {chat_id}, "is_bot": false, '
+        f'"first_name": "Alice"}}, "text": "/balance"}}}}'
+    ).encode('utf-8')
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET=None)
+class WebhookViewTests(SimpleTestCase):
+
+    def post(self, body):
+        from django.urls import reverse
+        return self.client.post(reverse('webhook'), body, content_type='application/json')
+
+    def test_claims_the_update_off_the_bot_loop(self):
+        from threading import current_thread
+        from .dedup import is_duplicate_update
+        threads = []
+
+        def claim(update_id):
+            threads.append(current_thread().name)
+            return is_duplicate_update(update_id)
+
+        with mock.patch('bot.views.is_duplicate_update', claim), \
+                mock.patch('bot.views.process_raw_update', mock.AsyncMock()) as process:
+            first = self.post(update_body(7001))
+            redelivered = self.post(update_body(7001))
+
+        self.assertEqual((first.status_code, redelivered.status_code), (200, 200))
+        # The redelivery is dropped before the bot loop is involved
+        process.assert_awaited_once()
+        self.assertEqual(threads, [current_thread().name] * 2)
+
+    def test_invalid_json_releases_the_claim(self):
+        async def parse(raw_update):
+            return raw_update.data
+
+        with mock.patch('bot.views.process_raw_update', side_effect=parse) as process:
+            truncated = self.post(update_body(7002)[:40])
+            retried = self.post(update_body(7002))
+
+        self.assertEqual((truncated.status_code, retried.status_code), (400, 200))
+        self.assertEqual(process.call_count, 2)
+
+def requests_by_bucket():
+    """Totals per (kind, currency, status) aggregated straight from the request tables."""
+    buckets = {}
+    for row in DepositRequest.objects.values('status').annotate(
+            count=Count('id'), amount=Sum('amount'), converted_amount=Sum('converted_amount')).order_by():
+        buckets[('deposit', 'IDR', row['status'])] = (
+            row['count'], Decimal(str(row['amount'])), Decimal(str(row['converted_amount'])), Decimal(0),
+        )
+    for row in WithdrawalRequest.objects.values('currency', 'status').annotate(
+            count=Count('id'), amount=Sum('amount'), fee=Sum('fee')).order_by():
+        buckets[('withdrawal', row['currency'], row['status'])] = (
+            row['count'], row['amount'], Decimal(0), row['fee'],
+        )
+    return buckets
+
+
+class RollupAssertions:
+
+    def assertRollupsMatchRequests(self):
+        from .rollups import summarize
+        rolled_up = {
+            (row['kind'], row['currency'], row['status']):
+                (row['count'], row['amount'], row['converted_amount'], row['fee'])
+            for row in summarize(date.min)
+        }
+        self.assertEqual(rolled_up, requests_by_bucket())
+
+
+# Completing a deposit messages its user, which needs no real Bot here
+quiet_bot = mock.patch('bot.signals.Bot', return_value=mock.Mock(send_message=mock.AsyncMock()))
+
+
+class ExpirySweepTests(RollupAssertions, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = TelegramUser.objects.create(telegram_id=1001, username='alice')
+        self.bob = TelegramUser.objects.create(telegram_id=1002, username='bob')
+        self.now = datetime.now(timezone.utc)
+
+    def deposit(self, user, number, amount, expired_ago):
+        return DepositRequest.objects.create(
+            user=user, deposit_id=f'dep-{number}', transaction_id=f'TXD{number}', amount=amount,
+            converted_amount=amount / 10000, expired_at=self.now - expired_ago,
+        )
+
+    def test_expires_pending_deposits_past_the_cutoff(self):
+        from .expiry import sweep_expired_deposits
+        old = self.deposit(self.alice, 1, 150000.0, timedelta(hours=1))
+        fresh = self.deposit(self.bob, 2, 50000.0, timedelta(hours=-1))
+
+        chunks = list(sweep_expired_deposits(chunk_size=10, now=self.now))
+
+        self.assertEqual([chunk.expired for chunk in chunks], [1])
+        self.assertEqual(chunks[0].notices, {1001: [150000.0]})
+        old.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((old.status, fresh.status), ('failed', 'pending'))
+        self.assertRollupsMatchRequests()
+
+    def test_deposit_paid_mid_sweep_is_left_alone(self):
+        from .expiry import sweep_expired_deposits
+        paid = self.deposit(self.alice, 1, 150000.0, timedelta(hours=2))
+        unpaid = self.deposit(self.bob, 2, 50000.0, timedelta(hours=1))
+
+        real_now = datetime.now
+        completed = []
+
+        def pay_first(tz=None):
+            # The first clock read after the sweeper's SELECT lands before its UPDATE,
+            # where a deposit can still complete: SQLite has no row locks
+            if not completed:
+                completed.append(paid.pk)
+                with quiet_bot:
+                    paid.status = 'completed'
+                    paid.save()
+            return real_now(tz)
+
+        # One deposit per chunk, so the first chunk is lost to the race as a whole
+        with mock.patch('django.utils.timezone.now', lambda: pay_first(timezone.utc)), \
+                mock.patch('bot.expiry.invalidate_users') as invalidate_users:
+            chunks = list(sweep_expired_deposits(chunk_size=1, now=self.now))
+
+        self.assertEqual(completed, [paid.pk])
+        paid.refresh_from_db()
+        unpaid.refresh_from_db()
+        self.assertEqual((paid.status, unpaid.status), ('completed', 'failed'))
+        # Only the deposit that really expired is counted, invalidated and announced
+        self.assertEqual([chunk.expired for chunk in chunks], [1])
+        self.assertEqual(chunks[0].notices, {1002: [50000.0]})
+        invalidated = [user for call in invalidate_users.call_args_list for user in call.args[0]]
+        self.assertNotIn(self.alice.pk, invalidated)
+        self.assertRollupsMatchRequests()
+
+
+class DailyVolumeTests(RollupAssertions, TestCase):
+
+    def setUp(self):
+        self.user = TelegramUser.objects.create(telegram_id=1001, username='alice', balance=100.0)
+
+    def deposit(self, number, amount, **fields):
+        return DepositRequest.objects.create(
+            user=self.user, deposit_id=f'dep-{number}', transaction_id=f'TXD{number}', amount=amount, **fields
+        )
+
+    def withdrawal(self, number, currency, amount, fee):
+        return WithdrawalRequest.objects.create(
+            user=self.user, transaction_id=number, currency=currency, amount=Decimal(amount), fee=Decimal(fee),
+            address='0x52908400098527886E0F7030069857D2E4169EE7', network_name='BEP20',
+        )
+
+    def test_creates(self):
+        self.deposit(1, 150000.0)
+        self.deposit(2, 50000.0)
+        self.withdrawal(1, 'USDT', '25.5', '1.5')
+        self.withdrawal(2, 'USDT', '10', '1')
+        self.assertRollupsMatchRequests()
+        bucket = DailyVolume.objects.get(kind='deposit', status='pending')
+        self.assertEqual((bucket.count, bucket.amount), (2, Decimal('200000')))
+
+    def test_status_changes(self):
+        deposit = self.deposit(1, 150000.0, converted_amount=9.5)
+        withdrawal = self.withdrawal(1, 'USDT', '25.5', '1.5')
+
+        # Through the post_init snapshot of a loaded row
+        loaded = DepositRequest.objects.get(pk=deposit.pk)
+        with quiet_bot:
+            loaded.status = 'completed'
+            loaded.save()
+        # Through the pre_save lookup, as the snapshot is skipped for deferred rows
+        deferred = WithdrawalRequest.objects.only('id', 'status').get(pk=withdrawal.pk)
+        deferred.status = 'Rejected'
+        deferred.save()
+        # Saving again without a change moves nothing
+        with quiet_bot:
+            loaded.save()
+        self.assertRollupsMatchRequests()
+        self.assertFalse(DailyVolume.objects.filter(status='pending', count__gt=0).exists())
+
+    def test_deletes(self):
+        self.deposit(1, 150000.0)
+        kept = self.deposit(2, 50000.0)
+        self.withdrawal(1, 'USDT', '25.5', '1.5').delete()
+        DepositRequest.objects.exclude(pk=kept.pk).delete()
+        self.assertRollupsMatchRequests()
+        self.assertEqual(DailyVolume.objects.get(kind='withdrawal').count, 0)
+
+    def test_bulk_expiry(self):
+        from .expiry import sweep_expired_deposits
+        now = datetime.now(timezone.utc)
+        for number in range(5):
+            self.deposit(number, 10000.0 * (number + 1), expired_at=now - timedelta(minutes=number))
+        self.deposit(9, 70000.0, expired_at=now + timedelta(hours=1))
+
+        expired = sum(chunk.expired for chunk in sweep_expired_deposits(chunk_size=2, now=now))
+
+        self.assertEqual(expired, 4)
+        self.assertRollupsMatchRequests()
+
+    def test_rebuild_and_summarize_agree_with_the_signals(self):
+        from .rollups import rebuild_daily_volume, summarize
+        self.deposit(1, 150000.0)
+        self.withdrawal(1, 'USDT', '25.5', '1.5')
+        self.withdrawal(2, 'USDC', '10', '1')
+        incremental = summarize(date.min)
+
+        rebuild_daily_volume()
+
+        self.assertEqual(summarize(date.min), incremental)
+        self.assertRollupsMatchRequests()
+        tomorrow = datetime.now(timezone.utc).date() + timedelta(days=2)
+        self.assertEqual(summarize(tomorrow), [])
+
+
+class HashRingTests(SimpleTestCase):
+
+    def test_same_chat_same_shard(self):
+        from .sharding import HashRing
+        self.assertEqual(HashRing(4).shard_for(1001), HashRing(4).shard_for(1001))
+        self.assertEqual(HashRing(4).shard_for(-100123), HashRing(4).shard_for(-100123))
+
+    def test_chats_spread_over_all_shards(self):
+        from collections import Counter
+        from .sharding import HashRing
+        counts = Counter(HashRing(4).shard_for(chat_id) for chat_id in range(10000))
+        self.assertEqual(set(counts), {0, 1, 2, 3})
+        for shard, count in counts.items():
+            self.assertGreater(count, 1500, shard)
+            self.assertLess(count, 3500, shard)
+
+    def test_adding_a_shard_moves_only_its_share(self):
+        from .sharding import HashRing
+        before, after = HashRing(4), HashRing(5)
+        moved = [chat_id for chat_id in range(10000) if before.shard_for(chat_id) != after.shard_for(chat_id)]
+        # About 1/5 of the chats, and all of them to the new shard
+        self.assertLess(len(moved), 3000)
+        self.assertEqual({after.shard_for(chat_id) for chat_id in moved}, {4})
+
+class ShardWorkerTests(SimpleTestCase):
+
+    def handler(self):
+        """A handler that records what ran and whether two updates of one chat overlapped."""
+        from threading import Lock
+        import json
+        import time
+        handled, active, overlaps = [], set(), []
+        lock = Lock()
+
+        def handle(body):
+            chat_id = json.loads(body)['chat']
+            with lock:
+                if chat_id in active:
+                    overlaps.append(chat_id)
+                active.add(chat_id)
+            time.sleep(0.02)
+            with lock:
+                active.discard(chat_id)
+                handled.append(json.loads(body)['n'])
+            return len(handled)
+
+        return handle, handled, overlaps
+
+    def test_updates_of_a_chat_run_one_at_a_time_in_order(self):
+        from .sharding import ChatQueues
+        handle, handled, overlaps = self.handler()
+        chats = ChatQueues(handle, threads=4)
+        futures = [chats.submit(b'1', f'{{"chat": 1, "n": {n}}}'.encode()) for n in range(5)]
+        futures.append(chats.submit(b'2', b'{"chat": 2, "n": 99}'))
+        for future in futures:
+            future.result(timeout=5)
+
+        self.assertEqual([n for n in handled if n != 99], [0, 1, 2, 3, 4])
+        self.assertEqual(overlaps, [])
+
+    def test_handler_errors_reach_the_caller(self):
+        from .sharding import ChatQueues
+        chats = ChatQueues(lambda body: 1 / 0, threads=1)
+        with self.assertRaises(ZeroDivisionError):
+            chats.submit(b'1', b'{}').result(timeout=5)
+        # The chat's queue is not left behind by the failure
+        self.assertEqual(chats._queues, {})
+
+    def test_forwards_from_several_ingress_threads_stay_serialized(self):
+        import tempfile
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from .sharding import ShardRouter, serve_shard, shard_address
+        handle, handled, overlaps = self.handler()
+
+        with override_settings(BOT_RUNTIME_DIR=tempfile.mkdtemp(prefix='shard-test-')):
+            Thread(target=serve_shard, args=(0, handle), daemon=True).start()
+            while not Path(shard_address(0)).exists():
+                time.sleep(0.01)
+            router = ShardRouter(1)
+            # Each pool thread is an ingress thread with its own connection to the worker
+            with ThreadPoolExecutor(4) as pool:
+                results = list(pool.map(
+                    lambda n: router.forward(1, f'{{"chat": 1, "n": {n}}}'.encode()), range(8)
+                ))
+
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual(sorted(handled), list(range(8)))
+        self.assertEqual(overlaps, [])
+
+
+with_replica = mock.patch.dict('django.conf.settings.DATABASES', replica={})
+
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_follow_the_block_alias(self):
+        from django.contrib.auth.models import User
+        from .db_router import ReplicaRouter, reading_from
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(DepositRequest))
+        with reading_from('replica'):
+            self.assertEqual(router.db_for_read(DepositRequest), 'replica')
+            # Only the bot's models are routed
+            self.assertIsNone(router.db_for_read(User))
+            # Relations of a row stay on the database the row came from
+            deposit = DepositRequest()
+            deposit._state.db = 'default'
+            self.assertEqual(router.db_for_read(TelegramUser, instance=deposit), 'default')
+        self.assertEqual(router.db_for_write(DepositRequest), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'bot'))
+
+    def test_no_replica_configured(self):
+        from .db_router import read_replica, reporting_database
+        with read_replica(1001) as alias:
+            self.assertEqual(alias, 'default')
+        self.assertEqual(reporting_database(), 'default')
+
+    @with_replica
+    def test_user_sticks_to_the_primary_after_a_write(self):
+        from .db_router import read_replica, remember_write, remember_writes, reporting_database
+        with read_replica(1001) as alias:
+            self.assertEqual(alias, 'replica')
+        remember_write(1001)
+        remember_writes([1002, None])
+        for telegram_id in (1001, 1002):
+            with read_replica(telegram_id) as alias:
+                self.assertEqual(alias, 'default')
+        with read_replica(1003) as alias:
+            self.assertEqual(alias, 'replica')
+        # Reports may lag, they always read the replica
+        self.assertEqual(reporting_database(), 'replica')
+
+    @with_replica
+    @override_settings(REPLICA_STICKY_SECONDS=0)
+    def test_stickiness_expires(self):
+        from .db_router import read_replica, remember_write
+        remember_write(1001)
+        with read_replica(1001) as alias:
+            self.assertEqual(alias, 'replica')
+
+class ReplicaStickinessTests(TestCase):
+
+    def setUp(self):
+        user = TelegramUser.objects.create(telegram_id=1001, username='alice')
+        ActionToken.objects.create(user=user, token='deposit-token', action='deposit')
+
+    def test_no_user_lookup_without_a_replica(self):
+        token = ActionToken.objects.get(token='deposit-token')
+        token.is_used = True
+        # Only the UPDATE, the user row is not loaded to remember the write
+        with self.assertNumQueries(1):
+            token.save()
+
+    def test_remembers_the_write_with_a_replica(self):
+        token = ActionToken.objects.get(token='deposit-token')
+        with with_replica, mock.patch('bot.signals.remember_write') as remember_write, \
+                self.assertNumQueries(2):
+            token.save()
+        remember_write.assert_called_once_with(1001)
+
+
+class DedupTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recent_ids_ring(self):
+        from .dedup import RecentIds
+        recent = RecentIds(3)
+        self.assertEqual([recent.add(value) for value in (1, 2, 1, 3)], [True, True, False, True])
+        # The oldest id falls out once the ring is full
+        recent.add(4)
+        self.assertNotIn(1, recent)
+        self.assertEqual(len(recent), 3)
+        self.assertTrue(recent.add(1))
+        recent.discard(4)
+        self.assertNotIn(4, recent)
+        self.assertEqual(len(recent), 2)
+
+    def test_redelivered_update_is_dropped_across_workers(self):
+        from .dedup import is_duplicate_update, forget_update, recent_updates
+        self.assertFalse(is_duplicate_update(8001))
+        self.assertTrue(is_duplicate_update(8001))
+        # Another worker has its own ring, the shared cache still knows the update
+        recent_updates.discard(8001)
+        self.assertTrue(is_duplicate_update(8001))
+        # A failed attempt lets Telegram's retry through
+        forget_update(8001)
+        self.assertFalse(is_duplicate_update(8001))
+        self.assertFalse(is_duplicate_update(None))
+
+    def test_action_token_claim(self):
+        from .dedup import claim_action_token, release_action_token, recent_actions
+        self.assertTrue(claim_action_token('tok-1'))
+        self.assertFalse(claim_action_token('tok-1'))
+        recent_actions.discard('tok-1')
+        self.assertFalse(claim_action_token('tok-1'))
+        release_action_token('tok-1')
+        self.assertTrue(claim_action_token('tok-1'))
+
+    def test_idempotency_key_is_stable_per_action_and_token(self):
+        from .dedup import mobee_idempotency_key
+        from .mobee_utils import fiat_deposit_request, crypto_withdrawal_request
+        key = mobee_idempotency_key('deposit', 'tok-1')
+        self.assertEqual(key, mobee_idempotency_key('deposit', 'tok-1'))
+        self.assertNotEqual(key, mobee_idempotency_key('withdrawal', 'tok-1'))
+        self.assertNotEqual(key, mobee_idempotency_key('deposit', 'tok-2'))
+
+        url, headers, body = fiat_deposit_request('150000', 'BCA', key)
+        self.assertEqual(headers['Idempotency-Key'], key)
+        url, headers, body = crypto_withdrawal_request('USDT', '25.5', '0xabc', 12)
+        self.assertNotIn('Idempotency-Key', headers)
+
+
+# Updates of the kinds the bot gets, each with its chat (or user) id for routing
+SAMPLE_UPDATES = [
+    ({"update_id": 10, "message": {"message_id": 1, "date": 1760000000, "text": "100000",
+      "chat": {"id": 1001, "type": "private"}, "from": {"id": 1001, "is_bot": False, "first_name": "A"}}}, 1001),
+    ({"update_id": 11, "callback_query": {"id": "q1", "chat_instance": "c", "data": "deposit",
+      "from": {"id": 1002, "is_bot": False, "first_name": "B"},
+      "message": {"message_id": 2, "date": 1760000000, "chat": {"id": -1003, "type": "group"}}}}, -1003),
+    ({"update_id": 12, "callback_query": {"id": "q2", "chat_instance": "c", "data": "main_menu",
+      "inline_message_id": "m", "from": {"id": 1004, "is_bot": False, "first_name": "C"}}}, 1004),
+    ({"update_id": 13, "inline_query": {"id": "i1", "query": "", "offset": "",
+      "from": {"id": 1005, "is_bot": False, "first_name": "D"}}}, 1005),
+    ({"update_id": 14, "poll": {"id": "p1", "question": "?", "options": [], "total_voter_count": 0,
+      "is_closed": False, "is_anonymous": True, "type": "regular", "allows_multiple_answers": False}}, 14),
+]
+
+
+class RawUpdateTests(SimpleTestCase):
+
+    def test_routing_keys_match_the_full_update(self):
+        import json
+        from telegram import Update
+        from .decoding import RawUpdate
+        from .management.commands.run_polling import update_chat_key
+        for data, chat_id in SAMPLE_UPDATES:
+            raw_update = RawUpdate(json.dumps(data).encode('utf-8'))
+            update = Update.de_json(data, None)
+            self.assertEqual(raw_update.update_id, update.update_id)
+            self.assertEqual(raw_update.chat_id, chat_id)
+            self.assertEqual(raw_update.chat_id, update_chat_key(update))
+            self.assertEqual(raw_update.to_update(None), update)
+
+    def test_update_id_is_peeked_without_parsing(self):
+        from .decoding import RawUpdate
+        raw_update = RawUpdate(b' { "update_id" : 42, "message": not json')
+        self.assertEqual(raw_update.update_id, 42)
+        self.assertIsNone(raw_update._data)
+
+    def test_update_id_not_first_falls_back_to_parsing(self):
+        from .decoding import RawUpdate
+        raw_update = RawUpdate(b'{"message": {"chat": {"id": 7}}, "update_id": 43}')
+        self.assertEqual(raw_update.update_id, 43)
+        self.assertEqual(raw_update.kind, 'message')
+
+    def test_callback_data(self):
+        import json
+        from .decoding import RawUpdate
+        self.assertEqual(RawUpdate(json.dumps(SAMPLE_UPDATES[1][0]).encode()).callback_data, 'deposit')
+        self.assertIsNone(RawUpdate(json.dumps(SAMPLE_UPDATES[0][0]).encode()).callback_data)
+
+    def test_bodies_that_are_not_an_update_object(self):
+        import json
+        from .decoding import RawUpdate
+        for body in (b'[1, 2]', b'{"update_id": 1', b''):
+            with self.assertRaises(json.JSONDecodeError):
+                RawUpdate(body).data
+
+
+class AddressValidatorTests(SimpleTestCase):
+
+    def test_keccak256_vectors(self):
+        from .validators import keccak256
+        self.assertEqual(keccak256(b'').hex(), 'c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470')
+        self.assertEqual(keccak256(b'abc').hex(), '4e03657aea45a94fc7d47ba826c8d667c0d1e6e33a64a036ec44f58fa12d6c45')
+        self.assertEqual(
+            keccak256(b'The quick brown fox jumps over the lazy dog').hex(),
+            '4d741b6f1eb29cb2a9b9911c82f56fa8d73b04959d3d9d222895df6c0b28aa15',
+        )
+
+    def test_eip55_vectors(self):
+        from .validators import to_checksum_address, check_address
+        # From the EIP-55 specification
+        for address in (
+            '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed',
+            '0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359',
+            '0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB',
+            '0xD1220A0cf47c7B9Be7A2E6BA89F429762e7b9aDb',
+        ):
+            self.assertEqual(to_checksum_address(address.lower()), address)
+            self.assertTrue(check_address('ERC20', address).valid)
+            self.assertTrue(check_address('BEP20', address.lower()).valid)
+
+    def test_evm_checksum_and_shape_errors(self):
+        from .validators import check_address
+        self.assertEqual(
+            check_address('ERC20', '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAeD').reason,
+            "checksum mismatch, please copy the address again",
+        )
+        self.assertFalse(check_address('ERC20', '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeA').valid)
+        self.assertFalse(check_address('ERC20', '  ').valid)
+
+    def test_tron_base58check_vectors(self):
+        from .validators import check_address
+        for address in ('TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t', 'T9yD14Nj9j7xAB4dbGeiX9h8unkKHxuWwb'):
+            self.assertTrue(check_address('TRC20', address).valid, address)
+        self.assertEqual(
+            check_address('TRC20', 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6u').reason,
+            "checksum mismatch, please copy the address again",
+        )
+        self.assertFalse(check_address('TRC20', 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj60').valid)
+
+    def test_unknown_network(self):
+        from .validators import check_address
+        with self.assertRaises(ValueError):
+            check_address('DOGE', 'D123')
+
+
+CURRENCIES = {'data': [
+    {'code': 'idr', 'type': 'fiat', 'min_deposit': '10000', 'banks': ['BCA', 'BNI']},
+    {'code': 'usd', 'type': 'fiat', 'deposit_enabled': False, 'banks': ['CITI']},
+    {'code': 'usdt', 'type': 'crypto', 'networks': [
+        {'id': 7, 'name': 'SOL', 'min_withdrawal': '1'},
+        {'id': 9, 'name': 'TRC-20', 'withdrawal_enabled': False},
+        {'id': 12, 'name': 'BEP-20', 'min_withdrawal': '2.5', 'withdrawal_fee': '0.8'},
+    ]},
+    {'code': 'btc', 'type': 'crypto', 'networks': [{'id': 1, 'name': 'ERC20'}]},
+]}
+
+
+class CatalogTests(SimpleTestCase):
+
+    def test_parses_deposit_and_withdrawal_options(self):
+        from .catalog import parse_currencies, DepositOption, WithdrawalOption
+        snapshot = parse_currencies(CURRENCIES)
+        self.assertEqual(snapshot.deposits, {'IDR': DepositOption('IDR', 10000.0, 'BCA')})
+        # The first enabled network with an address validator; only the balance currency is offered
+        self.assertEqual(snapshot.withdrawals, {'USDT': WithdrawalOption('USDT', 2.5, 12, 'BEP20', 0.8)})
+
+    def test_empty_catalog_is_an_error(self):
+        from .catalog import parse_currencies
+        with self.assertRaises(ValueError):
+            parse_currencies({'data': [{'code': 'btc', 'type': 'crypto', 'networks': []}]})
+        with self.assertRaises(KeyError):
+            parse_currencies({})
+
+    def test_serves_defaults_until_mobee_answers(self):
+        from .catalog import Catalog, DEFAULT_SNAPSHOT
+        catalog = Catalog(ttl=300)
+        with mock.patch('bot.mobee_utils.getCurrencies', side_effect=requests.ConnectionError("refused")):
+            catalog.refresh()
+        self.assertIs(catalog.snapshot(), DEFAULT_SNAPSHOT)
+        self.assertEqual(catalog.withdrawal_option('USDT').network_id, 12)
+
+        with mock.patch('bot.mobee_utils.getCurrencies', return_value=CURRENCIES):
+            catalog.refresh()
+        self.assertEqual(catalog.deposit_option('IDR').bank_code, 'BCA')
+        self.assertEqual(catalog.network_for_id(12), 'BEP20')
+        self.assertIsNone(catalog.network_for_id(7))
+
+    def test_keeps_the_last_snapshot_and_backs_off_on_errors(self):
+        from .catalog import Catalog
+        catalog = Catalog(ttl=30)
+        with mock.patch('bot.mobee_utils.getCurrencies', return_value=CURRENCIES):
+            catalog.refresh()
+        loaded = catalog._snapshot = catalog._snapshot._replace(loaded_at=0.0)
+        with mock.patch('bot.mobee_utils.getCurrencies', return_value={'data': []}):
+            catalog.refresh()
+        self.assertIs(catalog._snapshot, loaded)
+        # Stale, but the failed refresh is not retried on every read
+        with mock.patch.object(catalog, 'refresh_in_background') as refresh:
+            catalog.snapshot()
+        refresh.assert_not_called()
+
+    def test_stale_snapshot_refreshes_in_the_background(self):
+        from .catalog import Catalog
+        catalog = Catalog(ttl=300)
+        with mock.patch.object(catalog, 'refresh_in_background') as refresh:
+            catalog.snapshot()
+        refresh.assert_called_once_with()
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        user = TelegramUser.objects.create(telegram_id=1001, username='alice')
+        other = TelegramUser.objects.create(telegram_id=1002, username='bob')
+        for number, owner in enumerate((user, user, other)):
+            DepositRequest.objects.create(
+                user=owner, deposit_id=f'dep-{number}', transaction_id=f'TXD{number}', amount=10000.0 * (number + 1),
+            )
+        WithdrawalRequest.objects.create(
+            user=user, transaction_id=4, currency='USDT', amount=Decimal('25.5'), fee=Decimal('1.5'),
+            address='0x52908400098527886E0F7030069857D2E4169EE7', network_name='BEP20',
+        )
+
+    def test_rows_in_small_chunks(self):
+        from .exports import export_rows
+        rows = list(export_rows('deposits', telegram_id=1001, chunk_size=1))
+        self.assertEqual(rows[0][:3], ('id', 'telegram_id', 'deposit_id'))
+        self.assertEqual([row[2] for row in rows[1:]], ['dep-0', 'dep-1'])
+
+    def test_filters(self):
+        from .exports import export_rows
+        self.assertEqual(len(list(export_rows('deposits', status='PENDING'))), 4)
+        self.assertEqual(len(list(export_rows('deposits', until='2000-01-01'))), 1)
+        self.assertEqual(len(list(export_rows('withdrawals', since=datetime.now(timezone.utc).date()))), 2)
+        with self.assertRaises(ValueError):
+            list(export_rows('deposits', since='yesterday'))
+        with self.assertRaises(ValueError):
+            list(export_rows('balances'))
+
+    def test_jsonl_and_csv_encoding(self):
+        import json
+        from .exports import export_rows, encode_rows
+        lines = list(encode_rows(export_rows('withdrawals'), 'jsonl'))
+        record = json.loads(lines[0])
+        self.assertEqual((record['telegram_id'], record['amount'], record['fee']), (1001, '25.50000000', '1.50000000'))
+        csv_lines = list(encode_rows(export_rows('withdrawals'), 'csv'))
+        self.assertEqual(len(csv_lines), 2)
+        self.assertTrue(csv_lines[0].startswith('id,telegram_id,transaction_id'))
+
+    def test_gzip_and_batch_chunks(self):
+        from .exports import gzip_chunks, batch_chunks
+        lines = [f"row {number}\n" for number in range(5000)]
+        compressed = list(gzip_chunks(iter(lines), buffer_size=4096))
+        self.assertGreater(len(compressed), 1)
+        self.assertEqual(gzip.decompress(b''.join(compressed)).decode(), ''.join(lines))
+        batches = list(batch_chunks(iter(lines), buffer_size=4096))
+        self.assertEqual(b''.join(batches).decode(), ''.join(lines))
+        self.assertTrue(all(len(batch) >= 4096 for batch in batches[:-1]))
+
+    def test_view_streams_gzipped_csv_to_staff(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get('/exports/deposits.csv', {'gzip': 1, 'user': 1002})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="deposits.csv.gz"')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(len(body.splitlines()), 2)
+        self.assertIn('dep-2', body)
+        self.assertEqual(self.client.get('/exports/deposits.csv', {'since': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get('/exports/balances.csv').status_code, 404)
+
+    def test_view_is_staff_only(self):
+        self.assertEqual(self.client.get('/exports/deposits.csv').status_code, 302)
+
+    async def test_view_streams_under_asgi(self):
+        from asgiref.sync import sync_to_async
+        from django.contrib.auth.models import User
+        from .exports import aiter_chunks
+        admin = await sync_to_async(User.objects.create_superuser)('admin', 'admin@example.com', 'pw')
+        await self.async_client.aforce_login(admin)
+        with mock.patch('bot.views.aiter_chunks', wraps=aiter_chunks) as streamed:
+            response = await self.async_client.get('/exports/withdrawals.jsonl')
+            body = b''.join([chunk async for chunk in response.streaming_content])
+        streamed.assert_called_once()
+        self.assertIn(b'"currency":"USDT"', body)
+
+
+class ReconciliationTests(TestCase):
+
+    def setUp(self):
+        alice = TelegramUser.objects.create(telegram_id=1001, username='alice', balance=73.0)
+        TelegramUser.objects.create(telegram_id=1002, username='bob', balance=50.0)
+        carol = TelegramUser.objects.create(telegram_id=1003, username='carol', balance=0.0)
+        # bulk_create skips the signal that credits a completed deposit to the balance
+        DepositRequest.objects.bulk_create([
+            DepositRequest(user=alice, deposit_id='dep-1', transaction_id='TXD1', amount=1600000.0,
+                           converted_amount=100.0, status='completed'),
+            DepositRequest(user=carol, deposit_id='dep-2', transaction_id='TXD2', amount=160000.0,
+                           converted_amount=10.0, status='pending'),
+        ])
+        WithdrawalRequest.objects.bulk_create([
+            WithdrawalRequest(user=alice, transaction_id=1, currency='USDT', amount=Decimal('25.5'),
+                              fee=Decimal('1.5'), address='0xabc', network_name='BEP20', status='Pending'),
+            WithdrawalRequest(user=alice, transaction_id=2, currency='USDT', amount=Decimal('40'),
+                              fee=Decimal('1'), address='0xabc', network_name='BEP20', status='Rejected'),
+        ])
+
+    def reconcile_both_ways(self, ledger, **options):
+        from .reconciliation import reconcile
+        vectorized = reconcile(ledger, **options)
+        with mock.patch('bot.reconciliation.np', None):
+            pure = reconcile(ledger, **options)
+        return vectorized, pure
+
+    def test_flags_balances_the_ledger_does_not_explain(self):
+        from .reconciliation import load_ledger
+        report, pure = self.reconcile_both_ways(load_ledger(chunk_size=1), wallet_balance=150.0)
+        self.assertEqual(report, pure)
+        self.assertEqual(report.users, 3)
+        self.assertEqual([item.telegram_id for item in report.discrepancies], [1002])
+        self.assertEqual((report.total_credits, report.total_debits), (100.0, 27.0))
+        # Pending withdrawals are still held by the wallet
+        self.assertEqual((report.pending_withdrawals, report.expected_wallet), (25.5, 148.5))
+        self.assertEqual(report.wallet_difference, 1.5)
+
+    def test_numpy_and_pure_python_agree(self):
+        import random
+        from array import array
+        generator = random.Random(35)
+        user_ids = array('q', range(1, 501))
+        credit_users = array('q', (generator.randint(1, 520) for _ in range(3000)))
+        debit_users = array('q', (generator.randint(1, 520) for _ in range(2000)))
+        ledger = {
+            'users': [user_ids, array('q', (1000 + i for i in user_ids)),
+                      array('d', (generator.uniform(0, 500) for _ in user_ids))],
+            # Some rows belong to users outside the snapshot and are left out of both sums
+            'credits': [credit_users, array('d', (generator.uniform(0, 50) for _ in credit_users))],
+            'debits': [debit_users, array('d', (generator.uniform(0, 20) for _ in debit_users)),
+                       array('d', (generator.uniform(0, 2) for _ in debit_users))],
+            'pending': array('d', (generator.uniform(0, 20) for _ in range(50))),
+        }
+        vectorized, pure = self.reconcile_both_ways(ledger)
+
+        self.assertEqual([item.telegram_id for item in vectorized.discrepancies],
+                         [item.telegram_id for item in pure.discrepancies])
+        for left, right in zip(vectorized.discrepancies, pure.discrepancies):
+            self.assertAlmostEqual(left.difference, right.difference, places=6)
+        for field in ('total_balance', 'total_credits', 'total_debits', 'pending_withdrawals'):
+            self.assertAlmostEqual(getattr(vectorized, field), getattr(pure, field), places=6)
+
+    def test_wallet_balance_from_response(self):
+        from .reconciliation import wallet_balance_from_response
+        payload = {'data': [{'currency': 'idr', 'available': '5'}, {'currency': 'usdt', 'available': '140', 'locked': '8.5'}]}
+        self.assertEqual(wallet_balance_from_response(payload), 148.5)
+        self.assertEqual(wallet_balance_from_response(payload, 'BTC'), 0.0)
+
+
+def shown_message(text, markup=None, message_id=5):
+    from telegram import Chat, Message
+    return Message(message_id, datetime(2026, 10, 19, tzinfo=timezone.utc), Chat(1001, 'private'),
+                   text=text, reply_markup=markup)
+
+
+class EditScreenTests(SimpleTestCase):
+
+    def setUp(self):
+        from . import metrics
+        from .screens import ScreenCache
+        metrics.reset()
+        patcher = mock.patch('bot.screens.screens', ScreenCache(10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def edit(self, message, text, markup=None, edit_text=None):
+        from telegram import Message
+        from .screens import edit_screen
+        query = mock.Mock(message=message, edit_message_text=mock.AsyncMock())
+        edit_text = edit_text or mock.AsyncMock(side_effect=lambda text, **kwargs: shown_message(text, kwargs['reply_markup']))
+        with mock.patch.object(Message, 'edit_text', edit_text):
+            result = asyncio.run(edit_screen(query, text, reply_markup=markup))
+        return result, edit_text
+
+    def counts(self):
+        from . import metrics
+        return metrics.snapshot('telegram.edits.')
+
+    def test_same_render_on_the_same_message_is_skipped(self):
+        from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("Deposit", callback_data="deposit")]])
+        shown, first = self.edit(shown_message('Main menu'), 'Balance: 5', markup)
+        first.assert_awaited_once()
+        again, second = self.edit(shown, 'Balance: 5', markup)
+        second.assert_not_awaited()
+        self.assertIs(again, shown)
+        self.assertEqual(self.counts(), {'telegram.edits.sent': 1, 'telegram.edits.skipped': 1})
+
+    def test_a_new_render_is_sent(self):
+        shown, _ = self.edit(shown_message('Main menu'), 'Balance: 5')
+        _, edit_text = self.edit(shown, 'Balance: 6')
+        edit_text.assert_awaited_once()
+
+    def test_message_changed_elsewhere_is_edited_again(self):
+        self.edit(shown_message('Main menu'), 'Balance: 5')
+        # Another worker put a different screen on the same message
+        _, edit_text = self.edit(shown_message('History'), 'Balance: 5')
+        edit_text.assert_awaited_once()
+
+    def test_not_modified_is_remembered(self):
+        from telegram.error import BadRequest
+        not_modified = mock.AsyncMock(side_effect=BadRequest("Message is not modified: specified new message content "
+                                                            "and reply markup are exactly the same"))
+        message = shown_message('Main menu')
+        self.assertIs(self.edit(message, 'Main menu', edit_text=not_modified)[0], message)
+        _, edit_text = self.edit(message, 'Main menu')
+        edit_text.assert_not_awaited()
+        self.assertEqual(self.counts(), {'telegram.edits.not_modified': 1, 'telegram.edits.skipped': 1})
+
+    def test_other_errors_are_raised(self):
+        from telegram.error import BadRequest
+        with self.assertRaises(BadRequest):
+            self.edit(shown_message('Main menu'), 'Balance: 5', edit_text=mock.AsyncMock(side_effect=BadRequest("Chat not found")))
+
+    def test_inaccessible_message_is_edited_through_the_query(self):
+        from .screens import edit_screen
+        query = mock.Mock(message=None, edit_message_text=mock.AsyncMock())
+        asyncio.run(edit_screen(query, 'Balance: 5'))
+        query.edit_message_text.assert_awaited_once_with('Balance: 5', parse_mode=None, reply_markup=None)
+
+    def test_screen_cache_is_bounded_lru(self):
+        from .screens import ScreenCache
+        screens = ScreenCache(2)
+        screens.set('a', 1, 1)
+        screens.set('b', 2, 2)
+        screens.get('a')
+        screens.set('c', 3, 3)
+        self.assertEqual((screens.get('a'), screens.get('b'), len(screens)), ((1, 1), None, 2))
+
+
+class PrepareDepositTests(TransactionTestCase):
+    """prepare_deposit runs its ORM work on the DB pool, whose threads have their own
+    connections, so the rows are committed rather than kept in a test transaction."""
+
+    def setUp(self):
+        from .dedup import release_action_token
+        # Claims also live in a per-process ring that cache.clear() leaves alone
+        release_action_token('deposit-token')
+        self.user = TelegramUser.objects.create(telegram_id=1001, username='alice')
+        ActionToken.objects.create(user=self.user, token='deposit-token', action='deposit')
+        self.progress = mock.Mock(edit_text=mock.AsyncMock())
+
+    def prepare(self):
+        from .views import prepare_deposit
+        asyncio.run(prepare_deposit(self.progress, 1001, 150000, 'BNI', 'deposit-token'))
+
+    def shown(self):
+        return self.progress.edit_text.await_args
+
+    def test_payment_details_replace_the_progress_message(self):
+        from .dedup import claim_action_token
+        with mobee_replies('fiat_deposit.json'):
+            self.prepare()
+        self.assertIn('`880800000001`', self.shown().args[0])
+        self.assertTrue(DepositRequest.objects.filter(deposit_id='dep-1', user=self.user).exists())
+        self.assertTrue(ActionToken.objects.get(token='deposit-token').is_used)
+        # The fallback link cannot create a second deposit
+        self.assertFalse(claim_action_token('deposit-token'))
+
+    def test_token_held_by_the_link_is_left_alone(self):
+        from .dedup import claim_action_token
+        claim_action_token('deposit-token')
+        with mock.patch('bot.views.acreate_deposit') as create:
+            self.prepare()
+        create.assert_not_called()
+        self.progress.edit_text.assert_not_awaited()
+
+    def test_mobee_unavailable_releases_the_token(self):
+        from .dedup import claim_action_token
+        with mock.patch('bot.views.acreate_deposit', side_effect=MobeeUnavailable('deposit', 'circuit open', 120)):
+            self.prepare()
+        self.assertIn('temporarily unavailable', self.shown().args[0])
+        self.assertIn('2 minutes', self.shown().args[0])
+        self.assertTrue(claim_action_token('deposit-token'))
+
+    def test_failure_offers_the_link_with_the_same_token(self):
+        from .dedup import claim_action_token
+        from .deposits import deposit_link
+        with mobee_replies('truncated.json'):
+            self.prepare()
+        button = self.shown().kwargs['reply_markup'].inline_keyboard[0][0]
+        self.assertEqual(button.url, deposit_link(1001, 150000, 'BNI', 'deposit-token'))
+        self.assertFalse(DepositRequest.objects.exists())
+        self.assertTrue(claim_action_token('deposit-token'))
+
+
+EVM_ADDRESS = '0x52908400098527886E0F7030069857D2E4169EE7'
+
+
+class ActionLinkViewTests(TestCase):
+
+    def setUp(self):
+        from .dedup import release_action_token
+        cache.clear()
+        for token in ('deposit-token', 'withdrawal-token'):
+            release_action_token(token)
+        self.user = TelegramUser.objects.create(telegram_id=1001, username='alice', balance=100.0)
+        ActionToken.objects.create(user=self.user, token='deposit-token', action='deposit')
+        ActionToken.objects.create(user=self.user, token='withdrawal-token', action='withdrawal')
+        patcher = mock.patch('bot.views.send_from_view', mock.AsyncMock())
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deposit(self, telegram_id=1001):
+        return self.client.get(f'/create-deposit/{telegram_id}/150000/BNI/deposit-token/')
+
+    def withdraw(self, address=EVM_ADDRESS, network_id=12):
+        return self.client.get(f'/create-withdraw/1001/USDT/25/{address}/{network_id}/withdrawal-token/')
+
+    def claimable(self, token):
+        from .dedup import claim_action_token, release_action_token
+        claimed = claim_action_token(token)
+        if claimed:
+            release_action_token(token)
+        return claimed
+
+    def test_deposit_link_sends_the_payment_details(self):
+        with mobee_replies('fiat_deposit.json'):
+            response = self.deposit()
+        self.assertRedirects(response, 'https://t.me/b', fetch_redirect_response=False)
+        self.assertIn('`880800000001`', self.send.await_args.args[1])
+        self.assertTrue(ActionToken.objects.get(token='deposit-token').is_used)
+
+    def test_a_repeated_click_does_not_reach_mobee(self):
+        from .dedup import claim_action_token
+        claim_action_token('deposit-token')
+        with mock.patch('bot.views.acreate_deposit') as create:
+            response = self.deposit()
+        self.assertEqual(response.status_code, 302)
+        create.assert_not_called()
+
+    def test_used_token_is_refused(self):
+        ActionToken.objects.filter(token='deposit-token').update(is_used=True)
+        with mock.patch('bot.views.acreate_deposit') as create:
+            self.deposit()
+        create.assert_not_called()
+        self.assertEqual(self.send.await_args.args[1], "Invalid token. Please try again.")
+
+    def test_deposit_failures_release_the_token(self):
+        with mock.patch('bot.views.notify_unavailable', mock.AsyncMock()) as notify, \
+                mock.patch('bot.views.acreate_deposit', side_effect=MobeeUnavailable('deposit', 'circuit open')):
+            self.assertEqual(self.deposit().status_code, 302)
+        notify.assert_awaited_once()
+        self.assertTrue(self.claimable('deposit-token'))
+
+        with mobee_replies('fiat_deposit_missing_account_number.json'):
+            response = self.deposit()
+        self.assertEqual((response.status_code, response.content),
+                         (502, b"Unexpected response from the payment provider"))
+        self.assertTrue(self.claimable('deposit-token'))
+
+        self.assertEqual(self.deposit(telegram_id=999).status_code, 404)
+        self.assertTrue(self.claimable('deposit-token'))
+
+    def test_withdrawal_link_reserves_and_records(self):
+        with mobee_replies('crypto_withdrawal.json'):
+            response = self.withdraw()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TelegramUser.objects.get(pk=self.user.pk).balance, 73.5)
+        self.assertTrue(WithdrawalRequest.objects.filter(user=self.user, transaction_id=4).exists())
+        self.assertTrue(ActionToken.objects.get(token='withdrawal-token').is_used)
+        self.assertFalse(self.claimable('withdrawal-token'))
+
+    def test_withdrawal_link_checks_address_and_network_first(self):
+        with mock.patch('bot.views.claim_action_token') as claim:
+            self.assertEqual(self.withdraw(address=EVM_ADDRESS.lower()[:-1] + 'x').status_code, 400)
+            self.assertEqual(self.withdraw(network_id=7).status_code, 400)
+        claim.assert_not_called()
+
+    def test_insufficient_balance_releases_the_token(self):
+        TelegramUser.objects.filter(pk=self.user.pk).update(balance=10.0)
+        self.assertEqual(self.withdraw().status_code, 302)
+        self.assertIn("Insufficient balance", self.send.await_args.args[1])
+        self.assertEqual(TelegramUser.objects.get(pk=self.user.pk).balance, 10.0)
+        self.assertTrue(self.claimable('withdrawal-token'))
+
+
+class DbPoolTests(SimpleTestCase):
+
+    def test_runs_on_the_pool_threads_in_parallel(self):
+        from threading import Barrier, current_thread
+        from .db import db_sync_to_async
+        # Each call waits for the other three, so they only finish if they run at once
+        barrier = Barrier(4, timeout=5)
+
+        def blocking():
+            barrier.wait()
+            return current_thread().name
+
+        async def run():
+            return await asyncio.gather(*(db_sync_to_async(blocking)() for _ in range(4)))
+
+        names = asyncio.run(run())
+        self.assertEqual(len(set(names)), 4)
+        self.assertTrue(all(name.startswith('bot-db') for name in names))
+
+    def test_context_goes_along(self):
+        from .db import run_db
+        from .db_router import reading_from, read_alias
+
+        async def run():
+            with reading_from('replica'):
+                return await run_db(read_alias.get)
+
+        self.assertEqual(asyncio.run(run()), 'replica')
+
+    def test_broken_connection_is_dropped_before_the_next_call(self):
+        from .db import discard_broken_connections
+        broken = mock.Mock(connection=object(), errors_occurred=True, is_usable=mock.Mock(return_value=False))
+        recovered = mock.Mock(connection=object(), errors_occurred=True, is_usable=mock.Mock(return_value=True))
+        with mock.patch('bot.db.connections') as connections:
+            connections.all.return_value = [broken, recovered]
+            discard_broken_connections()
+        broken.close.assert_called_once_with()
+        recovered.close.assert_not_called()
+        self.assertFalse(recovered.errors_occurred)
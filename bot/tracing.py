@@ -0,0 +1,289 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from threading import Thread, Lock
+from urllib.parse import urlparse
+from django.conf import settings
+from telegram.request import HTTPXRequest
+from . import metrics
+import requests
+import logging
+import hmac
+import random
+import queue
+import time
+import json
+import os
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRACE_BATCH_SIZE = 512
+
+TRACE_FLUSH_INTERVAL = 2.0  # seconds
+
+TRACE_QUEUE_SIZE = 10000
+
+# The span the current task or thread is in; UNSAMPLED inside a trace that was not sampled
+current_span = ContextVar('current_span', default=None)
+
+UNSAMPLED = object()
+
+# Internal callers send TRACE_TRUSTED_TOKEN in this header to have their sampling decision kept
+TRUSTED_TOKEN_HEADER = 'X-Trace-Token'
+
+
+class Span:
+    """One timed operation of a trace; finished spans are exported in OTLP JSON form."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self):
+        """W3C trace context header value, for calls that should join this trace."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [
+                {'key': key, 'value': {'stringValue': str(value)}} for key, value in self.attributes.items()
+            ],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+
+
+class NoopSpan:
+    """Stands in for a span that is not recorded, so callers never check for sampling."""
+
+    __slots__ = ()
+
+    traceparent = None
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class SpanExporter:
+    """Batches finished spans on a background thread and writes them out as OTLP/JSON.
+
+    Without TRACE_OTLP_ENDPOINT every batch is appended as one line to TRACE_FILE,
+    the same layout an OTLP collector's file exporter produces.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self.lock = Lock()
+        self._pid = None
+
+    def export(self, span):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            metrics.increment('tracing.dropped')
+
+    def _start(self):
+        with self.lock:
+            # Threads don't survive fork(), a pre-forked worker starts its own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                Thread(target=self._run, name="span-exporter", daemon=True).start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + TRACE_FLUSH_INTERVAL
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+                metrics.increment('tracing.exported', len(batch))
+            except Exception as e:
+                metrics.increment('tracing.dropped', len(batch))
+                logger.warning("Could not export %s spans: %s", len(batch), e)
+
+    def write(self, spans):
+        payload = json.dumps({'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': settings.TRACE_SERVICE_NAME}},
+                {'key': 'process.pid', 'value': {'stringValue': str(os.getpid())}},
+            ]},
+            'scopeSpans': [{'scope': {'name': 'bot.tracing'}, 'spans': [span.to_otlp() for span in spans]}],
+        }]}, separators=(',', ':'))
+
+        if settings.TRACE_OTLP_ENDPOINT:
+            requests.post(
+                settings.TRACE_OTLP_ENDPOINT, data=payload, timeout=5,
+                headers={'Content-Type': 'application/json'},
+            ).raise_for_status()
+        else:
+            os.makedirs(os.path.dirname(settings.TRACE_FILE) or '.', exist_ok=True)
+            with open(settings.TRACE_FILE, 'a', encoding='utf-8') as destination:
+                destination.write(payload + '\n')
+
+
+exporter = SpanExporter()
+
+
+def parse_traceparent(value):
+    """(trace_id, parent span id, sampled) from a W3C traceparent header, or None."""
+    try:
+        version, trace_id, parent_id, flags = value.split('-')
+        int(trace_id, 16), int(parent_id, 16)
+    except (AttributeError, ValueError):
+        return None
+    if len(trace_id) != 32 or len(parent_id) != 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+@contextmanager
+def trace(name, traceparent=None, trust_sampled=False, **attributes):
+    """Start a trace for one update or request, sampled up front with TRACE_SAMPLE_RATE.
+
+    A traceparent header continues the caller's trace. Its sampling decision is only
+    taken over with trust_sampled, otherwise anyone could have every request recorded.
+    """
+    parent = parse_traceparent(traceparent) if traceparent else None
+    trace_id, parent_id, sampled = parent or (None, None, False)
+    if not (parent and trust_sampled):
+        sampled = random.random() < settings.TRACE_SAMPLE_RATE
+
+    if not sampled:
+        token = current_span.set(UNSAMPLED)
+        try:
+            yield NOOP_SPAN
+        finally:
+            current_span.reset(token)
+        return
+
+    with _record(Span(name, trace_id or os.urandom(16).hex(), parent_id, attributes)) as span:
+        yield span
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a step of the current trace; does nothing outside a sampled trace."""
+    parent = current_span.get()
+    if parent is None or parent is UNSAMPLED:
+        yield NOOP_SPAN
+        return
+
+    with _record(Span(name, parent.trace_id, parent.span_id, attributes)) as child:
+        yield child
+
+
+@contextmanager
+def _record(new_span):
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        new_span.end = time.time_ns()
+        current_span.reset(token)
+        exporter.export(new_span)
+
+
+def trusts_trace_context(request):
+    """Whether a request may decide its own sampling: it carries TRACE_TRUSTED_TOKEN."""
+    token = settings.TRACE_TRUSTED_TOKEN
+    if not token:
+        return False
+    return hmac.compare_digest(request.headers.get(TRUSTED_TOKEN_HEADER, '').encode('utf-8'), token.encode('utf-8'))
+
+
+def trace_sql(execute, sql, params, many, context):
+    """connection.execute_wrappers hook: one span per query inside sampled traces."""
+    with span('db.query', statement=sql[:500], alias=context['connection'].alias, many=many):
+        return execute(sql, params, many, context)
+
+
+def install_db_tracing(sender, connection, **kwargs):
+    """connection_created receiver; the wrapper stays for the life of the connection."""
+    if trace_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_sql)
+
+
+class TracedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that records every Bot API call as a span."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        # Only the API method name, the URL path contains the bot token
+        with span(f"telegram.{urlparse(url).path.rsplit('/', 1)[-1]}", http_method=method) as api_span:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            api_span.set(status_code=code)
+            return code, payload
+
+
+class TracingMiddleware:
+    """Wraps every Django request in a trace, named after the view once it is resolved.
+
+    Works in both modes, so under ASGI async views are not pushed onto a thread by it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with trace(
+            f"http {request.method}",
+            traceparent=request.headers.get('traceparent'),
+            trust_sampled=trusts_trace_context(request),
+        ) as root:
+            request.trace_span = root
+            response = self.get_response(request)
+            root.set(status_code=response.status_code)
+            return response
+
+    async def __acall__(self, request):
+        with trace(
+            f"http {request.method}",
+            traceparent=request.headers.get('traceparent'),
+            trust_sampled=trusts_trace_context(request),
+        ) as root:
+            request.trace_span = root
+            response = await self.get_response(request)
+            root.set(status_code=response.status_code)
+            return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        root = getattr(request, 'trace_span', NOOP_SPAN)
+        if root is not NOOP_SPAN:
+            root.name = f"http {request.method} {getattr(view_func, '__name__', 'view')}"
+        return None
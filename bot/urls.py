@@ -6,4 +6,6 @@ urlpatterns = [
     path(settings.TELEGRAM_WEBHOOK_PATH, views.telegram_webhook, name="webhook"),
     path('create-deposit/<int:telegram_id>/<int:amount>/<str:bank_code>/<str:token>/', views.create_deposit_view, name="create_deposit"),
     path('create-withdraw/<int:telegram_id>/<str:currency>/<int:amount>/<str:address>/<int:network_id>/<str:token>/', views.create_withdrawal_view, name="create_withdraw"),
+    path('exports/<str:kind>.<str:fmt>', views.export_transactions_view, name="export_transactions"),
+    path('metrics/', views.metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .metrics import record_cache
+
+# Per-user entries: the stored balance, the rendered recent-history message and the
+# payment details of the latest deposit
+USER_CACHE_KINDS = ('balance', 'history', 'payment')
+
+
+def user_key(kind, user_id):
+    return f"user:{user_id}:{kind}"
+
+
+def get_or_load(kind, user_id, load):
+    """Return the cached value for a user, calling load() and caching its result on a miss."""
+    key = user_key(kind, user_id)
+    value = cache.get(key)
+    record_cache(kind, value is not None)
+    if value is None:
+        value = load()
+        cache.set(key, value, timeout=settings.USER_CACHE_TTL)
+    return value
+
+
+def store(kind, user_id, value):
+    """Cache a value computed elsewhere, e.g. right after the write that produced it."""
+    cache.set(user_key(kind, user_id), value, timeout=settings.USER_CACHE_TTL)
+
+
+def invalidate_user(user_id, kinds=USER_CACHE_KINDS):
+    """Drop cached entries once the current transaction commits, so readers can't re-cache old rows."""
+    keys = [user_key(kind, user_id) for kind in kinds]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_users(user_ids, kinds=USER_CACHE_KINDS):
+    """invalidate_user() for many users at once, for bulk updates that bypass model signals."""
+    keys = [user_key(kind, user_id) for user_id in set(user_ids) for kind in kinds]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
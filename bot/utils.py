@@ -1,16 +1,18 @@
-from asgiref.sync import sync_to_async
 from bot.models import TelegramUser, ActionToken
 from uuid import uuid4
 from django.utils.timezone import now
 from datetime import timedelta
 from bot.models import ActionToken
+from .user_cache import get_or_load
+from .db_router import read_replica
+from .db import db_sync_to_async
 import logging  
 
-loggger = logging.getLogger(__name__)
+logger = logging.getLogger(__name__)
 
-@sync_to_async
+@db_sync_to_async
 def create_or_update_user(user_id, username, first_name, last_name):
-    """Async wrapper for database operations"""
+    """Async wrapper for database operations, run on the bot's DB pool"""
     try:
         telegram_user, created = TelegramUser.objects.get_or_create(
             telegram_id=user_id,
@@ -20,28 +22,32 @@ def create_or_update_user(user_id, username, first_name, last_name):
                 'last_name': last_name
             }
         )
-        if not created:
+        if not created and (telegram_user.username, telegram_user.first_name, telegram_user.last_name) != (username, first_name, last_name):
             telegram_user.username = username
             telegram_user.first_name = first_name
             telegram_user.last_name = last_name
-            telegram_user.save()
+            # Only the profile fields, a full save would write back a balance read before this update
+            telegram_user.save(update_fields=['username', 'first_name', 'last_name', 'updated_at'])
         return telegram_user
     except Exception as e:
-        logger.error(f"Database error in create_or_update_user: {str(e)}", exc_info=True)
+        logger.error("Database error in create_or_update_user: %s", e, exc_info=True)
         raise
 
 
-@sync_to_async
+@db_sync_to_async
 def get_user_balance(telegram_user):
-    """Async wrapper for getting user balance"""
+    """Async wrapper for getting user balance, cached until the balance changes"""
     try:
-        telegram_user.refresh_from_db()
-        return telegram_user.balance
+        with read_replica(telegram_user.telegram_id):
+            return get_or_load(
+                'balance', telegram_user.pk,
+                lambda: TelegramUser.objects.values_list('balance', flat=True).get(pk=telegram_user.pk)
+            )
     except Exception as e:
-        logger.error(f"Error getting user balance: {str(e)}", exc_info=True)
+        logger.error("Error getting user balance: %s", e, exc_info=True)
         raise
 
-@sync_to_async
+@db_sync_to_async
 def generate_action_token(user, action, expiration_minutes=5):
     """
     Generate a one-time token for a specific action (withdrawal or deposit).
@@ -71,4 +77,13 @@ def is_tokenValid(token, action):
             return True
         return False
     except ActionToken.DoesNotExist:
-        return False
\ No newline at end of file
+        return False
+
+
+async def ais_tokenValid(token, action):
+    """is_tokenValid() for async views."""
+    try:
+        action_token = await ActionToken.objects.aget(token=token, action=action)
+        return action_token.is_valid()
+    except ActionToken.DoesNotExist:
+        return False
@@ -0,0 +1,153 @@
+from collections import namedtuple
+from functools import lru_cache
+import hashlib
+import re
+
+# Result of checking one address; reason is None when the address is valid
+AddressCheck = namedtuple('AddressCheck', ['address', 'valid', 'reason'])
+
+
+# Keccak-256 as used by Ethereum. hashlib.sha3_256 uses different padding and
+# gives other digests, so the permutation is implemented here.
+_KECCAK_ROUND_CONSTANTS = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+_KECCAK_ROTATIONS = [
+    [0, 36, 3, 41, 18], [1, 44, 10, 45, 2], [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56], [27, 20, 39, 8, 14],
+]
+_MASK = (1 << 64) - 1
+
+
+def _rotl(value, shift):
+    return ((value << shift) | (value >> (64 - shift))) & _MASK if shift else value
+
+
+def _keccak_f(state):
+    for round_constant in _KECCAK_ROUND_CONSTANTS:
+        c = [state[x][0] ^ state[x][1] ^ state[x][2] ^ state[x][3] ^ state[x][4] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rotl(c[(x + 1) % 5], 1) for x in range(5)]
+        state = [[state[x][y] ^ d[x] for y in range(5)] for x in range(5)]
+        b = [[0] * 5 for _ in range(5)]
+        for x in range(5):
+            for y in range(5):
+                b[y][(2 * x + 3 * y) % 5] = _rotl(state[x][y], _KECCAK_ROTATIONS[x][y])
+        state = [[b[x][y] ^ (~b[(x + 1) % 5][y] & b[(x + 2) % 5][y]) for y in range(5)] for x in range(5)]
+        state[0][0] ^= round_constant
+    return state
+
+
+def keccak256(data):
+    """Keccak-256 digest of bytes."""
+    rate = 136
+    padded = bytearray(data) + b'\x01'
+    padded += b'\x00' * (-len(padded) % rate)
+    padded[-1] |= 0x80
+
+    state = [[0] * 5 for _ in range(5)]
+    for offset in range(0, len(padded), rate):
+        block = padded[offset:offset + rate]
+        for i in range(rate // 8):
+            x, y = i % 5, i // 5
+            state[x][y] ^= int.from_bytes(block[i * 8:i * 8 + 8], 'little')
+        state = _keccak_f(state)
+
+    return b''.join(state[i % 5][i // 5].to_bytes(8, 'little') for i in range(4))
+
+
+class EVMAddressValidator:
+    """0x-prefixed 20-byte addresses (ERC-20, BEP-20, ...) with EIP-55 checksum verification."""
+
+    pattern = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+    def __call__(self, address):
+        if not self.pattern.match(address):
+            return "must be 0x followed by 40 hex characters"
+
+        body = address[2:]
+        # All-lowercase and all-uppercase addresses carry no checksum
+        if body == body.lower() or body == body.upper():
+            return None
+        if address != to_checksum_address(address):
+            return "checksum mismatch, please copy the address again"
+        return None
+
+
+class TronAddressValidator:
+    """Base58Check TRON addresses (TRC-20): 'T' followed by 33 characters, 0x41 prefix byte."""
+
+    alphabet = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+    pattern = re.compile(r'^T[1-9A-HJ-NP-Za-km-z]{33}$')
+
+    def __call__(self, address):
+        if not self.pattern.match(address):
+            return "must start with T and be 34 base58 characters"
+
+        number = 0
+        for char in address:
+            number = number * 58 + self.alphabet.index(char)
+        raw = number.to_bytes(25, 'big')
+        payload, checksum = raw[:-4], raw[-4:]
+        if payload[0] != 0x41:
+            return "not a TRON mainnet address"
+        if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+            return "checksum mismatch, please copy the address again"
+        return None
+
+
+def to_checksum_address(address):
+    """EIP-55 mixed-case form of an EVM address."""
+    body = address[2:].lower()
+    digest = keccak256(body.encode('ascii')).hex()
+    return '0x' + ''.join(
+        char.upper() if int(digest[i], 16) >= 8 else char
+        for i, char in enumerate(body)
+    )
+
+
+# Validator factories keyed by network name
+VALIDATORS = {
+    'BEP20': EVMAddressValidator,
+    'ERC20': EVMAddressValidator,
+    'TRC20': TronAddressValidator,
+}
+
+
+def register_validator(network, factory):
+    """Register the validator factory of a network."""
+    VALIDATORS[network.upper()] = factory
+    get_validator.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_validator(network):
+    """Compiled validator of a network, built once per process."""
+    try:
+        return VALIDATORS[network.upper()]()
+    except KeyError:
+        raise ValueError(f"No address validator registered for network {network}")
+
+
+def check_address(network, address):
+    """Validate one address for a network without any I/O."""
+    address = (address or '').strip()
+    if not address:
+        return AddressCheck(address, False, "address is empty")
+    reason = get_validator(network)(address)
+    return AddressCheck(address, reason is None, reason)
+
+
+def check_addresses(network, addresses):
+    """Validate a batch of addresses for one network."""
+    validator = get_validator(network)
+    results = []
+    for address in addresses:
+        address = (address or '').strip()
+        reason = validator(address) if address else "address is empty"
+        results.append(AddressCheck(address, reason is None, reason))
+    return results
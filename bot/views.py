@@ -1,23 +1,44 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Bot, BotCommand, MenuButtonDefault
-from .keyboards import get_main_menu, get_deposit_menu, get_withdrawal_menu
+from .keyboards import get_main_menu, get_deposit_menu, get_withdrawal_menu, get_history_menu, get_payment_details_menu
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 from django.shortcuts import render, redirect, reverse
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
 from asgiref.sync import sync_to_async
-from telegram.request import HTTPXRequest
-from .mobee_utils import createFiatDeposit, createCryptoWithdrawal
+from .deposits import acreate_deposit, deposit_link, get_payment_details
+from .withdrawals import acreate_withdrawal, InsufficientBalance
 from django.conf import settings
-from bot.models import TelegramUser, ActionToken, DepositRequest, WithdrawalRequest
-from .utils import create_or_update_user, get_user_balance, generate_action_token, is_tokenValid
+from bot.models import TelegramUser, DepositRequest
+from .utils import create_or_update_user, get_user_balance, generate_action_token, ais_tokenValid
+from .dedup import is_duplicate_update, forget_update, claim_action_token, release_action_token
+from .sharding import get_shard_router
+from .ingress import check_webhook, SECRET_HEADER
+from .decoding import RawUpdate
+from .validators import check_address
+from .catalog import catalog
+from .exports import export_rows, encode_rows, gzip_chunks, batch_chunks, aiter_chunks
+from .rollups import summarize
+from .history import send_history_document, get_recent_history
+from . import metrics
+from .tracing import trace, span, TracedHTTPXRequest
+from .screens import edit_screen, format_edit_savings
+from .db_router import reading_from, reporting_database
+from .db import db_sync_to_async
+from .conversations import conversations, format_conversations, DEPOSIT_AMOUNT, WITHDRAWAL_AMOUNT, WITHDRAWAL_ADDRESS
+from .resilience import MobeeUnavailable, mobee_available, resilience_stats, format_breakers
+from .mobee_models import MobeeResponseError
 import json
-from django.db import transaction
-from threading import Lock
+from django.utils import timezone
+from datetime import timedelta
+from threading import Lock, Thread
 from urllib.parse import quote
 from functools import wraps
-import requests
 import logging
 import asyncio
+import math
+import time
 import sys
 
 
@@ -28,11 +49,6 @@ if sys.platform == 'win32':
 # Configure logging
 logger = logging.getLogger(__name__)
 
-IDR_DEPOSIT_MIN_AMOUNT = 50000
-USDT_WITHDRAWAL_MIN_AMOUNT = 2.5
-IDR_BANK_CODE = "BNI"
-BEP20_NETWORK_ID = 12
-NETWORK_FEE = 1.5
 
 # Configure request parameters with more generous timeouts
 request_kwargs = {
@@ -46,89 +62,136 @@ request_kwargs = {
 # Initialize bot with custom connection pool settings
 bot = Bot(
     token=settings.TELEGRAM_BOT_TOKEN,
-    get_updates_request=HTTPXRequest(**request_kwargs),
-    request=HTTPXRequest(**request_kwargs)
+    base_url=settings.TELEGRAM_API_BASE_URL,
+    get_updates_request=TracedHTTPXRequest(**request_kwargs),
+    request=TracedHTTPXRequest(**request_kwargs)
 )
 
-# Global variable to hold the Application instance (initialized lazily)
+# Global variable to hold the Application instance (built by warm_up or on first use)
 application = None
 
-application_lock = Lock()
+# An asyncio.Lock, made by the first caller on the loop that initializes the bot. A
+# threading lock held across the awaits below would block that loop for a second caller
+application_lock = None
+
+# Every coroutine that touches the bot runs on this loop so pooled connections
+# are never shared across event loops
+bot_loop = None
+
+bot_loop_lock = Lock()
+
+
+def get_bot_loop():
+    """Return the process-wide bot event loop, starting its thread on first use."""
+    global bot_loop
+    with bot_loop_lock:
+        if bot_loop is None:
+            bot_loop = asyncio.new_event_loop()
+            Thread(target=bot_loop.run_forever, name="telegram-bot-loop", daemon=True).start()
+    return bot_loop
+
+
+def run_on_bot_loop(coro, timeout=None):
+    """Run a coroutine on the bot loop from synchronous code and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_bot_loop()).result(timeout)
+
+
+def build_application():
+    """Build the Application and register handlers. No network calls are made here."""
+    app = Application.builder().bot(bot).build()
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("balance", handle_balance))
+    app.add_handler(CommandHandler("deposit", handle_deposit))
+    app.add_handler(CommandHandler("withdrawal", handle_withdrawal))
+    app.add_handler(CommandHandler("support", handle_support))
+    app.add_handler(CommandHandler("history", handle_history))
+    app.add_handler(CommandHandler("main_menu", handle_main_menu))
+    app.add_handler(CommandHandler("stats", handle_stats))
+    app.add_handler(CallbackQueryHandler(handle_callback))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_amount_input))
+    return app
+
 
 async def initialize_application():
-    global application
-    with application_lock:
+    global application, application_lock
+    if application is not None:
+        return application
+    if application_lock is None:
+        application_lock = asyncio.Lock()
+    async with application_lock:
         if application is None:
             logger.info("Initializing Telegram Application")
-            application = Application.builder().bot(bot).build()
-            application.add_handler(CommandHandler("start", start))
-            application.add_handler(CommandHandler("balance", handle_balance))
-            application.add_handler(CommandHandler("deposit", handle_deposit))
-            application.add_handler(CommandHandler("withdrawal", handle_withdrawal))
-            application.add_handler(CommandHandler("support", handle_support))
-            application.add_handler(CommandHandler("history", handle_history))
-            application.add_handler(CommandHandler("main_menu", handle_main_menu))  
-            application.add_handler(CallbackQueryHandler(handle_callback))
-            application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_amount_input))
-            await application.initialize()
-            await set_main_menu_buttons()
+            app = build_application()
+            await app.initialize()
+            # Background work handed to application.create_task expects a running application
+            await app.start()
+            # Bot commands and the menu button are configured once per deployment
+            # by `manage.py setup_webhook`, not on every process start
+            application = app
             logger.info("Telegram Application initialized")
     return application
 
 
-def async_handler(func):
-    @wraps(func)
-    def wrapped(request, *args, **kwargs):
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+def warm_up():
+    """Eagerly initialize the Application and its connection pools at process start."""
+    # Load the Mobee catalog alongside, menus serve the defaults until it arrives
+    catalog.refresh_in_background()
+    try:
+        run_on_bot_loop(initialize_application(), timeout=60)
+    except Exception as e:
+        # The first webhook will retry the initialization lazily
+        logger.error("Error warming up Telegram Application: %s", e, exc_info=True)
 
-        try:
-            return loop.run_until_complete(func(request, *args, **kwargs))
-        except Exception as e:
-            logger.error(f"Error in async handler: {str(e)}", exc_info=True)
-            return HttpResponse("Internal Server Error", status=500)
+
+def webhook_front_door(view):
+    """Turn away requests that cannot be Telegram's before their body is read or the bot loop is involved."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        rejection = check_webhook(request.method, request.headers.get(SECRET_HEADER), request.META.get('CONTENT_LENGTH'))
+        if rejection is not None:
+            return HttpResponse(rejection.reason, status=rejection.status)
+        return view(request, *args, **kwargs)
     return wrapped
 
 
-async def set_main_menu_buttons():
+BOT_COMMANDS = [
+    BotCommand("start", "Start the bot"),
+    BotCommand("balance", "Check your balance"),
+    BotCommand("deposit", "Deposit funds"),
+    BotCommand("withdrawal", "Withdraw funds"),
+    BotCommand("history", "View transaction history"),
+    BotCommand("support", "Get support"),
+]
+
+
+async def set_main_menu_buttons(target_bot=None):
     """Set the main menu buttons for the bot."""
+    target_bot = target_bot or bot
     try:
-        # Define the bot commands
-        commands = [
-            BotCommand("start", "Start the bot"),
-            BotCommand("balance", "Check your balance"),
-            BotCommand("deposit", "Deposit funds"),
-            BotCommand("withdrawal", "Withdraw funds"),
-            BotCommand("history", "View transaction history"),
-            BotCommand("support", "Get support"),
-        ]
-
         # Set the bot commands
-        await bot.set_my_commands(commands)
+        await target_bot.set_my_commands(BOT_COMMANDS)
 
         # Set the menu button to default (main menu commands)
-        await bot.set_chat_menu_button(menu_button=MenuButtonDefault())
+        await target_bot.set_chat_menu_button(menu_button=MenuButtonDefault())
 
         logger.info("Main menu buttons configured successfully.")
     except Exception as e:
-        logger.error(f"Error setting main menu buttons: {str(e)}", exc_info=True)
+        logger.error("Error setting main menu buttons: %s", e, exc_info=True)
 
 
 async def register_user(update: Update):
     """Register or update user."""
     try:
         user = update.effective_user
-        return await create_or_update_user(
-            user.id,
-            user.username,
-            user.first_name,
-            user.last_name
-        )
+        with span('register_user', telegram_id=user.id):
+            return await create_or_update_user(
+                user.id,
+                user.username,
+                user.first_name,
+                user.last_name
+            )
     except Exception as e:
-        logger.error(f"Error in register_user: {str(e)}", exc_info=True)
+        logger.error("Error in register_user: %s", e, exc_info=True)
         raise
 
 
@@ -136,7 +199,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command."""
     try:
         telegram_user = await register_user(update)
-        logger.info(f"User started bot: {telegram_user.telegram_id}")
+        logger.info("User started bot: %s", telegram_user.telegram_id)
 
         welcome_text = (
             f"🌟 *Welcome to Mobee Exchange Trading Bot!* 🌟\n\n"
@@ -158,7 +221,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=get_main_menu()
         )
     except Exception as e:
-        logger.error(f"Error in start command: {str(e)}", exc_info=True)
+        logger.error("Error in start command: %s", e, exc_info=True)
         await update.message.reply_text(
             "Sorry, there was an error. Please try again later.",
             parse_mode='Markdown'
@@ -171,19 +234,9 @@ async def handle_amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         telegram_user = await register_user(update)
         user_input = update.message.text.strip()
 
-        # Check if the user is entering a wallet address
-        if context.user_data.get('awaiting_wallet_address'):
-            await handle_wallet_address(update, context)
-            return
-
-        # Clear the awaiting_wallet_address flag if set
-        context.user_data.pop('awaiting_wallet_address', None)
-        
-        # Retrieve deposit or withdrawal method
-        deposit_method = context.user_data.get('deposit_method')
-        withdrawal_method = context.user_data.get('withdrawal_method')
-
-        if not deposit_method and not withdrawal_method:
+        # The step the user is at decides what the text answers
+        conversation = conversations.get(telegram_user.telegram_id)
+        if conversation is None:
             await update.message.reply_text(
                 "⚠️ Session expired. Invalid Input",
                 parse_mode='Markdown',
@@ -191,13 +244,15 @@ async def handle_amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return
 
-        if deposit_method:
-            await process_deposit(update, context, user_input, deposit_method)
-        elif withdrawal_method:
-            await process_withdrawal(update, context, user_input, withdrawal_method)
+        if conversation.state == WITHDRAWAL_ADDRESS:
+            await handle_wallet_address(update, context, conversation)
+        elif conversation.state == DEPOSIT_AMOUNT:
+            await process_deposit(update, context, user_input, conversation.data['method'])
+        elif conversation.state == WITHDRAWAL_AMOUNT:
+            await process_withdrawal(update, context, user_input, conversation.data['method'])
 
     except Exception as e:
-        logger.error(f"Error in handle_amount_input: {str(e)}", exc_info=True)
+        logger.error("Error in handle_amount_input: %s", e, exc_info=True)
         await update.message.reply_text(
             "Sorry, there was an error processing your request. Please try again.",
             parse_mode='Markdown',
@@ -207,13 +262,26 @@ async def handle_amount_input(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def process_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE, amount_text: str, deposit_method: str):
     """Process deposit logic."""
     telegram_user = await register_user(update)
-    if deposit_method == "IDR":
+    # Limits and the bank come from the Mobee catalog, read from memory
+    option = catalog.deposit_option(deposit_method)
+    if option is None:
+        conversations.end(telegram_user.telegram_id)
+        await update.message.reply_text(
+            "⚠️ This deposit method is no longer available. Please choose another one.",
+            parse_mode='Markdown',
+            reply_markup=get_deposit_menu()
+        )
+        return
+    if not mobee_available('deposit'):
+        await update.message.reply_text(unavailable_text('deposit'), reply_markup=get_deposit_menu())
+        return
+    if option:
         try:
             amount = int(amount_text)
-            if amount < IDR_DEPOSIT_MIN_AMOUNT:
+            if amount < option.min_amount:
                 # raise ValueError("Amount must be greater than or equal to 10,000")
                 await update.message.reply_text(
-                    f"⚠️ The minimum deposit amount is {IDR_DEPOSIT_MIN_AMOUNT} IDR.",
+                    f"⚠️ The minimum deposit amount is {option.min_amount:g} {option.currency}.",
                     parse_mode='Markdown',
                     reply_markup=get_deposit_menu()
                 )
@@ -230,42 +298,75 @@ async def process_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE, am
         # Genrate a one-time token for deposit
         token = await generate_action_token(telegram_user, action='deposit')
 
-        # Generate a link for for the user to complete deposit
-        deposit_link = f"{settings.YOUR_DOMAIN}/create-deposit/{telegram_user.telegram_id}/{amount}/{IDR_BANK_CODE}/{token}/"
-        
-        text = (
-            f"✅ *Fiat Deposit Initiated*\n\n"
-            "⚠️ *Important:*\n"
-            "1. Click the 'Complete Deposit' button below to initiate your deposit.\n"
-            "2. After being redirected back, click the 'View Payment Details' button to see your payment details."
+        progress = await update.message.reply_text(
+            "⏳ *Creating your deposit account...*\n\nYour payment details will appear here in a moment.",
+            parse_mode='Markdown'
+        )
+        # The account is created right away, the details replace the message above when Mobee answers
+        context.application.create_task(
+            prepare_deposit(progress, telegram_user.telegram_id, amount, option.bank_code, token),
+            update=update,
         )
 
-        # await update.message.reply_text(text, parse_mode='Markdown')
+    conversations.end(telegram_user.telegram_id)
 
-        # Add a button for "View Payment Details"
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("Generate Account details", url=deposit_link)],
-            # [InlineKeyboardButton("View Payment Details", callback_data="view_payment_details")],
-        ])
-        
-        await update.message.reply_text(
-            text,
-            parse_mode='Markdown',
-            reply_markup=reply_markup
+async def prepare_deposit(progress, telegram_id, amount, bank_code, token):
+    """Create the Mobee deposit in the background and push its payment details into the progress message."""
+    # The same token also backs the fallback link, only one of them may create the deposit
+    if not await db_sync_to_async(claim_action_token)(token):
+        return
+    try:
+        deposit, text = await acreate_deposit(telegram_id, amount, bank_code, token, to_async=db_sync_to_async)
+        await progress.edit_text(text, parse_mode='Markdown', reply_markup=get_payment_details_menu())
+    except MobeeUnavailable as e:
+        await db_sync_to_async(release_action_token)(token)
+        await progress.edit_text(unavailable_text('deposit', e.retry_after), reply_markup=get_deposit_menu())
+    except Exception as e:
+        logger.error("Error creating deposit for %s: %s", telegram_id, e, exc_info=True)
+        await db_sync_to_async(release_action_token)(token)
+        # The link retries with the same token, so Mobee replays the order if it was created after all
+        await progress.edit_text(
+            "⚠️ We couldn't create your deposit account just now. Tap below to try again.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Generate Account details", url=deposit_link(telegram_id, amount, bank_code, token))],
+            ])
         )
 
-    context.user_data.pop('deposit_method', None)
 
 async def process_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE, amount_text: str, withdrawal_method: str):
     """Process withdrawal logic."""
     telegram_user = await register_user(update)
-    if withdrawal_method == "USDT":
-       
-        amount = float(amount_text)
-        if amount < USDT_WITHDRAWAL_MIN_AMOUNT:
+    # Limits and the live network fee come from the Mobee catalog, read from memory
+    option = catalog.withdrawal_option(withdrawal_method)
+    if option is None:
+        conversations.end(telegram_user.telegram_id)
+        await update.message.reply_text(
+            "⚠️ This withdrawal method is no longer available. Please choose another one.",
+            parse_mode='Markdown',
+            reply_markup=get_withdrawal_menu()
+        )
+        return
+    if not mobee_available('withdrawal'):
+        await update.message.reply_text(unavailable_text('withdrawal'), reply_markup=get_withdrawal_menu())
+        return
+    if option:
+        try:
+            amount = float(amount_text)
+            # float() also takes "nan" and "inf", which every comparison below would let through
+            if not math.isfinite(amount) or amount <= 0:
+                raise ValueError(amount_text)
+        except ValueError:
+            await update.message.reply_text(
+                "⚠️ Please enter a valid positive number",
+                parse_mode='Markdown',
+                reply_markup=get_withdrawal_menu()
+            )
+            return
+
+        if amount < option.min_amount:
             # raise ValueError("Amount must be greater than or equal to 10,000")
             await update.message.reply_text(
-                f"⚠️ The minimum withdrawal amount is {USDT_WITHDRAWAL_MIN_AMOUNT} USDT.",
+                f"⚠️ The minimum withdrawal amount is {option.min_amount:g} {option.currency}.",
                 parse_mode='Markdown',
                 reply_markup=get_deposit_menu()
             )
@@ -274,29 +375,29 @@ async def process_withdrawal(update: Update, context: ContextTypes.DEFAULT_TYPE,
         # Check if the user has sufficient balance (including network fee)
         if telegram_user.balance < amount:
             await update.message.reply_text(
-                f"⚠️ Insufficient balance for withdrawal. Remember, the network fee is ${NETWORK_FEE:.2f}.",
+                f"⚠️ Insufficient balance for withdrawal. Remember, the network fee is ${option.fee:.2f}.",
                 parse_mode='Markdown',
                 reply_markup=get_withdrawal_menu()
             )
             return
 
-        # Store the withdrawal amount in context and prompt for wallet address
-        context.user_data['withdrawal_amount'] = amount - NETWORK_FEE
-        context.user_data['withdrawal_method'] = withdrawal_method
+        # Remember the withdrawal amount and prompt for wallet address
+        conversations.enter(
+            telegram_user.telegram_id, WITHDRAWAL_ADDRESS, method=withdrawal_method, amount=amount - option.fee
+        )
 
         await update.message.reply_text(
-            f"💳 *Enter Your USDT Wallet Address*\n\n"
-            f"⚠️ Please provide a valid wallet address. The withdrawal will use the *BEP-20 network*.\n"
-            f"💰 *Network Fee:* ${NETWORK_FEE:.2f}\n\n"
+            f"💳 *Enter Your {option.currency} Wallet Address*\n\n"
+            f"⚠️ Please provide a valid wallet address. The withdrawal will use the *{option.network} network*.\n"
+            f"💰 *Network Fee:* ${option.fee:.2f}\n\n"
             "Type your wallet address below:",
             parse_mode='Markdown'
         )
-        context.user_data['awaiting_wallet_address'] = True
 
-async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TYPE, conversation=None):
     """Handle and validate the user's wallet address input."""
     # Check if the user is expected to input a wallet address
-    if not context.user_data.get('awaiting_wallet_address'):
+    if conversation is None or conversation.state != WITHDRAWAL_ADDRESS:
         await update.message.reply_text(
             "⚠️ Unexpected input. Please follow the instructions to proceed.",
             parse_mode='Markdown'
@@ -304,25 +405,36 @@ async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     wallet_address = update.message.text.strip()
+    option = catalog.withdrawal_option(conversation.data['method'])
+    if option is None:
+        conversations.end(update.effective_user.id)
+        await update.message.reply_text(
+            "⚠️ This withdrawal method is no longer available. Please choose another one.",
+            parse_mode='Markdown',
+            reply_markup=get_withdrawal_menu()
+        )
+        return
 
-    # Basic validation for wallet address
-    if not wallet_address or len(wallet_address) < 10:  # Example length check
+    # Reject malformed addresses before any token, DB write or Mobee call
+    address_check = check_address(option.network, wallet_address)
+    if not address_check.valid:
         await update.message.reply_text(
-            "⚠️ Invalid wallet address. Please enter a valid BEP-20 wallet address.",
+            f"⚠️ Invalid wallet address: {address_check.reason}.\n\n"
+            f"Please enter a valid {option.network} wallet address.",
             parse_mode='Markdown'
         )
         return
+    wallet_address = address_check.address
 
-    # Store the wallet address and proceed with withdrawal
-    context.user_data['wallet_address'] = wallet_address
-    context.user_data.pop('awaiting_wallet_address', None)  # Clear the flag
+    # The flow ends here, the link carries everything the withdrawal needs
+    conversations.end(update.effective_user.id)
 
     # Retrieve withdrawal details
     telegram_user = await register_user(update)  # Ensure the user is registered
     telegram_id = telegram_user.telegram_id
-    amount = int(float(context.user_data.get('withdrawal_amount', 0)))  # Convert to integer
-    currency = context.user_data.get('withdrawal_method', '')
-    network_id = BEP20_NETWORK_ID
+    amount = int(float(conversation.data['amount']))  # Convert to integer
+    currency = option.currency
+    network_id = option.network_id
 
     # URL-encode the wallet address
     encoded_wallet_address = quote(wallet_address)
@@ -411,57 +523,66 @@ async def handle_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the 'history' callback."""
     
     telegram_user = await register_user(update)
-    text = "📜 *Transaction History*\n\n"
-    # Fetch the last 5 deposit requests for the user
-    last_deposits = await sync_to_async(
-        lambda: list(DepositRequest.objects.filter(user=telegram_user).order_by('-created_at')[:5])
-    )()
-
-    # Fetch the last 5 withdrawal requests for the user
-    last_withdrawals = await sync_to_async(
-        lambda: list(WithdrawalRequest.objects.filter(user=telegram_user).order_by('-created_at')[:5])
-    )()
-
-    # Format the deposit history
-    deposit_history = "\n".join([
-        f"• Amount: {deposit.amount}, Status: {deposit.status}, Date: {deposit.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
-        for deposit in last_deposits
-    ]) or "No deposit history available."
-
-    # Format the withdrawal history
-    withdrawal_history = "\n".join([
-        f"• Amount: {withdrawal.amount}, Status: {withdrawal.status}, Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
-        for withdrawal in last_withdrawals
-    ]) or "No withdrawal history available."
-
-    # Combine the histories into a single message
-    text += (
-        f"📥 *Last 5 Deposits:*\n{deposit_history}\n\n"
-        f"📤 *Last 5 Withdrawals:*\n{withdrawal_history}"
-    )
+    text = await db_sync_to_async(get_recent_history)(telegram_user.pk, telegram_user.telegram_id)
 
     # Send the history message
     await update.message.reply_text(
         text,
         parse_mode='Markdown',
-        reply_markup=get_main_menu()
+        reply_markup=get_history_menu()
     )
 
 
+def format_volume(buckets):
+    """Render rollup buckets as one line each."""
+    lines = []
+    for bucket in buckets:
+        line = f"• {bucket['kind'].title()} {bucket['currency']} {bucket['status']}: {bucket['count']} / {bucket['amount']:,.2f}"
+        if bucket['converted_amount']:
+            line += f" (→ {bucket['converted_amount']:,.2f} USDT)"
+        if bucket['fee']:
+            line += f", fees {bucket['fee']:,.2f}"
+        lines.append(line)
+    return "\n".join(lines) or "No activity."
+
+
+async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the operator-only /stats command from the daily volume rollup."""
+    if update.effective_user.id not in settings.BOT_OPERATOR_IDS:
+        return
+
+    today = timezone.localdate()
+    # Reporting reads, a few seconds of replica lag don't matter here
+    with reading_from(reporting_database()):
+        today_buckets = await db_sync_to_async(summarize)(today)
+        week_buckets = await db_sync_to_async(summarize)(today - timedelta(days=6))
+
+    text = (
+        f"📈 *Volume Today ({today})*\n{format_volume(today_buckets)}\n\n"
+        f"📅 *Last 7 Days*\n{format_volume(week_buckets)}\n\n"
+        f"🗄 *Cache (this worker)*\n{metrics.format_hit_rates()}\n\n"
+        f"🔌 *Mobee circuits (this worker)*\n{format_breakers()}\n\n"
+        f"✏️ *Screen edits (this worker)*\n{format_edit_savings()}\n\n"
+        f"💬 *Conversations (this worker)*\n{format_conversations()}"
+    )
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle callback queries from inline keyboard."""
     query = update.callback_query
     
     try:
         await query.answer()
-        logger.info(f"Processing callback: {query.data}")
+        logger.info("Processing callback: %s", query.data)
 
         telegram_user = await register_user(update)
 
         if query.data == "balance":
             balance = await get_user_balance(telegram_user)
             text = f"💰 *Your Current Balance*\n\nAvailable: ${balance:.2f} USDT"
-            await query.message.edit_text(
+            await edit_screen(
+                query,
                 text,
                 parse_mode='Markdown',
                 reply_markup=get_main_menu()
@@ -469,7 +590,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         elif query.data == "deposit":
             text = "📥 *Deposit Methods*\n\nChoose your preferred deposit method:"
-            await query.message.edit_text(
+            await edit_screen(
+                query,
                 text,
                 parse_mode='Markdown',
                 reply_markup=get_deposit_menu()
@@ -477,14 +599,16 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         elif query.data == "withdrawal":
             text = "📤 *Withdraw Methods*\n\nChoose your preferred withdrawal method:"
-            await query.message.edit_text(
+            await edit_screen(
+                query,
                 text,
                 parse_mode='Markdown',
                 reply_markup=get_withdrawal_menu()
             )
 
         elif query.data == "main_menu":
-            await query.message.edit_text(
+            await edit_screen(
+                query,
                 "Main Menu",
                 parse_mode='Markdown',
                 reply_markup=get_main_menu()
@@ -492,16 +616,18 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         elif query.data.startswith('deposit_'):
             currency = query.data.split('_')[1]
-            context.user_data['deposit_method'] = currency
-            await query.message.edit_text(
+            conversations.enter(telegram_user.telegram_id, DEPOSIT_AMOUNT, method=currency)
+            await edit_screen(
+                query,
                 f"💸 *Enter Deposit Amount*\n\nPlease type the amount you want to deposit in {currency}:",
                 parse_mode='Markdown'
             )
 
         elif query.data.startswith('withdraw_'):
             coin = query.data.split('_')[1]
-            context.user_data['withdrawal_method'] = coin
-            await query.message.edit_text(
+            conversations.enter(telegram_user.telegram_id, WITHDRAWAL_AMOUNT, method=coin)
+            await edit_screen(
+                query,
                 f"💸 *Enter Withdrawal Amount*\n\nPlease type the amount you want to withdraw in {coin}:",
                 parse_mode='Markdown'
             )
@@ -517,7 +643,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Our team typically responds within 24 hours."
             )
             keyboard = [[InlineKeyboardButton("Contact Support", url=f"https://t.me/+sdwvApKiS39jZjI0")]]
-            await query.message.edit_text(
+            await edit_screen(
+                query,
                 text,
                 parse_mode='Markdown',
                 reply_markup=InlineKeyboardMarkup(keyboard)
@@ -527,88 +654,62 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             telegram_user = await register_user(update)
             try:
                 # Fetch the latest deposit request for the user
-                deposit_request = await sync_to_async(
-                    lambda: DepositRequest.objects.filter(user=telegram_user).latest('created_at')
-                )()
-                # Display the payment details
-                text = (
-                    f"✅ *Payment Details:*\n\n"
-                    f"• Amount: {deposit_request.amount}\n"
-                    f"• Bank: {deposit_request.bank_code}\n"
-                    f"• Account Name: `{deposit_request.account_name}`\n"  # Make account name copiable
-                    f"• Account Number: `{deposit_request.account_number}`\n"  # Make account number copiable
-                    f"• Expiry: {deposit_request.expired_at}\n\n"
-                    "Please make the payment before the expiry time."
-                )
-                reply_markup = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Main Menu", callback_data="main_menu")]
-                ])
-                await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+                # Cached when the deposit was created, no query on the common path
+                text = await db_sync_to_async(get_payment_details)(telegram_user.pk, telegram_user.telegram_id)
+                await edit_screen(query, text, parse_mode='Markdown', reply_markup=get_payment_details_menu())
 
             except DepositRequest.DoesNotExist:
                 # Handle the case where the deposit instance is not found
-                await query.edit_message_text(
+                await edit_screen(
+                    query,
                     "⚠️ No payment details found. Please make sure you clicked the deposit link first.",
                     parse_mode='Markdown'
                 )
             except Exception as e:
                 # Handle any other exceptions
-                await query.edit_message_text(
+                await edit_screen(
+                    query,
                     f"⚠️ An error occurred: {str(e)}",
                     parse_mode='Markdown'
                 )
 
         elif query.data == "history":
             try:
-                # Fetch the last 5 deposit requests for the user
-                last_deposits = await sync_to_async(
-                    lambda: list(DepositRequest.objects.filter(user=telegram_user).order_by('-created_at')[:5])
-                )()
-
-                # Fetch the last 5 withdrawal requests for the user
-                last_withdrawals = await sync_to_async(
-                    lambda: list(WithdrawalRequest.objects.filter(user=telegram_user).order_by('-created_at')[:5])
-                )()
-
-                # Format the deposit history
-                deposit_history = "\n".join([
-                    f"• Amount: {deposit.amount}, Status: {deposit.status}, Date: {deposit.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
-                    for deposit in last_deposits
-                ]) or "No deposit history available."
-
-                # Format the withdrawal history
-                withdrawal_history = "\n".join([
-                    f"• Amount: {withdrawal.amount}, Status: {withdrawal.status}, Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
-                    for withdrawal in last_withdrawals
-                ]) or "No withdrawal history available."
-
-                # Combine the histories into a single message
-                text = (
-                    f"📜 *Transaction History*\n\n"
-                    f"📥 *Last 5 Deposits:*\n{deposit_history}\n\n"
-                    f"📤 *Last 5 Withdrawals:*\n{withdrawal_history}"
-                )
+                text = await db_sync_to_async(get_recent_history)(telegram_user.pk, telegram_user.telegram_id)
 
                 # Send the history message
-                await query.message.edit_text(
+                await edit_screen(
+                    query,
                     text,
                     parse_mode='Markdown',
-                    reply_markup=get_main_menu()
+                    reply_markup=get_history_menu()
                 )
 
             except Exception as e:
-                logger.error(f"Error fetching transaction history: {str(e)}", exc_info=True)
-                await query.message.edit_text(
+                logger.error("Error fetching transaction history: %s", e, exc_info=True)
+                await edit_screen(
+                    query,
                     "⚠️ An error occurred while fetching your transaction history. Please try again later.",
                     parse_mode='Markdown',
                     reply_markup=get_main_menu()
                 )
+
+        elif query.data == "history_export":
+            await query.message.reply_text(
+                "⏳ Preparing your full history, the file will arrive here shortly."
+            )
+            # Generating and uploading can take a while, don't hold up the update
+            context.application.create_task(
+                send_history_document(context.bot, query.message.chat_id, telegram_user),
+                update=update,
+            )
         
 
     except Exception as e:
-        logger.error(f"Error in callback handler: {str(e)}", exc_info=True)
+        logger.error("Error in callback handler: %s", e, exc_info=True)
         try:
-            await query.message.edit_text(
+            await edit_screen(
+                query,
                 "Sorry, an error occurred. Please try again.",
                 parse_mode='Markdown',
                 reply_markup=get_main_menu()
@@ -617,204 +718,291 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
         
 
+async def process_raw_update(raw_update):
+    """Build the full Update from a RawUpdate and run it through the Application."""
+    update = raw_update.to_update(bot)
+
+    # Initialize application if not already done
+    await initialize_application()
+
+    with span('telegram.update', update_id=update.update_id, kind=raw_update.kind):
+        async with asyncio.timeout(30):
+            await application.process_update(update)
+
+
+def handle_sharded_update(body):
+    """Shard worker entry point for one update forwarded by the ingress."""
+    # A new trace per update, the ingress' trace ends at the forward
+    with trace('shard.update'):
+        run_on_bot_loop(process_raw_update(RawUpdate(body)))
+
+
 @csrf_exempt
-@async_handler
-async def telegram_webhook(request):
-    if request.method != 'POST':
-        return HttpResponse('Only POST requests are allowed', status=405)
-    
+@webhook_front_door
+def telegram_webhook(request):
+    # Reading the body and claiming the update_id both block (the dedup cache is Redis once
+    # several workers run), so they happen on this request thread; only the update's
+    # handlers run on the bot loop, which serves every chat
+    update_id = None
     try:
         logger.info("Received webhook request")
-        update_data = json.loads(request.body.decode('utf-8'))
-        update = Update.de_json(update_data, bot)
-        
-        # Initialize application if not already done
-        await initialize_application()
-        
-        async with asyncio.timeout(30):
-            await application.process_update(update)
-            
+        # Routing keys come straight from the raw bytes, the Update object is built last
+        raw_update = RawUpdate(request.body)
+
+        # Drop redelivered updates before any parsing or DB work
+        update_id = raw_update.update_id
+        if update_id is None:
+            # Every update has one, whatever else this is it is not worth building an Update from
+            metrics.increment('webhook.rejected.shape')
+            return HttpResponse('Not a Telegram update', status=400)
+        if is_duplicate_update(update_id):
+            logger.info("Dropping duplicate update: %s", update_id)
+            update_id = None
+            return HttpResponse('OK')
+
+        # In sharded mode the worker owning this chat processes the update
+        router = get_shard_router()
+        if router is not None:
+            with span('shard.forward', update_id=update_id):
+                handled = router.forward(raw_update.chat_id, raw_update.body)
+            if not handled:
+                raise RuntimeError(f"Shard worker failed to handle update {update_id}")
+            return HttpResponse('OK')
+
+        run_on_bot_loop(process_raw_update(raw_update))
         return HttpResponse('OK')
     except asyncio.TimeoutError:
         logger.error("Request timed out")
+        forget_update(update_id)
         return HttpResponse('Request timed out', status=504)
     except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in webhook request: {str(e)}")
+        logger.error("Invalid JSON in webhook request: %s", e)
+        # The update_id was peeked from the raw bytes and claimed before the body was parsed
+        forget_update(update_id)
         return HttpResponse('Invalid JSON', status=400)
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}", exc_info=True)
+        logger.error("Error processing webhook: %s", e, exc_info=True)
+        forget_update(update_id)
         return HttpResponse('Internal Server Error', status=500)
 
 
-def create_deposit_view(request, telegram_id, amount, bank_code, token):
+def unavailable_text(operation, retry_after=None):
+    minutes = max(1, round((retry_after or 60) / 60))
+    return (
+        f"⏳ {operation.capitalize()}s are temporarily unavailable while our payment provider recovers.\n\n"
+        f"Please try again in about {minutes} minute{'s' if minutes > 1 else ''}. No funds were moved."
+    )
+
+
+async def send_from_view(chat_id, text, **kwargs):
+    """Send a message with the shared bot from an async view, whose event loop is not the bot loop."""
+    async def send():
+        await initialize_application()
+        return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+    with span('telegram.send_message'):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(send(), get_bot_loop()))
+
+
+async def notify_unavailable(telegram_id, error, callback_data):
+    """Tell the user right away that Mobee refused the call, instead of letting the link hang."""
+    await send_from_view(
+        telegram_id,
+        unavailable_text(error.operation, error.retry_after),
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("Try again", callback_data=callback_data),
+            InlineKeyboardButton("Main menu", callback_data="main_menu")],
+        ])
+    )
+
+
+async def create_deposit_view(request, telegram_id, amount, bank_code, token):
     """Handle fiat deposit creation."""
-    used = is_tokenValid(token, action='deposit')
     bot_redirect_url = f"https://t.me/{settings.TELEGRAM_BOT_USERNAME}"
-    if used:
-        bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-        async def send_message():
-            await bot.send_message(
-                chat_id=telegram_id,
-                text=(
-                    "Invalid token. Please try again."
-                ),
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Deposit", callback_data="deposit")],
-                ])
-            )
+    # A repeated click on the same link is already being handled, skip the DB entirely
+    if not await sync_to_async(claim_action_token)(token):
+        return redirect(bot_redirect_url)
 
-        # Run the coroutine
-        asyncio.run(send_message())
+    used = await ais_tokenValid(token, action='deposit')
+    if used:
+        await send_from_view(
+            telegram_id,
+            "Invalid token. Please try again.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Deposit", callback_data="deposit")],
+            ])
+        )
         return redirect(bot_redirect_url)
   
     try:
-        with transaction.atomic():
-            # Get the user from the database
-            user = TelegramUser.objects.select_for_update().get(telegram_id=telegram_id)
-            # Call the createFiatDeposit function
-            response_data = createFiatDeposit(amount=amount, bank_code=bank_code)
-            
-            # Save the deposit request in the database
-            DepositRequest.objects.create(
-                user=user,
-                deposit_id=response_data['data']['id'],
-                transaction_id=response_data['data']['transaction_id'],
-                amount=response_data['data']['amount'],
-                account_name=response_data['data']['account_name'],
-                account_number=response_data['data']['account_number'],
-                bank_code=response_data['data']['bank_code'],
-                expired_at=response_data['data']['expired_at'],
-                status="pending"
-            )
+        deposit, text = await acreate_deposit(telegram_id, amount, bank_code, token)
 
-            # mark token as used
-            action_token = ActionToken.objects.get(token=token)
-            action_token.is_used = True
-            action_token.save()
-
-            # Notify the bot to send a message with the "View Payment Details" button
-            bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-            async def send_message():
-                await bot.send_message(
-                    chat_id=telegram_id,
-                    text=(
-                        "✅ Your deposit account has been successfully created!\n\n"
-                        "Click the 'View Payment Details' button below to see your payment details."
-                    ),
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("View Payment Details", callback_data="view_payment_details")],
-                    ])
-                )
+        # Push the payment details straight into the chat
+        await send_from_view(telegram_id, text, parse_mode='Markdown', reply_markup=get_payment_details_menu())
+        return redirect(bot_redirect_url)
 
-            # Run the coroutine
-            asyncio.run(send_message())
-            
-            
-            return redirect(bot_redirect_url)
-        
+    except MobeeUnavailable as e:
+        # The link stays usable, the user can click it again once Mobee recovers
+        await sync_to_async(release_action_token)(token)
+        await notify_unavailable(telegram_id, e, "deposit")
+        return redirect(bot_redirect_url)
+    except MobeeResponseError:
+        # Logged with its details by the Mobee client
+        await sync_to_async(release_action_token)(token)
+        return HttpResponse("Unexpected response from the payment provider", status=502)
     except TelegramUser.DoesNotExist:
+        await sync_to_async(release_action_token)(token)
         return HttpResponse("User not found", status=404)
     except Exception as e:
+        await sync_to_async(release_action_token)(token)
         return HttpResponse(f"Error: {str(e)}", status=500)
 
 
-def create_withdrawal_view(request, telegram_id, currency, amount, address, network_id, token):
+async def create_withdrawal_view(request, telegram_id, currency, amount, address, network_id, token):
+    """Handle crypto withdrawal creation."""
     bot_redirect_url = f"https://t.me/{settings.TELEGRAM_BOT_USERNAME}"
-    used = is_tokenValid(token, action='withdrawal')
-    if used:
-        bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-        async def send_message():
-            await bot.send_message(
-                chat_id=telegram_id,
-                text=(
-                    "Invalid token. Please try again."
-                ),
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Withdraw", callback_data="withdraw")],
-                ])
-            )
+    # Never touch the DB or call Mobee for an address that cannot be valid
+    network = catalog.network_for_id(network_id)
+    if network is None or not check_address(network, address).valid:
+        return HttpResponse("Invalid wallet address", status=400)
+
+    # Withdrawals are charged the live network fee of their currency
+    option = catalog.withdrawal_option(currency)
+    if option is None:
+        return HttpResponse("Unsupported currency", status=400)
+    # The fee and address check above only hold on the currency's own network
+    if network_id != option.network_id:
+        return HttpResponse("Unsupported network", status=400)
+    network_fee = option.fee
+
+    # A repeated click on the same link is already being handled, skip the DB entirely
+    if not await sync_to_async(claim_action_token)(token):
+        return redirect(bot_redirect_url)
 
-        # Run the coroutine
-        asyncio.run(send_message())
+    used = await ais_tokenValid(token, action='withdrawal')
+    if used:
+        await send_from_view(
+            telegram_id,
+            "Invalid token. Please try again.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Withdraw", callback_data="withdraw")],
+            ])
+        )
         return redirect(bot_redirect_url)
-    
-    # Validate the toke
-    """Handle crypto withdrawal creation."""
+
     try:
-        # start atomic transaction
-        with transaction.atomic():
-            # Get the user from the database
-            user = TelegramUser.objects.select_for_update().get(telegram_id=telegram_id)
-            
-            # Check if the user has sufficient balance (including network fee)
-            total_withdrawal_amount = float(amount) + NETWORK_FEE
-            if user.balance < total_withdrawal_amount:
-                # Notify the user via the bot about insufficient balance
-                bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-                async def send_insufficient_balance_message():
-                    await bot.send_message(
-                        chat_id=telegram_id,
-                        text=(
-                            f"⚠️ Insufficient balance.\n\n"
-                            f"Your current balance is {user.balance:.2f}, but the withdrawal requires "
-                            f"{total_withdrawal_amount:.2f} (including network fee).\n\n"
-                            f"Please deposit more funds to proceed with the withdrawal."
-                        ),
-                        reply_markup=InlineKeyboardMarkup([
-                            [InlineKeyboardButton("Deposit", callback_data="deposit"),
-                            InlineKeyboardButton("Main menu", callback_data="main_menu")],
-                        ])
-                    )
-                asyncio.run(send_insufficient_balance_message())
-
-                bot_redirect_url = f"https://t.me/{settings.TELEGRAM_BOT_USERNAME}"
-
-            # Call the createCryptoWithdrawal function
-            response_data = createCryptoWithdrawal(currency, amount, address, network_id)
-            
-            # Save the withdrawal request in the database
-            WithdrawalRequest.objects.create(
-                user=user,
-                transaction_id=response_data['data']['id'],
-                currency=response_data['data']['currency'],
-                amount=response_data['data']['amount'],
-                fee=response_data['data']['fee'],
-                address=response_data['data']['address'],
-                network_name=response_data['data']['network_name'],
-                explorer_url=response_data['data']['explorer_url']
-            )
+        await acreate_withdrawal(telegram_id, currency, amount, address, network_id, network_fee, token)
+
+        # Notify the bot to send a message with the "View Withdrawal Details" button
+        await send_from_view(
+            telegram_id,
+            (
+                "✅ Your withdrawal request has been successfully created!\n\n"
+                "Click the 'History' button below to see withdrawal status and details."
+            ),
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("View Withdrawal Details", callback_data="history")],
+            ])
+        )
 
-            # mark token as used
-            action_token = ActionToken.objects.get(token=token)
-            action_token.is_used = True
-            action_token.save()
-
-            # Update the user's balance
-            user.balance -= amount + NETWORK_FEE
-            user.save()
-
-            # Notify the bot to send a message with the "View Payment Details" button
-            bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-            async def send_message():
-                await bot.send_message(
-                    chat_id=telegram_id,
-                    text=(
-                        "✅ Your withdrawal request has been successfully created!\n\n"
-                        "Click the 'History' button below to see withdrawal status and details."
-                    ),
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("View Withdrawal Details", callback_data="history")],
-                    ])
-                )
+        # Redirect the user back to the bot with a success message
+        return redirect(bot_redirect_url)
 
-            # Run the coroutine
-            asyncio.run(send_message())
-            
-            # Redirect the user back to the bot with a success message
-            
-            return redirect(bot_redirect_url)
-    
+    except InsufficientBalance as e:
+        # Nothing was moved, the link can be used again after a deposit
+        await sync_to_async(release_action_token)(token)
+        await send_from_view(
+            telegram_id,
+            (
+                f"⚠️ Insufficient balance.\n\n"
+                f"Your current balance is {e.balance:.2f}, but the withdrawal requires "
+                f"{e.required:.2f} (including network fee).\n\n"
+                f"Please deposit more funds to proceed with the withdrawal."
+            ),
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("Deposit", callback_data="deposit"),
+                InlineKeyboardButton("Main menu", callback_data="main_menu")],
+            ])
+        )
+        return redirect(bot_redirect_url)
+    except MobeeUnavailable as e:
+        await sync_to_async(release_action_token)(token)
+        await notify_unavailable(telegram_id, e, "withdraw")
+        return redirect(bot_redirect_url)
+    except MobeeResponseError as e:
+        # The token is used up: Mobee may have created the withdrawal, a retry must not repeat it
+        logger.error("Withdrawal for %s needs reconciling: %s", telegram_id, e)
+        await send_from_view(
+            telegram_id,
+            (
+                "⚠️ We couldn't confirm your withdrawal with our payment provider.\n\n"
+                "The amount stays reserved while we check it; please contact support if it "
+                "does not show up in your history."
+            ),
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("📞 Customer Support", callback_data="support")],
+            ])
+        )
+        return HttpResponse("Unexpected response from the payment provider", status=502)
     except TelegramUser.DoesNotExist:
+        await sync_to_async(release_action_token)(token)
         return HttpResponse("User not found", status=404)
     except Exception as e:
-        return HttpResponse(f"Error: {str(e)}", status=500)
\ No newline at end of file
+        await sync_to_async(release_action_token)(token)
+        return HttpResponse(f"Error: {str(e)}", status=500)
+
+
+@staff_member_required
+def export_transactions_view(request, kind, fmt):
+    """Admin-only streaming export of deposits or withdrawals as CSV or JSON Lines."""
+    if kind not in ('deposits', 'withdrawals') or fmt not in ('csv', 'jsonl'):
+        return HttpResponse("Unknown export", status=404)
+
+    try:
+        rows = export_rows(
+            kind,
+            since=request.GET.get('since'),
+            until=request.GET.get('until'),
+            status=request.GET.get('status'),
+            telegram_id=request.GET.get('user'),
+            using=reporting_database(),
+        )
+        # Fail on bad filters now, before the response has started streaming
+        header = next(rows)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    def all_rows():
+        yield header
+        yield from rows
+
+    chunks = encode_rows(all_rows(), fmt)
+    filename = f"{kind}.{fmt}"
+    if request.GET.get('gzip'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        chunks = batch_chunks(chunks)
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def metrics_view(request):
+    """Admin-only counters, cache hit rates, Mobee circuit states and open conversations of the worker that serves the request."""
+    return JsonResponse({
+        **resilience_stats(),
+        'conversations': conversations.stats(),
+        'uptime': round(time.time() - metrics.started_at),
+        'counters': metrics.snapshot(),
+        'cache_hit_rates': {
+            name: {'hits': hits, 'misses': misses, 'rate': round(rate, 4)}
+            for name, (hits, misses, rate) in metrics.hit_rates().items()
+        },
+    })
@@ -0,0 +1,69 @@
+from django.db import transaction
+from asgiref.sync import sync_to_async
+from .models import TelegramUser, ActionToken, WithdrawalRequest
+from .mobee_utils import acreateCryptoWithdrawal
+from .mobee_models import MobeeResponseError
+from .dedup import mobee_idempotency_key
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class InsufficientBalance(Exception):
+    """The user's balance does not cover a withdrawal and its network fee."""
+
+    def __init__(self, balance, required):
+        super().__init__(f"Balance {balance:.2f} is below the required {required:.2f}")
+        self.balance = balance
+        self.required = required
+
+
+def reserve_balance(telegram_id, total):
+    """Take total off the user's balance under a row lock held only for this update."""
+    with transaction.atomic():
+        user = TelegramUser.objects.select_for_update().get(telegram_id=telegram_id)
+        if user.balance < total:
+            raise InsufficientBalance(user.balance, total)
+        user.balance -= total
+        user.save()
+    return user
+
+
+def refund_balance(telegram_id, total):
+    """Give back a reservation whose Mobee withdrawal was not created."""
+    with transaction.atomic():
+        user = TelegramUser.objects.select_for_update().get(telegram_id=telegram_id)
+        user.balance += total
+        user.save()
+
+
+async def acreate_withdrawal(telegram_id, currency, amount, address, network_id, network_fee, token):
+    """Create the Mobee withdrawal for a withdrawal action token and record it.
+
+    The amount and network fee are reserved first and refunded if Mobee fails, so
+    no row lock is held while Mobee answers. Raises InsufficientBalance when the
+    balance does not cover them, and MobeeResponseError when Mobee's answer cannot
+    be recorded.
+    """
+    total = float(amount) + network_fee
+    user = await sync_to_async(reserve_balance)(telegram_id, total)
+    try:
+        order = await acreateCryptoWithdrawal(
+            currency, amount, address, network_id,
+            idempotency_key=mobee_idempotency_key('withdrawal', token)
+        )
+    except MobeeResponseError:
+        # Mobee took the request, the order may exist: the reservation stays until reconciled,
+        # and the token is used up so the link cannot reserve and replay the order again
+        await ActionToken.objects.filter(token=token).aupdate(is_used=True)
+        raise
+    except Exception:
+        await sync_to_async(refund_balance)(telegram_id, total)
+        raise
+
+    withdrawal = await WithdrawalRequest.objects.acreate(user=user, **order.model_kwargs())
+
+    # mark token as used; the withdrawal's signals already kept the user's reads on the primary
+    await ActionToken.objects.filter(token=token).aupdate(is_used=True)
+    return withdrawal
@@ -13,4 +13,57 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mobeeXchange.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings
+from bot.ingress import check_webhook, SECRET_HEADER
+
+WEBHOOK_PATH = '/' + settings.TELEGRAM_WEBHOOK_PATH.lstrip('/')
+
+
+def header(scope, name):
+    name = name.lower().encode('latin-1')
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def webhook_front_door(scope, send):
+    """Check a webhook request's headers before Django reads the whole body into memory.
+
+    Returns True when the request was answered here.
+    """
+    rejection = check_webhook(scope['method'], header(scope, SECRET_HEADER), header(scope, 'Content-Length'))
+    if rejection is None:
+        return False
+    body = rejection.reason.encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': rejection.status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+    return True
+
+
+async def application(scope, receive, send):
+    """Serve Django and warm up the Telegram bot on the ASGI lifespan startup event."""
+    if scope['type'] == 'http' and scope['path'] == WEBHOOK_PATH:
+        if await webhook_front_door(scope, send):
+            return
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    from asgiref.sync import sync_to_async
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if settings.TELEGRAM_EAGER_WARMUP:
+                from bot.views import warm_up
+                await sync_to_async(warm_up, thread_sensitive=False)()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 import os
 import environ
 import pytz
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bot.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +94,35 @@ DATABASES = {
     }
 }
 
+# Optional read replica for menu, history and reporting reads, e.g. sqlite:////path/to/replica.sqlite3
+# kept in sync by `manage.py replicate_sqlite`. A user's reads stay on the primary for
+# REPLICA_STICKY_SECONDS after they write, so keep it above the replication lag
+REPLICA_DATABASE_URL = env("REPLICA_DATABASE_URL", default=None)
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = env.db_url_config(REPLICA_DATABASE_URL)
+    # Tests read their own writes from the test database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+REPLICA_STICKY_SECONDS = env.int("REPLICA_STICKY_SECONDS", default=10)
+
+DATABASE_ROUTERS = ['bot.db_router.ReplicaRouter']
+
+# Threads, and so connections per database, running the bot handlers' ORM work in each worker
+BOT_DB_THREADS = env.int("BOT_DB_THREADS", default=8)
+
+
+# Cache
+# Holds the user cache and its invalidations, update dedup, action token claims and replica
+# stickiness, which every worker must see. locmem is per process, so with several workers
+# (WEB_CONCURRENCY, or shard workers) use e.g. redis://... or filecache:///path; see the check below
+# https://django-environ.readthedocs.io/en/latest/types.html#environ-env-cache-url
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Worker processes of the ASGI/WSGI server; uvicorn and gunicorn read the same variable
+WEB_CONCURRENCY = env.int("WEB_CONCURRENCY", default=1)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -134,12 +165,84 @@ YOUR_DOMAIN = env("YOUR_DOMAIN")
 # Mobee Credentials
 MOBEE_API_KEY = env("MOBEE_API_KEY")
 MOBEE_API_SECRET = env("MOBEE_API_SECRET")
+MOBEE_API_BASE_URL = env("MOBEE_API_BASE_URL", default="https://open-api.mobee.io")
+
+# A hung Mobee call gives up after these many seconds (connect, each read, whole response)
+MOBEE_CONNECT_TIMEOUT = env.float("MOBEE_CONNECT_TIMEOUT", default=5.0)
+MOBEE_READ_TIMEOUT = env.float("MOBEE_READ_TIMEOUT", default=15.0)
+MOBEE_TOTAL_TIMEOUT = env.float("MOBEE_TOTAL_TIMEOUT", default=20.0)
+
+# Per-endpoint circuit breakers: open when the error or slow-call share of the last calls
+# reaches its threshold, then let a few trial calls through after the open period
+MOBEE_BREAKER_WINDOW = env.int("MOBEE_BREAKER_WINDOW", default=20)  # calls
+MOBEE_BREAKER_MIN_CALLS = env.int("MOBEE_BREAKER_MIN_CALLS", default=10)
+MOBEE_BREAKER_ERROR_RATE = env.float("MOBEE_BREAKER_ERROR_RATE", default=0.5)
+MOBEE_BREAKER_SLOW_SECONDS = env.float("MOBEE_BREAKER_SLOW_SECONDS", default=8.0)
+MOBEE_BREAKER_SLOW_RATE = env.float("MOBEE_BREAKER_SLOW_RATE", default=0.8)
+MOBEE_BREAKER_OPEN_SECONDS = env.float("MOBEE_BREAKER_OPEN_SECONDS", default=30.0)
+MOBEE_BREAKER_HALF_OPEN_CALLS = env.int("MOBEE_BREAKER_HALF_OPEN_CALLS", default=3)
+
+# Concurrent Mobee calls per operation in each worker, and how long a call waits for a slot
+MOBEE_BULKHEADS = env.dict("MOBEE_BULKHEADS", default={"deposit": "4", "withdrawal": "2"})  # e.g. deposit=4,withdrawal=2
+MOBEE_BULKHEAD_WAIT = env.float("MOBEE_BULKHEAD_WAIT", default=0.5)  # seconds
+
+# Currencies, networks, fees and limits are reloaded from Mobee in the background after this
+MOBEE_CATALOG_TTL = env.int("MOBEE_CATALOG_TTL", default=300)  # seconds
 
 # Telegram Bot Token
 TELEGRAM_BOT_USERNAME = env("TELEGRAM_BOT_USERNAME")
 TELEGRAM_BOT_TOKEN = env("TELEGRAM_BOT_TOKEN")
 TELEGRAM_WEBHOOK_URL = env("TELEGRAM_WEBHOOK_URL")
 TELEGRAM_WEBHOOK_PATH = env("TELEGRAM_WEBHOOK_PATH")
+# Sent by Telegram with every update once `manage.py setup_webhook` registered it; updates
+# without it are refused before their body is read. 1-256 of A-Z, a-z, 0-9, _ and -
+TELEGRAM_WEBHOOK_SECRET = env("TELEGRAM_WEBHOOK_SECRET", default=None)
+# Larger webhook bodies are refused up front; real updates are a few KiB
+TELEGRAM_WEBHOOK_MAX_BYTES = env.int("TELEGRAM_WEBHOOK_MAX_BYTES", default=256 * 1024)
+# Bot API endpoint; point it at a local Bot API server or a test double
+TELEGRAM_API_BASE_URL = env("TELEGRAM_API_BASE_URL", default="https://api.telegram.org/bot")
+
+# Telegram ids allowed to use operator commands such as /stats
+BOT_OPERATOR_IDS = env.list("BOT_OPERATOR_IDS", cast=int, default=[])
+
+# Redelivered updates and repeated action links are dropped within this window
+TELEGRAM_UPDATE_DEDUP_SIZE = env.int("TELEGRAM_UPDATE_DEDUP_SIZE", default=4096)
+TELEGRAM_UPDATE_DEDUP_TTL = env.int("TELEGRAM_UPDATE_DEDUP_TTL", default=3600)  # seconds
+
+# Messages whose last rendered screen is remembered, so an identical re-render skips the edit
+TELEGRAM_SCREEN_CACHE_SIZE = env.int("TELEGRAM_SCREEN_CACHE_SIZE", default=10000)
+
+# Multi-step flows (amount, then wallet address) are dropped after this long idle in a step,
+# and the least recently used ones once their estimated memory passes the budget
+CONVERSATION_TIMEOUTS = env.dict("CONVERSATION_TIMEOUTS", default={
+    "deposit_amount": "900", "withdrawal_amount": "900", "withdrawal_address": "600",
+})  # seconds per step
+CONVERSATION_MEMORY_BUDGET = env.int("CONVERSATION_MEMORY_BUDGET", default=4 * 1024 * 1024)  # bytes per worker
+# Expired conversations are swept, and per-worker stats written to BOT_RUNTIME_DIR, this often
+CONVERSATION_SWEEP_INTERVAL = env.int("CONVERSATION_SWEEP_INTERVAL", default=30)  # seconds
+
+# Cached balances and rendered history are invalidated on change, this only bounds staleness
+USER_CACHE_TTL = env.int("USER_CACHE_TTL", default=3600)  # seconds
+
+# Initialize the Telegram Application when the worker starts instead of on the first update
+TELEGRAM_EAGER_WARMUP = env.bool("TELEGRAM_EAGER_WARMUP", default=True)
+
+# Scale-out mode: updates are hashed by chat to this many `run_shard_workers` processes (0 disables)
+TELEGRAM_SHARD_WORKERS = env.int("TELEGRAM_SHARD_WORKERS", default=0)
+TELEGRAM_SHARD_BASE_PORT = env.int("TELEGRAM_SHARD_BASE_PORT", default=47000)  # Windows only
+
+# Local sockets and per-worker runtime files
+BOT_RUNTIME_DIR = env("BOT_RUNTIME_DIR", default=str(BASE_DIR / "run"))
+
+# Span tracing of updates and requests: the share of traces recorded, and where spans go.
+# Without an OTLP/HTTP endpoint (e.g. http://localhost:4318/v1/traces) they are appended to TRACE_FILE
+TRACE_SAMPLE_RATE = env.float("TRACE_SAMPLE_RATE", default=0.01)
+TRACE_FILE = env("TRACE_FILE", default=str(Path(BOT_RUNTIME_DIR) / "traces.jsonl"))
+TRACE_OTLP_ENDPOINT = env("TRACE_OTLP_ENDPOINT", default=None)
+TRACE_SERVICE_NAME = env("TRACE_SERVICE_NAME", default="mobee-bot")
+# Requests that send this in X-Trace-Token keep the sampling decision of their traceparent
+# header; any other request is sampled with TRACE_SAMPLE_RATE
+TRACE_TRUSTED_TOKEN = env("TRACE_TRUSTED_TOKEN", default=None)
 
 
 
@@ -150,22 +253,38 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10240
 TIMEOUT = 60
 
+# Logging: JSON lines written by a background thread to a size-rotated file.
+# Secrets are masked before records are queued; chatty INFO loggers can be sampled
+LOG_LEVEL = env("LOG_LEVEL", default="INFO")
+LOG_FILE = env("LOG_FILE", default=str(BASE_DIR / "debug.log"))
+LOG_MAX_BYTES = env.int("LOG_MAX_BYTES", default=10 * 1024 * 1024)
+LOG_BACKUP_COUNT = env.int("LOG_BACKUP_COUNT", default=5)
+LOG_SAMPLE_RATES = env.dict("LOG_SAMPLE_RATES", default={"httpx": "0.1"})  # e.g. httpx=0.1,bot.views=0.5
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sample': {
+            '()': 'bot.logging_utils.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
+        'redact': {
+            '()': 'bot.logging_utils.RedactingFilter',
+        },
+    },
     'handlers': {
         'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
+            '()': 'bot.logging_utils.QueueLogHandler',
+            'filename': LOG_FILE,
+            'max_bytes': LOG_MAX_BYTES,
+            'backup_count': LOG_BACKUP_COUNT,
+            'filters': ['sample', 'redact'],
         },
     },
-    'loggers': {
-        'mobee': {
-            'handlers': ['file'],
-            'level': 'INFO',
-            'propagate': True,
-        },
+    'root': {
+        'handlers': ['file'],
+        'level': LOG_LEVEL,
     },
 }
 
@@ -173,3 +292,16 @@ LOGGING = {
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# A per-process cache would let each worker keep stale balances and payment details after
+# another one wrote, and miss redelivered updates and reused action tokens
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+if (WEB_CONCURRENCY > 1 or TELEGRAM_SHARD_WORKERS) and CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+    raise ImproperlyConfigured(
+        "Several worker processes need a shared cache: set CACHE_URL to e.g. redis://... or "
+        "filecache:///path (WEB_CONCURRENCY=%s, TELEGRAM_SHARD_WORKERS=%s)" % (WEB_CONCURRENCY, TELEGRAM_SHARD_WORKERS)
+    )
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mobeeXchange.settings')
 
 application = get_wsgi_application()
+
+# WSGI has no lifespan events, so warm up the Telegram bot as the worker loads
+from django.conf import settings
+
+if settings.TELEGRAM_EAGER_WARMUP:
+    from bot.views import warm_up
+    warm_up()